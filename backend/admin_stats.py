@@ -0,0 +1,70 @@
+"""
+Plan aggregates for the 28Hub Connect admin panel.
+
+The admin dashboard needs tenant counts per plan and the MRR derived from
+them. Both come from one GROUP BY plan query whose result is kept as a
+snapshot for ADMIN_SUMMARY_TTL seconds, so refreshing the panel does not
+load tenants at all. Registrations and plan changes (admin or Stripe)
+invalidate the snapshot on the worker that made them; other workers catch
+up when their snapshot expires.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from models import Tenant
+
+ADMIN_SUMMARY_TTL = float(os.getenv("ADMIN_SUMMARY_TTL", "30"))
+
+# Monthly price per plan, in BRL
+PLAN_PRICES = {"trial": 0, "basic": 47, "pro": 97, "enterprise": 497}
+
+
+def plan_counts(db: Session) -> Dict[str, int]:
+    """Number of tenants per plan"""
+    rows = db.execute(select(Tenant.plan, func.count()).group_by(Tenant.plan)).all()
+    return {plan or "trial": count for plan, count in rows}
+
+
+def compute_summary(db: Session) -> Dict[str, Any]:
+    counts = plan_counts(db)
+    return {
+        "plans": counts,
+        "total": sum(counts.values()),
+        "mrr": sum(PLAN_PRICES.get(plan, 0) * count for plan, count in counts.items()),
+        "computed_at": datetime.now().isoformat(),
+    }
+
+
+class PlanSummaryCache:
+    """TTL snapshot of compute_summary()"""
+
+    def __init__(self, ttl: float = ADMIN_SUMMARY_TTL):
+        self.ttl = ttl
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        if snapshot is not None and time.monotonic() < self.expires_at:
+            return snapshot
+        with self._lock:
+            # Another thread may have refreshed it while we waited
+            if self.snapshot is not None and time.monotonic() < self.expires_at:
+                return self.snapshot
+            self.snapshot = compute_summary(db)
+            self.expires_at = time.monotonic() + self.ttl
+            return self.snapshot
+
+    def invalidate(self) -> None:
+        self.expires_at = 0.0
+
+
+# Global instance for easy import
+plan_summary = PlanSummaryCache()
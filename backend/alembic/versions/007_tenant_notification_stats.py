@@ -0,0 +1,49 @@
+"""create tenant notification stats counters
+
+Revision ID: 007
+Revises: 006_add_missing_notification_fields
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = '007_tenant_notification_stats'
+down_revision = '006_add_missing_notification_fields'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'tenant_notification_stats',
+        sa.Column('tenant_id', UUID(as_uuid=True), sa.ForeignKey('tenants.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('total', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('pending', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('sending', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('sent', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('failed', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('today_date', sa.Date()),
+        sa.Column('today_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('NOW()')),
+    )
+
+    # Backfill counters from existing notifications
+    op.execute("""
+        INSERT INTO tenant_notification_stats
+            (tenant_id, total, pending, sending, sent, failed, today_date, today_count)
+        SELECT
+            t.id,
+            COUNT(n.id),
+            COUNT(n.id) FILTER (WHERE n.status = 'pending'),
+            COUNT(n.id) FILTER (WHERE n.status = 'sending'),
+            COUNT(n.id) FILTER (WHERE n.status = 'sent'),
+            COUNT(n.id) FILTER (WHERE n.status = 'failed'),
+            CURRENT_DATE,
+            COUNT(n.id) FILTER (WHERE n.created_at >= CURRENT_DATE)
+        FROM tenants t
+        LEFT JOIN notifications n ON n.tenant_id = t.id
+        GROUP BY t.id
+    """)
+
+def downgrade():
+    op.drop_table('tenant_notification_stats')
@@ -0,0 +1,24 @@
+"""add keyset pagination index for notifications
+
+Revision ID: 008
+Revises: 007_tenant_notification_stats
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '008_notifications_keyset_index'
+down_revision = '007_tenant_notification_stats'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Matches ORDER BY created_at DESC, id DESC within a tenant (cursor pagination)
+    op.create_index(
+        'idx_notifications_tenant_created_id',
+        'notifications',
+        ['tenant_id', sa.text('created_at DESC'), sa.text('id DESC')]
+    )
+
+def downgrade():
+    op.drop_index('idx_notifications_tenant_created_id', 'notifications')
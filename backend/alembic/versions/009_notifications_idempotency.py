@@ -0,0 +1,27 @@
+"""add idempotency key to notifications
+
+Revision ID: 009
+Revises: 008_notifications_keyset_index
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '009_notifications_idempotency'
+down_revision = '008_notifications_keyset_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('notifications', sa.Column('idempotency_key', sa.String(255), nullable=True))
+    # NULL keys never conflict, so events without a key are unaffected
+    op.create_index(
+        'uq_notifications_tenant_idempotency',
+        'notifications',
+        ['tenant_id', 'idempotency_key'],
+        unique=True
+    )
+
+def downgrade():
+    op.drop_index('uq_notifications_tenant_idempotency', 'notifications')
+    op.drop_column('notifications', 'idempotency_key')
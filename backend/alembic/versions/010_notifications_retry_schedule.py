@@ -0,0 +1,35 @@
+"""add retry schedule to notifications
+
+Revision ID: 010
+Revises: 009_notifications_idempotency
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '010_notifications_retry_schedule'
+down_revision = '009_notifications_idempotency'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('notifications', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+    # Only failed rows waiting for a retry are indexed; the scheduler scans by due time
+    op.create_index(
+        'idx_notifications_retry_due',
+        'notifications',
+        ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'failed' AND next_attempt_at IS NOT NULL")
+    )
+    # Recent failures that the hourly n8n workflow would still have retried
+    op.execute("""
+        UPDATE notifications
+        SET next_attempt_at = NOW()
+        WHERE status = 'failed'
+          AND COALESCE(retry_count, 0) < 3
+          AND created_at >= NOW() - INTERVAL '1 day'
+    """)
+
+def downgrade():
+    op.drop_index('idx_notifications_retry_due', 'notifications')
+    op.drop_column('notifications', 'next_attempt_at')
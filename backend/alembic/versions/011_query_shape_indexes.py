@@ -0,0 +1,84 @@
+"""partial, covering and unique indexes for the hot query shapes
+
+Revision ID: 011
+Revises: 010_notifications_retry_schedule
+Create Date: 2026-10-17
+
+- pending / failed partial indexes: send-batch keyset scan, pending counts,
+  failed listings
+- covering list index: tenant activity page served by an index-only scan
+  (replaces idx_notifications_tenant_created_id)
+- covering created_at index: analytics per-day counts (replaces
+  idx_notifications_created)
+- unique stripe_customer_id lookup for the Stripe webhook (email lookups
+  already use tenants_email_key, the unique constraint from migration 001)
+
+Indexes are built CONCURRENTLY so writes are not blocked on large tables.
+scripts/benchmark_indexes.py checks each one against EXPLAIN on seeded data.
+"""
+from alembic import op
+
+revision = '011_query_shape_indexes'
+down_revision = '010_notifications_retry_schedule'
+branch_labels = None
+depends_on = None
+
+# (name, definition) - also read by scripts/benchmark_indexes.py
+INDEXES = [
+    (
+        'idx_notifications_pending',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_pending "
+        "ON notifications (tenant_id, created_at, id) WHERE status = 'pending'"
+    ),
+    (
+        'idx_notifications_failed',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_failed "
+        "ON notifications (tenant_id, created_at DESC, id DESC) WHERE status = 'failed'"
+    ),
+    (
+        'idx_notifications_tenant_list',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_tenant_list "
+        "ON notifications (tenant_id, created_at DESC, id DESC) "
+        "INCLUDE (status, type, client_name, telefone, valor, nf_number, retry_count, next_attempt_at)"
+    ),
+    (
+        'idx_notifications_created_covering',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_created_covering "
+        "ON notifications (created_at) INCLUDE (id, tenant_id, type, status)"
+    ),
+    (
+        'uq_tenants_stripe_customer_id',
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_tenants_stripe_customer_id "
+        "ON tenants (stripe_customer_id) WHERE stripe_customer_id IS NOT NULL"
+    ),
+]
+
+# Indexes made redundant by the covering ones above, with their original definitions
+SUPERSEDED = [
+    (
+        'idx_notifications_tenant_created_id',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_tenant_created_id "
+        "ON notifications (tenant_id, created_at DESC, id DESC)"
+    ),
+    (
+        'idx_notifications_created',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_created ON notifications (created_at)"
+    ),
+]
+
+def upgrade():
+    # Column used by the Stripe webhook; older databases only got it from create_all
+    op.execute("ALTER TABLE tenants ADD COLUMN IF NOT EXISTS stripe_customer_id VARCHAR(100)")
+
+    with op.get_context().autocommit_block():
+        for _, definition in INDEXES:
+            op.execute(definition)
+        for name, _ in SUPERSEDED:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for _, definition in SUPERSEDED:
+            op.execute(definition)
+        for name, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
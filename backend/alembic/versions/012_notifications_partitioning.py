@@ -0,0 +1,133 @@
+"""partition notifications by month on created_at
+
+Revision ID: 012
+Revises: 011_query_shape_indexes
+Create Date: 2026-10-17
+
+- notifications becomes PARTITION BY RANGE (created_at) with one partition
+  per month (notifications_pYYYYMM) from the oldest row to three months
+  ahead, plus notifications_default; partitions.py keeps creating them
+- the primary key becomes (id, created_at): PostgreSQL requires the
+  partition key in every unique constraint of a partitioned table
+- the per-tenant idempotency unique index moves to its own table,
+  notification_idempotency_keys, for the same reason
+- notifications_archive (same columns, also partitioned by month) receives
+  partitions past the retention window
+
+Existing rows are copied into the new table, so run this in a maintenance
+window on large databases.
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '012_notifications_partitioning'
+down_revision = '011_query_shape_indexes'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+# Indexes of the flat table, recreated on the partitioned parent (and so on every partition)
+INDEXES = [
+    "CREATE INDEX idx_notifications_tenant_status ON notifications (tenant_id, status)",
+    "CREATE INDEX idx_notifications_pending ON notifications (tenant_id, created_at, id) "
+    "WHERE status = 'pending'",
+    "CREATE INDEX idx_notifications_failed ON notifications (tenant_id, created_at DESC, id DESC) "
+    "WHERE status = 'failed'",
+    "CREATE INDEX idx_notifications_tenant_list ON notifications (tenant_id, created_at DESC, id DESC) "
+    "INCLUDE (status, type, client_name, telefone, valor, nf_number, retry_count, next_attempt_at)",
+    "CREATE INDEX idx_notifications_created_covering ON notifications (created_at) "
+    "INCLUDE (id, tenant_id, type, status)",
+    "CREATE INDEX idx_notifications_retry_due ON notifications (next_attempt_at) "
+    "WHERE status = 'failed' AND next_attempt_at IS NOT NULL",
+]
+
+
+def _add_months(month, months):
+    years, index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # created_at becomes part of the primary key
+    op.execute("UPDATE notifications SET created_at = NOW() WHERE created_at IS NULL")
+    op.execute("ALTER TABLE notifications RENAME TO notifications_legacy")
+    op.execute(
+        "CREATE TABLE notifications (LIKE notifications_legacy INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+
+    oldest = conn.execute(sa.text("SELECT MIN(created_at) FROM notifications_legacy")).scalar()
+    today = date.today()
+    month = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    last = _add_months(date(today.year, today.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE notifications_p{month:%Y%m} PARTITION OF notifications "
+            f"FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')"
+        )
+        month = _add_months(month, 1)
+    op.execute("CREATE TABLE notifications_default PARTITION OF notifications DEFAULT")
+
+    op.execute("INSERT INTO notifications SELECT * FROM notifications_legacy")
+
+    # Typed after the notification columns, which differ between migrated and create_all databases
+    op.execute("""
+        CREATE TABLE notification_idempotency_keys AS
+        SELECT tenant_id, idempotency_key, id AS notification_id, created_at
+        FROM notifications_legacy
+        WHERE idempotency_key IS NOT NULL AND tenant_id IS NOT NULL
+    """)
+    op.execute("""
+        ALTER TABLE notification_idempotency_keys
+            ADD PRIMARY KEY (tenant_id, idempotency_key),
+            ALTER COLUMN notification_id SET NOT NULL,
+            ALTER COLUMN created_at SET NOT NULL,
+            ALTER COLUMN created_at SET DEFAULT NOW(),
+            ADD FOREIGN KEY (tenant_id) REFERENCES tenants (id) ON DELETE CASCADE
+    """)
+    op.create_index('idx_notification_idempotency_keys_created', 'notification_idempotency_keys', ['created_at'])
+
+    # Frees the old constraint and index names for the parent table
+    op.execute("DROP TABLE notifications_legacy")
+
+    op.execute("ALTER TABLE notifications ADD PRIMARY KEY (id, created_at)")
+    op.execute(
+        "ALTER TABLE notifications ADD FOREIGN KEY (tenant_id) REFERENCES tenants (id) ON DELETE CASCADE"
+    )
+    for definition in INDEXES:
+        op.execute(definition)
+
+    op.execute(
+        "CREATE TABLE notifications_archive (LIKE notifications INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ANALYZE notifications")
+
+
+def downgrade():
+    # Parquet-archived partitions are not restored
+    op.execute("CREATE TABLE notifications_flat (LIKE notifications INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO notifications_flat SELECT * FROM notifications")
+    op.execute("INSERT INTO notifications_flat SELECT * FROM notifications_archive")
+    op.execute("DROP TABLE notifications_archive")
+    op.execute("DROP TABLE notifications")
+    op.execute("ALTER TABLE notifications_flat RENAME TO notifications")
+
+    op.execute("ALTER TABLE notifications ADD PRIMARY KEY (id)")
+    op.execute(
+        "ALTER TABLE notifications ADD FOREIGN KEY (tenant_id) REFERENCES tenants (id) ON DELETE CASCADE"
+    )
+    for definition in INDEXES:
+        op.execute(definition)
+    op.create_index(
+        'uq_notifications_tenant_idempotency',
+        'notifications',
+        ['tenant_id', 'idempotency_key'],
+        unique=True
+    )
+    op.drop_table('notification_idempotency_keys')
@@ -0,0 +1,45 @@
+"""create daily_stats rollup for admin analytics
+
+Revision ID: 013
+Revises: 012_notifications_partitioning
+Create Date: 2026-10-17
+
+One row per (day, tenant_id, type, status). Backfilled from notifications
+and notifications_archive, so analytics keep covering archived months;
+rollups.py keeps the recent days up to date.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = '013_daily_stats'
+down_revision = '012_notifications_partitioning'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'daily_stats',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('tenant_id', UUID(as_uuid=True), sa.ForeignKey('tenants.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('type', sa.String(50), primary_key=True),
+        sa.Column('status', sa.String(50), primary_key=True),
+        sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+    )
+    op.create_index('idx_daily_stats_tenant_day', 'daily_stats', ['tenant_id', 'day'])
+
+    op.execute("""
+        INSERT INTO daily_stats (day, tenant_id, type, status, count)
+        SELECT date(created_at), tenant_id, COALESCE(type, 'unknown'), COALESCE(status, 'pending'), COUNT(*)
+        FROM (
+            SELECT created_at, tenant_id, type, status FROM notifications
+            UNION ALL
+            SELECT created_at, tenant_id, type, status FROM notifications_archive
+        ) AS n
+        WHERE tenant_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+
+def downgrade():
+    op.drop_index('idx_daily_stats_tenant_day', 'daily_stats')
+    op.drop_table('daily_stats')
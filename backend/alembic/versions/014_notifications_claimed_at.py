@@ -0,0 +1,35 @@
+"""add claim time to notifications
+
+Revision ID: 014
+Revises: 013_daily_stats
+Create Date: 2026-10-17
+
+claimed_at is set when a delivery worker or send-batch moves a notification
+to 'sending'; the stale-claim sweep returns rows claimed longer than
+DELIVERY_CLAIM_TIMEOUT ago to pending. notifications_archive gets the
+column too, since detached partitions are attached to it unchanged.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '014_notifications_claimed_at'
+down_revision = '013_daily_stats'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('notifications', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.add_column('notifications_archive', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'idx_notifications_sending',
+        'notifications',
+        ['claimed_at'],
+        postgresql_where=sa.text("status = 'sending'")
+    )
+    # Rows already stuck in sending are recovered one timeout after the upgrade
+    op.execute("UPDATE notifications SET claimed_at = NOW() WHERE status = 'sending'")
+
+def downgrade():
+    op.drop_index('idx_notifications_sending', 'notifications')
+    op.drop_column('notifications_archive', 'claimed_at')
+    op.drop_column('notifications', 'claimed_at')
@@ -0,0 +1,28 @@
+"""index deferred pending notifications
+
+Revision ID: 015
+Revises: 014_notifications_claimed_at
+Create Date: 2026-10-17
+
+Sends skipped while Evolution API is unavailable (circuit open, no
+concurrency slot) stay pending with a next_attempt_at; the retry scheduler
+finds the due ones through this partial index.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '015_notifications_deferred_index'
+down_revision = '014_notifications_claimed_at'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index(
+        'idx_notifications_deferred',
+        'notifications',
+        ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'pending' AND next_attempt_at IS NOT NULL")
+    )
+
+def downgrade():
+    op.drop_index('idx_notifications_deferred', 'notifications')
@@ -0,0 +1,963 @@
+"""
+Outbound delivery pipeline for 28Hub Connect backend.
+
+Webhooks only persist the notification and enqueue its id. A pool of async
+workers drains the queue, renders the message and sends it through Evolution
+API with bounded concurrency (one in-flight send per worker). send-batch
+sweeps whatever is still pending for a tenant through the same send path.
+
+The queue lives in Redis (REDIS_URL) so the API and standalone worker
+processes (`python delivery.py`) share it. Without REDIS_URL an in-process
+queue is used, which is only suitable for local development.
+
+Delivery is at-least-once: a worker moves each id into its process's
+processing list (BLMOVE) and removes it only after the outcome is committed.
+Processing lists of processes whose heartbeat expired are moved back to the
+queue, and notifications left in 'sending' for DELIVERY_CLAIM_TIMEOUT
+seconds (crash, deploy or cancellation mid-send) are returned to pending and
+re-enqueued.
+
+Failed sends get a next_attempt_at with exponential backoff until
+retry_count reaches RETRY_MAX_ATTEMPTS. The retry scheduler claims due rows
+with FOR UPDATE SKIP LOCKED (safe to run in every process), moves them back
+to pending and enqueues them. Sends that Evolution API never saw (circuit
+open or no concurrency slot) stay pending with a next_attempt_at after the
+upstream's retry_after instead, without using up a retry; the scheduler
+enqueues them again once due.
+"""
+import asyncio
+import os
+import logging
+import random
+import socket
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional, Tuple, List, Dict, Any
+from uuid import uuid4
+
+import orjson
+import redis.asyncio as redis
+from prometheus_client import start_http_server
+from sqlalchemy import select, update, and_, or_
+
+from database import SessionLocal, engine
+from events import event_hub, publish_events, stage_notifications
+from models import Tenant, Notification
+from rendering import render_message, render_many
+from http_clients import http_clients
+from rate_limit import instance_limiter
+from resilience import UpstreamUnavailable, upstream_guards
+from stats import record_transition
+from partitions import PARTITION_MAINTENANCE_ENABLED, partition_maintenance
+from rollups import ROLLUP_ENABLED, rollup_compactor
+from metrics import count_tenant_notifications, instrument_engine, tenant_plans
+from integrations.evolution import send_whatsapp_message
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+DELIVERY_QUEUE_KEY = os.getenv("DELIVERY_QUEUE_KEY", "28hub:delivery:queue")
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "8"))
+DELIVERY_WORKERS_ENABLED = os.getenv("DELIVERY_WORKERS_ENABLED", "true").lower() == "true"
+# A claimed notification still 'sending' after this many seconds is returned to pending;
+# keep it well above BATCH_CLAIM_SIZE / WA_RATE_PER_SECOND
+DELIVERY_CLAIM_TIMEOUT = float(os.getenv("DELIVERY_CLAIM_TIMEOUT", "300"))
+DELIVERY_SWEEP_INTERVAL = float(os.getenv("DELIVERY_SWEEP_INTERVAL", "30"))
+# Processing lists of worker processes silent for this long are returned to the queue
+DELIVERY_HEARTBEAT_TTL = int(os.getenv("DELIVERY_HEARTBEAT_TTL", "30"))
+
+# send-batch streams pending rows in keyset pages; each page is claimed, sent and saved
+# BATCH_CLAIM_SIZE rows at a time, so claimed rows never wait long on the rate limit
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "500"))
+BATCH_CLAIM_SIZE = int(os.getenv("BATCH_CLAIM_SIZE", "20"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "20"))
+# With REDIS_URL, batch progress and the per-tenant lock are shared by all processes; the lock
+# expires BATCH_LOCK_TTL seconds after the last progress update (e.g. the process died)
+BATCH_KEY_PREFIX = os.getenv("BATCH_KEY_PREFIX", "28hub:batch:")
+BATCH_LOCK_TTL = int(os.getenv("BATCH_LOCK_TTL", "120"))
+BATCH_PROGRESS_TTL = int(os.getenv("BATCH_PROGRESS_TTL", "86400"))
+
+# Deletes KEYS[1] only while it still holds this batch's token (ARGV[1])
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Automatic retries of failed sends: attempts, first delay (doubles each time), scan cadence
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "10"))
+RETRY_POLL_INTERVAL = float(os.getenv("RETRY_POLL_INTERVAL", "2"))
+RETRY_BATCH_SIZE = int(os.getenv("RETRY_BATCH_SIZE", "500"))
+RETRY_SCHEDULER_ENABLED = os.getenv("RETRY_SCHEDULER_ENABLED", "true").lower() == "true"
+
+# Port for /metrics of a standalone worker process (python delivery.py); unset disables it
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+# N8N webhook configuration - delivered events are forwarded for workflow processing
+N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://n8n:5678/webhook/28hub")
+N8N_FORWARD_ENABLED = os.getenv("N8N_FORWARD_ENABLED", "true").lower() == "true"
+
+
+class RedisDeliveryQueue:
+    """
+    Delivery queue backed by a Redis list, shared across processes. Ids being
+    delivered sit in this process's processing list until ack()ed.
+    """
+
+    def __init__(self, url: str, key: str = DELIVERY_QUEUE_KEY):
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.key = key
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.processing_key = f"{key}:processing:{self.consumer}"
+        self.heartbeat_key = f"{key}:consumer:{self.consumer}"
+
+    async def put(self, notification_id: str) -> None:
+        await self.redis.rpush(self.key, notification_id)
+
+    async def put_many(self, notification_ids: List[str]) -> None:
+        for start in range(0, len(notification_ids), 1000):
+            await self.redis.rpush(self.key, *notification_ids[start:start + 1000])
+
+    async def get(self, timeout: float = 1.0) -> Optional[str]:
+        return await self.redis.blmove(self.key, self.processing_key, timeout, "LEFT", "RIGHT")
+
+    async def ack(self, notification_id: str) -> None:
+        """Drop a handled id from the processing list"""
+        await self.redis.lrem(self.processing_key, 1, notification_id)
+
+    async def nack(self, notification_id: str) -> None:
+        """Move an id whose delivery failed back to the queue"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 1, notification_id)
+            pipe.rpush(self.key, notification_id)
+            await pipe.execute()
+
+    async def heartbeat(self) -> None:
+        await self.redis.set(self.heartbeat_key, "1", ex=DELIVERY_HEARTBEAT_TTL)
+
+    async def recover(self) -> int:
+        """Move the processing lists of consumers without a heartbeat back to the queue"""
+        moved = 0
+        async for processing_key in self.redis.scan_iter(match=f"{self.key}:processing:*"):
+            consumer = processing_key.rsplit(":processing:", 1)[1]
+            if consumer == self.consumer or await self.redis.exists(f"{self.key}:consumer:{consumer}"):
+                continue
+            while await self.redis.lmove(processing_key, self.key, "LEFT", "RIGHT") is not None:
+                moved += 1
+        return moved
+
+    async def release(self) -> None:
+        """Hand this consumer's unfinished ids back to the queue on shutdown"""
+        while await self.redis.lmove(self.processing_key, self.key, "RIGHT", "LEFT") is not None:
+            pass
+        await self.redis.delete(self.heartbeat_key)
+
+    async def size(self) -> int:
+        return await self.redis.llen(self.key)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+class MemoryDeliveryQueue:
+    """In-process delivery queue for local development (single worker process)"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def put(self, notification_id: str) -> None:
+        self.queue.put_nowait(notification_id)
+
+    async def put_many(self, notification_ids: List[str]) -> None:
+        for notification_id in notification_ids:
+            self.queue.put_nowait(notification_id)
+
+    async def get(self, timeout: float = 1.0) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, notification_id: str) -> None:
+        pass
+
+    async def nack(self, notification_id: str) -> None:
+        self.queue.put_nowait(notification_id)
+
+    async def heartbeat(self) -> None:
+        pass
+
+    async def recover(self) -> int:
+        return 0
+
+    async def release(self) -> None:
+        pass
+
+    async def size(self) -> int:
+        return self.queue.qsize()
+
+    async def close(self) -> None:
+        pass
+
+
+delivery_queue = RedisDeliveryQueue(REDIS_URL) if REDIS_URL else MemoryDeliveryQueue()
+
+
+async def enqueue_notification(notification_id: str) -> bool:
+    """
+    Enqueue a persisted notification for delivery.
+    Never raises: if the queue is unavailable the notification stays pending
+    and can still be delivered by send-batch.
+    """
+    try:
+        await delivery_queue.put(str(notification_id))
+        return True
+    except Exception as e:
+        logger.error(f"Failed to enqueue notification {notification_id}: {str(e)}")
+        return False
+
+
+async def enqueue_notifications(notification_ids: List[str]) -> bool:
+    """Enqueue many persisted notifications at once; never raises"""
+    if not notification_ids:
+        return True
+    try:
+        await delivery_queue.put_many([str(n) for n in notification_ids])
+        return True
+    except Exception as e:
+        logger.error(f"Failed to enqueue {len(notification_ids)} notifications: {str(e)}")
+        return False
+
+
+def _claim(db, notification_ids: List[str]) -> List[str]:
+    """
+    Atomically move pending notifications to 'sending'.
+    Only the caller whose UPDATE matched a row may send it, so the queue
+    workers and send-batch never deliver the same notification twice.
+    claimed_at lets the stale-claim sweep recover rows whose sender died.
+    Pending rows deferred to a later next_attempt_at are left alone.
+    """
+    if not notification_ids:
+        return []
+    now = datetime.now()
+    claimed = db.execute(
+        update(Notification)
+        .where(
+            Notification.id.in_(notification_ids),
+            Notification.status == "pending",
+            or_(Notification.next_attempt_at.is_(None), Notification.next_attempt_at <= now)
+        )
+        .values(status="sending", claimed_at=now, next_attempt_at=None)
+        .returning(Notification.id, Notification.tenant_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    for tenant_id, count in Counter(row.tenant_id for row in claimed).items():
+        record_transition(db, tenant_id, "pending", "sending", count)
+    db.commit()
+    return [row.id for row in claimed]
+
+
+def _load_pending(notification_id: str) -> Optional[Tuple[Notification, Tenant, str]]:
+    """
+    Claim a pending notification and load it with its tenant and rendered
+    message, or None if already handled
+    """
+    db = SessionLocal()
+    try:
+        if not _claim(db, [notification_id]):
+            return None
+        row = db.execute(
+            select(Notification, Tenant)
+            .join(Tenant, Notification.tenant_id == Tenant.id)
+            .where(Notification.id == notification_id)
+        ).first()
+        if not row:
+            return None
+        tenant_plans.remember(row[1].id, row[1].plan)
+        return row[0], row[1], render_message(row[0], db)
+    finally:
+        db.close()
+
+
+def _save_results(results: List[Dict[str, Any]]) -> None:
+    """
+    Write delivery outcomes back with one bulk UPDATE per status: sent,
+    failed, or pending for sends deferred while Evolution API was unavailable.
+    Rows are matched on the full primary key (id, created_at), which also
+    lets PostgreSQL prune to the right partition.
+    Only rows still 'sending' under the claim they were sent with are
+    written: once the stale-claim sweep has handed a row to another sender,
+    that sender's outcome stands and no transition is counted here.
+    """
+    db = SessionLocal()
+    try:
+        claims = dict(db.execute(
+            select(Notification.id, Notification.claimed_at)
+            .where(
+                Notification.id.in_([r["id"] for r in results]),
+                Notification.created_at.in_([r["created_at"] for r in results]),
+                Notification.status == "sending"
+            )
+            .with_for_update()
+        ).all())
+        current = []
+        for r in results:
+            claimed_at = r.pop("claimed_at", None)
+            if r["id"] not in claims or (claimed_at is not None and claims[r["id"]] != claimed_at):
+                logger.warning(
+                    f"Dropped {r['status']} outcome of notification {r['id']}: no longer claimed by this sender"
+                )
+                continue
+            current.append(r)
+
+        by_outcome: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for r in current:
+            by_outcome.setdefault((r.pop("tenant_id"), r["status"]), []).append(r)
+        transitions = Counter({
+            (tenant_id, "deferred" if status == "pending" else status): len(rows)
+            for (tenant_id, status), rows in by_outcome.items()
+        })
+
+        for status in ("sent", "failed", "pending"):
+            rows = [r for r in current if r["status"] == status]
+            if rows:
+                db.execute(
+                    update(Notification)
+                    .where(Notification.status == "sending")
+                    .execution_options(synchronize_session=None),
+                    rows
+                )
+        for (tenant_id, status), rows in by_outcome.items():
+            record_transition(db, tenant_id, "sending", status, len(rows))
+            stage_notifications(db, tenant_id, "retrying" if status == "pending" else status, rows)
+        db.commit()
+        count_tenant_notifications(db, transitions)
+    finally:
+        db.close()
+
+
+def next_attempt_at(retry_count: int) -> Optional[datetime]:
+    """
+    When a notification that just failed should be retried, or None once it
+    has used all its retries. Delay doubles per retry with +/-20% jitter.
+    """
+    if (retry_count or 0) >= RETRY_MAX_ATTEMPTS:
+        return None
+    delay = RETRY_BACKOFF_BASE * (2 ** (retry_count or 0)) * random.uniform(0.8, 1.2)
+    return datetime.now() + timedelta(seconds=delay)
+
+
+def _unavailable_cause(error: BaseException) -> Optional[UpstreamUnavailable]:
+    """The UpstreamUnavailable behind a send error, i.e. Evolution API was never called"""
+    cause = error if isinstance(error, UpstreamUnavailable) else error.__cause__
+    return cause if isinstance(cause, UpstreamUnavailable) else None
+
+
+async def send_notification(
+    notification: Notification,
+    instance: Optional[str],
+    message: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Send one notification, honouring the per-instance rate limit. The
+    default message is rendered when no pre-rendered `message` is given.
+    Returns the row values to persist; never raises.
+    """
+    if not instance:
+        return {
+            "id": notification.id,
+            "created_at": notification.created_at,
+            "claimed_at": notification.claimed_at,
+            "tenant_id": notification.tenant_id,
+            "status": "failed",
+            "error_message": "WhatsApp instance not configured",
+            "next_attempt_at": next_attempt_at(notification.retry_count)
+        }
+
+    try:
+        await instance_limiter.acquire(instance)
+        result = await send_whatsapp_message(
+            phone=notification.client_phone or notification.telefone,
+            message=message if message is not None else render_message(notification),
+            instance=instance
+        )
+    except Exception as e:
+        error = getattr(e, "detail", None) or str(e)
+        unavailable = _unavailable_cause(e)
+        if unavailable is not None:
+            # Not an attempt: keep the retry budget and try again once the upstream may take it
+            delay = max(1.0, unavailable.retry_after) * random.uniform(1.0, 1.2)
+            logger.warning(f"Deferred notification {notification.id} for {delay:.0f}s: {error}")
+            return {
+                "id": notification.id,
+                "created_at": notification.created_at,
+                "claimed_at": notification.claimed_at,
+                "tenant_id": notification.tenant_id,
+                "status": "pending",
+                "error_message": error,
+                "next_attempt_at": datetime.now() + timedelta(seconds=delay)
+            }
+        logger.error(f"Failed to deliver notification {notification.id}: {error}")
+        return {
+            "id": notification.id,
+            "created_at": notification.created_at,
+            "claimed_at": notification.claimed_at,
+            "tenant_id": notification.tenant_id,
+            "status": "failed",
+            "error_message": error,
+            "next_attempt_at": next_attempt_at(notification.retry_count)
+        }
+
+    return {
+        "id": notification.id,
+        "created_at": notification.created_at,
+        "claimed_at": notification.claimed_at,
+        "tenant_id": notification.tenant_id,
+        "status": "sent",
+        "whatsapp_id": result.get("key", {}).get("id"),
+        "sent_at": datetime.now(),
+        "error_message": None
+    }
+
+
+async def send_claimed(notification: Notification, instance: Optional[str], message: str) -> Dict[str, Any]:
+    """Send a notification the caller already claimed and persist the outcome"""
+    result = await send_notification(notification, instance, message)
+    await asyncio.to_thread(_save_results, [dict(result)])
+    return result
+
+
+async def forward_to_n8n(notification: Notification, tenant: Tenant) -> None:
+    """Forward a processed notification to N8N; failures are only logged"""
+    try:
+        n8n_payload = {
+            "tenant_id": tenant.id,
+            "notification_id": str(notification.id),
+            "type": notification.type,
+            "client_name": notification.client_name,
+            "client_phone": notification.client_phone,
+            "value": notification.value,
+            "nf_number": notification.nf_number,
+            "products": notification.products,
+            "api_key": tenant.api_key
+        }
+
+        client = http_clients.get("n8n")
+
+        async def post():
+            response = await client.post(
+                f"{N8N_WEBHOOK_URL}/erp",
+                json=n8n_payload,
+                headers={"Content-Type": "application/json"}
+            )
+            response.raise_for_status()
+            return response
+
+        response = await upstream_guards.get("n8n").call(post)
+        logger.info(f"N8N webhook response: {response.status_code}")
+    except Exception as e:
+        logger.error(f"Failed to send to N8N: {str(e)}")
+
+
+async def deliver_notification(notification_id: str) -> None:
+    """
+    Render and send a single pending notification through Evolution API.
+    Notifications that are no longer pending are skipped, so duplicate queue
+    entries never produce duplicate WhatsApp messages.
+    """
+    loaded = await asyncio.to_thread(_load_pending, notification_id)
+    if loaded is None:
+        return
+    notification, tenant, message = loaded
+
+    result = await send_notification(notification, tenant.wa_instance_name, message)
+    await asyncio.to_thread(_save_results, [result])
+
+    if result["status"] == "sent":
+        logger.info(f"Notification {notification_id} delivered for tenant {tenant.id}")
+        if N8N_FORWARD_ENABLED:
+            await forward_to_n8n(notification, tenant)
+
+
+class DeliveryWorkerPool:
+    """Fixed-size pool of async workers draining the delivery queue"""
+
+    def __init__(self, queue=None, concurrency: int = DELIVERY_WORKERS):
+        self.queue = queue or delivery_queue
+        self.concurrency = concurrency
+        self.tasks: list = []
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        self._stopping = asyncio.Event()
+        self.tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+        self.tasks.append(asyncio.create_task(self._heartbeat()))
+        logger.info(f"Started {self.concurrency} delivery workers")
+
+    async def stop(self) -> None:
+        if self._stopping is None:
+            return
+        self._stopping.set()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        try:
+            await self.queue.release()
+        except Exception as e:
+            logger.error(f"Failed to release delivery queue: {str(e)}")
+        logger.info("Delivery workers stopped")
+
+    async def _heartbeat(self) -> None:
+        """Keep this process's processing list alive and recover those of dead processes"""
+        while not self._stopping.is_set():
+            try:
+                await self.queue.heartbeat()
+                moved = await self.queue.recover()
+                if moved:
+                    logger.warning(f"Returned {moved} notifications from stopped delivery workers to the queue")
+            except Exception as e:
+                logger.error(f"Delivery queue heartbeat failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), DELIVERY_HEARTBEAT_TTL / 3)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, index: int) -> None:
+        while not self._stopping.is_set():
+            try:
+                notification_id = await self.queue.get(timeout=1.0)
+            except Exception as e:
+                logger.error(f"Delivery worker {index} failed to read queue: {str(e)}")
+                await asyncio.sleep(1.0)
+                continue
+
+            if notification_id is None:
+                continue
+
+            try:
+                await deliver_notification(notification_id)
+            except Exception as e:
+                logger.error(f"Delivery worker {index} crashed on {notification_id}: {str(e)}")
+                # A row already claimed stays 'sending' and is recovered by the stale-claim sweep
+                try:
+                    await self.queue.nack(notification_id)
+                except Exception as e:
+                    logger.error(f"Delivery worker {index} failed to requeue {notification_id}: {str(e)}")
+                await asyncio.sleep(1.0)
+                continue
+
+            try:
+                await self.queue.ack(notification_id)
+            except Exception as e:
+                logger.error(f"Delivery worker {index} failed to ack {notification_id}: {str(e)}")
+
+
+delivery_workers = DeliveryWorkerPool()
+
+
+def _fetch_pending_chunk(
+    tenant_id: str,
+    after: Optional[Tuple[datetime, str]],
+    limit: int
+) -> Tuple[Optional[Tuple[datetime, str]], List[str]]:
+    """
+    Read the ids of the next keyset page of pending notifications after
+    `after` (created_at, id). Returns the page cursor and the ids, unclaimed.
+    """
+    db = SessionLocal()
+    try:
+        query = select(Notification.id, Notification.created_at).where(
+            Notification.tenant_id == tenant_id,
+            Notification.status == "pending"
+        )
+        if after:
+            created_at, last_id = after
+            query = query.where(or_(
+                Notification.created_at > created_at,
+                and_(Notification.created_at == created_at, Notification.id > last_id)
+            ))
+        page = db.execute(
+            query.order_by(Notification.created_at, Notification.id).limit(limit)
+        ).all()
+        if not page:
+            return None, []
+        return (page[-1].created_at, page[-1].id), [row.id for row in page]
+    finally:
+        db.close()
+
+
+def _claim_rendered(notification_ids: List[str]) -> List[Tuple[Notification, str]]:
+    """Claim these notifications and load the claimed ones with their rendered messages"""
+    db = SessionLocal()
+    try:
+        claimed = _claim(db, notification_ids)
+        if not claimed:
+            return []
+        notifications = db.execute(
+            select(Notification).where(Notification.id.in_(claimed))
+        ).scalars().all()
+        return list(zip(notifications, render_many(db, notifications)))
+    finally:
+        db.close()
+
+
+class BatchSender:
+    """
+    Runs at most one background send-batch per tenant and tracks its progress.
+    With Redis the per-tenant lock and the progress live there, so every
+    worker process sees the running batch and none starts a second one.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = BATCH_CHUNK_SIZE,
+        claim_size: int = BATCH_CLAIM_SIZE,
+        concurrency: int = BATCH_CONCURRENCY,
+        redis_client: Optional[redis.Redis] = None,
+        prefix: str = BATCH_KEY_PREFIX
+    ):
+        self.chunk_size = chunk_size
+        self.claim_size = claim_size
+        self.concurrency = concurrency
+        self.redis = redis_client
+        self.prefix = prefix
+        self.release_script = redis_client.register_script(RELEASE_LOCK_SCRIPT) if redis_client else None
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    async def _lock(self, tenant_id: str) -> Optional[str]:
+        """Take the tenant's batch lock; returns its token, or None while a batch runs"""
+        if self.redis is None:
+            task = self.tasks.get(tenant_id)
+            return None if task and not task.done() else "local"
+        token = uuid4().hex
+        locked = await self.redis.set(f"{self.prefix}{tenant_id}:lock", token, nx=True, ex=BATCH_LOCK_TTL)
+        return token if locked else None
+
+    async def _store(self, progress: Dict[str, Any], token: str) -> None:
+        """Publish progress and keep the lock alive while the batch runs"""
+        if self.redis is None:
+            return
+        tenant_id = progress["tenant_id"]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(f"{self.prefix}{tenant_id}", orjson.dumps(progress), ex=BATCH_PROGRESS_TTL)
+                if progress["finished_at"] is None:
+                    pipe.expire(f"{self.prefix}{tenant_id}:lock", BATCH_LOCK_TTL)
+                await pipe.execute()
+            if progress["finished_at"] is not None:
+                await self.release_script(keys=[f"{self.prefix}{tenant_id}:lock"], args=[token])
+        except Exception as e:
+            logger.error(f"Failed to store batch progress for tenant {tenant_id}: {str(e)}")
+
+    async def start(self, tenant_id: str, instance: Optional[str]) -> Dict[str, Any]:
+        """Start sending a tenant's pending notifications, or return the running batch"""
+        token = await self._lock(tenant_id)
+        if token is None:
+            return await self.get(tenant_id) or {"tenant_id": tenant_id, "status": "running"}
+
+        progress = {
+            "tenant_id": tenant_id,
+            "status": "running",
+            "sent": 0,
+            "failed": 0,
+            "deferred": 0,
+            "total": 0,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None
+        }
+        self.batches[tenant_id] = progress
+        await self._store(progress, token)
+        self.tasks[tenant_id] = asyncio.create_task(self._run(tenant_id, instance, progress, token))
+        return progress
+
+    async def get(self, tenant_id: str) -> Optional[Dict[str, Any]]:
+        if self.redis is None:
+            return self.batches.get(tenant_id)
+        data = await self.redis.get(f"{self.prefix}{tenant_id}")
+        return orjson.loads(data) if data else None
+
+    async def _run(self, tenant_id: str, instance: Optional[str], progress: Dict[str, Any], token: str) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(notification: Notification, message: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await send_notification(notification, instance, message)
+
+        cursor = None
+        try:
+            while True:
+                cursor, notification_ids = await asyncio.to_thread(
+                    _fetch_pending_chunk, tenant_id, cursor, self.chunk_size
+                )
+                if cursor is None:
+                    break
+
+                # Claimed just before sending: a whole claimed page could outlast
+                # DELIVERY_CLAIM_TIMEOUT on a busy instance and be sent twice
+                for start in range(0, len(notification_ids), self.claim_size):
+                    notifications = await asyncio.to_thread(
+                        _claim_rendered, notification_ids[start:start + self.claim_size]
+                    )
+                    if not notifications:
+                        continue
+
+                    results = await asyncio.gather(*(send(n, m) for n, m in notifications))
+                    await asyncio.to_thread(_save_results, results)
+
+                    progress["total"] += len(results)
+                    progress["sent"] += sum(1 for r in results if r["status"] == "sent")
+                    progress["failed"] += sum(1 for r in results if r["status"] == "failed")
+                    progress["deferred"] += sum(1 for r in results if r["status"] == "pending")
+                    await self._store(progress, token)
+            progress["status"] = "completed"
+        except asyncio.CancelledError:
+            progress["status"] = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Batch send failed for tenant {tenant_id}: {str(e)}")
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+        finally:
+            progress["finished_at"] = datetime.now().isoformat()
+            await self._store(progress, token)
+            logger.info(
+                f"Batch send for tenant {tenant_id} {progress['status']}: "
+                f"{progress['sent']} sent, {progress['failed']} failed"
+            )
+
+    async def stop(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks = {}
+
+
+batch_sender = BatchSender(redis_client=delivery_queue.redis if REDIS_URL else None)
+
+
+def _claim_due_retries(limit: int) -> List[str]:
+    """
+    Move failed notifications whose next attempt is due back to pending,
+    counting the retry. Rows locked by another scheduler are skipped.
+    """
+    db = SessionLocal()
+    try:
+        due = db.execute(
+            select(Notification.id, Notification.tenant_id)
+            .where(
+                Notification.status == "failed",
+                Notification.next_attempt_at.is_not(None),
+                Notification.next_attempt_at <= datetime.now()
+            )
+            .order_by(Notification.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not due:
+            db.rollback()
+            return []
+
+        db.execute(
+            update(Notification)
+            .where(Notification.id.in_([row.id for row in due]))
+            .values(
+                status="pending",
+                retry_count=Notification.retry_count + 1,
+                next_attempt_at=None,
+                error_message=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        retried = Counter(row.tenant_id for row in due)
+        for tenant_id, count in retried.items():
+            record_transition(db, tenant_id, "failed", "pending", count)
+            stage_notifications(
+                db, tenant_id, "retrying",
+                ({"id": row.id, "status": "pending"} for row in due if row.tenant_id == tenant_id)
+            )
+        db.commit()
+        count_tenant_notifications(db, {(tenant_id, "retry"): count for tenant_id, count in retried.items()})
+        return [row.id for row in due]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _requeue_stale_claims(timeout: float, limit: int) -> List[str]:
+    """
+    Return notifications claimed more than `timeout` seconds ago and still
+    'sending' (their sender crashed, was redeployed or cancelled) to pending.
+    They may have gone out already, so this can send a message twice.
+    """
+    db = SessionLocal()
+    try:
+        stale = db.execute(
+            select(Notification.id, Notification.tenant_id)
+            .where(
+                Notification.status == "sending",
+                Notification.claimed_at < datetime.now() - timedelta(seconds=timeout)
+            )
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not stale:
+            db.rollback()
+            return []
+
+        db.execute(
+            update(Notification)
+            .where(Notification.id.in_([row.id for row in stale]), Notification.status == "sending")
+            .values(status="pending", claimed_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        for tenant_id, count in Counter(row.tenant_id for row in stale).items():
+            record_transition(db, tenant_id, "sending", "pending", count)
+        db.commit()
+        return [row.id for row in stale]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _release_deferred(limit: int) -> List[str]:
+    """Clear next_attempt_at of deferred pending notifications that are due, for re-enqueueing"""
+    db = SessionLocal()
+    try:
+        due = db.execute(
+            select(Notification.id)
+            .where(
+                Notification.status == "pending",
+                Notification.next_attempt_at.is_not(None),
+                Notification.next_attempt_at <= datetime.now()
+            )
+            .order_by(Notification.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not due:
+            db.rollback()
+            return []
+
+        db.execute(
+            update(Notification)
+            .where(Notification.id.in_(due), Notification.status == "pending")
+            .values(next_attempt_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return list(due)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class RetryScheduler:
+    """
+    Periodically re-enqueues failed notifications whose retry is due and
+    deferred ones whose next attempt is due, and every
+    DELIVERY_SWEEP_INTERVAL seconds those stuck in 'sending'
+    """
+
+    def __init__(self, interval: float = RETRY_POLL_INTERVAL, batch_size: int = RETRY_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.task: Optional[asyncio.Task] = None
+        self.retried = 0
+        self.recovered = 0
+        self.last_sweep = 0.0
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+        logger.info("Retry scheduler started")
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def _sweep_stale_claims(self) -> None:
+        now = asyncio.get_running_loop().time()
+        if now - self.last_sweep < DELIVERY_SWEEP_INTERVAL:
+            return
+        self.last_sweep = now
+        ids = await asyncio.to_thread(_requeue_stale_claims, DELIVERY_CLAIM_TIMEOUT, self.batch_size)
+        if ids:
+            await enqueue_notifications(ids)
+            self.recovered += len(ids)
+            logger.warning(f"Re-enqueued {len(ids)} notifications stuck in 'sending'")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._sweep_stale_claims()
+            except Exception as e:
+                logger.error(f"Stale claim sweep failed: {str(e)}")
+            try:
+                deferred = await asyncio.to_thread(_release_deferred, self.batch_size)
+                if deferred:
+                    await enqueue_notifications(deferred)
+                    logger.info(f"Retry scheduler re-enqueued {len(deferred)} deferred notifications")
+            except Exception as e:
+                logger.error(f"Deferred notification scan failed: {str(e)}")
+            try:
+                ids = await asyncio.to_thread(_claim_due_retries, self.batch_size)
+                if ids:
+                    await enqueue_notifications(ids)
+                    self.retried += len(ids)
+                    logger.info(f"Retry scheduler re-enqueued {len(ids)} notifications")
+                    # A full page means more are due; scan again right away
+                    if len(ids) == self.batch_size:
+                        continue
+            except Exception as e:
+                logger.error(f"Retry scheduler failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+retry_scheduler = RetryScheduler()
+
+
+async def run_workers() -> None:
+    """Run the delivery workers as a standalone process"""
+    instrument_engine(engine, "sync")
+    if WORKER_METRICS_PORT:
+        start_http_server(WORKER_METRICS_PORT)
+    await http_clients.start()
+    # Events staged by the workers are published from this loop
+    event_hub.bind(asyncio.get_running_loop())
+    event_publisher = asyncio.create_task(publish_events())
+    await delivery_workers.start()
+    if RETRY_SCHEDULER_ENABLED:
+        await retry_scheduler.start()
+    if PARTITION_MAINTENANCE_ENABLED:
+        await partition_maintenance.start()
+    if ROLLUP_ENABLED:
+        await rollup_compactor.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await rollup_compactor.stop()
+        await partition_maintenance.stop()
+        await retry_scheduler.stop()
+        await delivery_workers.stop()
+        event_publisher.cancel()
+        await asyncio.gather(event_publisher, return_exceptions=True)
+        await delivery_queue.close()
+        await instance_limiter.close()
+        await http_clients.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_workers())
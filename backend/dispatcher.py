@@ -0,0 +1,211 @@
+"""
+In-process message dispatcher for the Evolution API proxy endpoints.
+
+sendText / sendButtons / sendList requests are accepted immediately and
+handed to a bounded queue per WhatsApp instance (tenant.wa_instance_name).
+A few sender tasks per instance drain it through the per-instance rate
+limiter, so a request never holds a worker while Evolution API is slow.
+
+- Coalescing: an identical payload for the same instance that is still
+  queued returns the already-queued message id instead of a second send.
+- Backpressure: a full instance queue raises DispatchQueueFull (HTTP 429).
+- Results: the status of each message (queued, sending, sent, failed) is
+  kept in a bounded in-memory store and can be looked up by message id on
+  the worker process that accepted it.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
+
+from integrations.evolution import send_evolution_message
+from rate_limit import instance_limiter
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", "5000"))
+DISPATCH_SENDERS_PER_INSTANCE = int(os.getenv("DISPATCH_SENDERS_PER_INSTANCE", "4"))
+DISPATCH_IDLE_TIMEOUT = float(os.getenv("DISPATCH_IDLE_TIMEOUT", "60"))
+DISPATCH_RESULT_SIZE = int(os.getenv("DISPATCH_RESULT_SIZE", "100000"))
+DISPATCH_RESULT_TTL = float(os.getenv("DISPATCH_RESULT_TTL", "3600"))
+
+# Evolution API /message endpoints exposed by the proxy
+MESSAGE_ENDPOINTS = ("sendText", "sendButtons", "sendList")
+
+
+class DispatchQueueFull(Exception):
+    """Raised when an instance's send queue is at capacity"""
+
+    def __init__(self, instance: str, retry_after: int = 1):
+        super().__init__(f"Send queue for instance {instance} is full")
+        self.instance = instance
+        self.retry_after = retry_after
+
+
+class ResultStore:
+    """Bounded message_id -> result map, oldest entries evicted first"""
+
+    def __init__(self, maxsize: int = DISPATCH_RESULT_SIZE, ttl: float = DISPATCH_RESULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.results: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def put(self, result: Dict[str, Any]) -> None:
+        self.results[result["message_id"]] = (time.monotonic() + self.ttl, result)
+        self.results.move_to_end(result["message_id"])
+        while len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.results.get(message_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic() and entry[1]["status"] in ("sent", "failed"):
+            del self.results[message_id]
+            return None
+        return entry[1]
+
+
+class InstanceQueue:
+    """Bounded send queue and sender tasks for one WhatsApp instance"""
+
+    def __init__(self, dispatcher: "MessageDispatcher", instance: str):
+        self.dispatcher = dispatcher
+        self.instance = instance
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=dispatcher.queue_size)
+        # payload fingerprint -> message_id of the queued (not yet sending) message
+        self.pending: Dict[str, str] = {}
+        self.tasks: set = set()
+
+    def ensure_senders(self) -> None:
+        while len(self.tasks) < min(self.dispatcher.senders, self.queue.qsize()):
+            task = asyncio.create_task(self._sender())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _sender(self) -> None:
+        while True:
+            try:
+                message_id, fingerprint, endpoint, payload = await asyncio.wait_for(
+                    self.queue.get(), timeout=DISPATCH_IDLE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                if self.queue.empty():
+                    # Leave the set now so a concurrent submit starts a fresh sender
+                    self.tasks.discard(asyncio.current_task())
+                    return
+                continue
+
+            self.pending.pop(fingerprint, None)
+            result = self.dispatcher.results.get(message_id)
+            try:
+                await instance_limiter.acquire(self.instance)
+                if result is not None:
+                    result["status"] = "sending"
+                response = await send_evolution_message(endpoint, payload, self.instance)
+                if result is not None:
+                    result.update(
+                        status="sent",
+                        whatsapp_id=(response.get("key") or {}).get("id"),
+                        sent_at=datetime.now().isoformat()
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to dispatch {endpoint} message {message_id} on {self.instance}: {str(e)}")
+                if result is not None:
+                    result.update(status="failed", error_message=str(e))
+            finally:
+                self.queue.task_done()
+
+
+class MessageDispatcher:
+    """Per-instance queues for proxied Evolution API messages"""
+
+    def __init__(
+        self,
+        queue_size: int = DISPATCH_QUEUE_SIZE,
+        senders: int = DISPATCH_SENDERS_PER_INSTANCE
+    ):
+        self.queue_size = queue_size
+        self.senders = senders
+        self.instances: Dict[str, InstanceQueue] = {}
+        self.results = ResultStore()
+
+    @staticmethod
+    def _fingerprint(endpoint: str, payload: dict) -> str:
+        raw = json.dumps([endpoint, payload], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def submit(self, tenant_id: str, instance: str, endpoint: str, payload: dict) -> Dict[str, Any]:
+        """
+        Queue a message for an instance. Returns its result record; `coalesced`
+        is true when an identical queued message was reused.
+        Raises DispatchQueueFull when the instance queue is at capacity.
+        """
+        if endpoint not in MESSAGE_ENDPOINTS:
+            raise ValueError(f"Unsupported message endpoint: {endpoint}")
+
+        queue = self.instances.get(instance)
+        if queue is None:
+            queue = self.instances[instance] = InstanceQueue(self, instance)
+
+        fingerprint = self._fingerprint(endpoint, payload)
+        queued_id = queue.pending.get(fingerprint)
+        if queued_id:
+            result = self.results.get(queued_id)
+            if result is not None and result["tenant_id"] == tenant_id:
+                return {**result, "coalesced": True}
+
+        message_id = str(uuid4())
+        try:
+            queue.queue.put_nowait((message_id, fingerprint, endpoint, payload))
+        except asyncio.QueueFull:
+            raise DispatchQueueFull(instance)
+
+        result = {
+            "message_id": message_id,
+            "tenant_id": tenant_id,
+            "instance": instance,
+            "type": endpoint,
+            "status": "queued",
+            "whatsapp_id": None,
+            "error_message": None,
+            "created_at": datetime.now().isoformat(),
+            "sent_at": None,
+        }
+        self.results.put(result)
+        queue.pending[fingerprint] = message_id
+        queue.ensure_senders()
+        return {**result, "coalesced": False}
+
+    def get(self, tenant_id: str, message_id: str) -> Optional[Dict[str, Any]]:
+        """Result of a dispatched message, if it belongs to the tenant"""
+        result = self.results.get(message_id)
+        if result is None or result["tenant_id"] != tenant_id:
+            return None
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            instance: {"queued": queue.queue.qsize(), "senders": len(queue.tasks)}
+            for instance, queue in self.instances.items()
+        }
+
+    async def stop(self) -> None:
+        """Cancel sender tasks; messages still queued are dropped"""
+        tasks = [task for queue in self.instances.values() for task in queue.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.instances = {}
+
+
+# Global instance for easy import
+message_dispatcher = MessageDispatcher()
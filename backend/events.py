@@ -0,0 +1,297 @@
+"""
+Live notification events for 28Hub Connect backend.
+
+GET /api/v1/28hub/{tenant_id}/events streams a tenant's events as
+Server-Sent Events, so dashboards and n8n flows no longer poll activities
+and dashboard counters:
+
+- notification.created / notification.sent / notification.failed /
+  notification.retrying: {"count", "notifications": [...]} for the rows that
+  changed in one transaction (at most EVENTS_MAX_ITEMS listed)
+- counters: {"deltas": {"pending": -1, "sent": 1, ...}} to apply to the
+  dashboard counters
+- resync: events were dropped (slow client or lost Redis connection);
+  re-read the dashboard once
+
+Events are staged on the SQLAlchemy session by the ingest, delivery and
+stats code and only published after the transaction commits. Each worker
+process keeps one EventHub fanning events out to its local subscribers.
+With REDIS_URL set, events are published to one Redis channel that every
+worker listens to, so delivery workers in other processes reach every
+connected client. Committing code never waits on Redis: events go through
+an in-process outbox that publish_events() drains in order on the event loop.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Set
+
+import orjson
+import redis.asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+EVENTS_ENABLED = os.getenv("EVENTS_ENABLED", "true").lower() == "true"
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "28hub:events")
+# Events buffered per connection before it is sent a resync instead
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_MAX_ITEMS = int(os.getenv("EVENTS_MAX_ITEMS", "100"))
+EVENTS_MAX_CONNECTIONS_PER_TENANT = int(os.getenv("EVENTS_MAX_CONNECTIONS_PER_TENANT", "20"))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+# Events waiting to be published to Redis; tenants whose events overflow it are sent a resync
+EVENTS_OUTBOX_SIZE = int(os.getenv("EVENTS_OUTBOX_SIZE", "10000"))
+# How long shutdown waits for the outbox to drain
+EVENTS_FLUSH_TIMEOUT = float(os.getenv("EVENTS_FLUSH_TIMEOUT", "5"))
+
+# Fields of a notification included in its events
+NOTIFICATION_FIELDS = (
+    "id", "type", "status", "client_name", "nf_number", "value", "retry_count",
+    "error_message", "whatsapp_id", "created_at", "sent_at", "next_attempt_at",
+)
+
+RESYNC = {"event": "resync"}
+
+
+class EventHub:
+    """Per-worker fan-out of tenant events to the connections subscribed here"""
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    def full(self, tenant_id: str) -> bool:
+        """Whether the tenant is at its per-tenant connection limit"""
+        return len(self.subscribers.get(tenant_id, ())) >= EVENTS_MAX_CONNECTIONS_PER_TENANT
+
+    def subscribe(self, tenant_id: str) -> Optional[asyncio.Queue]:
+        """Queue receiving the tenant's events, or None at the per-tenant connection limit"""
+        if self.full(tenant_id):
+            return None
+        queues = self.subscribers.setdefault(tenant_id, set())
+        queue = asyncio.Queue(self.queue_size)
+        queues.add(queue)
+        return queue
+
+    def unsubscribe(self, tenant_id: str, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(tenant_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[tenant_id]
+
+    def dispatch(self, message: Dict[str, Any]) -> None:
+        """Hand an event to the tenant's queues (event loop thread only)"""
+        for queue in self.subscribers.get(message.get("tenant_id"), ()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # The client fell behind: drop its backlog and have it re-read the dashboard
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    def resync_all(self) -> None:
+        for tenant_id in list(self.subscribers):
+            self.dispatch({**RESYNC, "tenant_id": tenant_id})
+
+    def deliver(self, message: Dict[str, Any]) -> None:
+        """dispatch() from any thread"""
+        if self.loop is None or message.get("tenant_id") not in self.subscribers:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.dispatch, message)
+        except RuntimeError:
+            # Loop closed during shutdown
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tenants": len(self.subscribers),
+            "connections": sum(len(queues) for queues in self.subscribers.values()),
+        }
+
+
+# Global instance for easy import
+event_hub = EventHub()
+
+_publisher = aioredis.from_url(REDIS_URL) if REDIS_URL and EVENTS_ENABLED else None
+# Serialized events waiting for publish_events(), created by it on the hub's loop
+_outbox: Optional[asyncio.Queue] = None
+# Tenants that lost events to a full outbox
+_overflowed: Set[str] = set()
+
+
+def _enqueue(tenant_id: str, data: bytes) -> None:
+    """Queue an event for publish_events() (event loop thread only)"""
+    if _outbox is None:
+        return
+    try:
+        _outbox.put_nowait((tenant_id, data))
+    except asyncio.QueueFull:
+        _overflowed.add(tenant_id)
+
+
+def publish(message: Dict[str, Any]) -> None:
+    """
+    Send an event to every worker's subscribers (through Redis when configured).
+    Safe to call from the event loop or a threadpool handler; never waits on Redis.
+    """
+    if _publisher is None:
+        event_hub.deliver(message)
+        return
+    if event_hub.loop is None:
+        return
+    try:
+        event_hub.loop.call_soon_threadsafe(_enqueue, message.get("tenant_id"), orjson.dumps(message))
+    except RuntimeError:
+        # Loop closed during shutdown
+        pass
+
+
+async def _send(tenant_id: str, data: bytes) -> None:
+    try:
+        await _publisher.publish(EVENTS_CHANNEL, data)
+    except Exception as e:
+        logger.error(f"Failed to publish event for {tenant_id}: {str(e)}")
+
+
+async def publish_events() -> None:
+    """
+    Publish this process's events to Redis in commit order. Runs for the
+    process's life next to event_hub.bind(); on cancellation the outbox is
+    flushed for up to EVENTS_FLUSH_TIMEOUT seconds.
+    """
+    global _outbox
+    if _publisher is None:
+        return
+    outbox = _outbox = asyncio.Queue(EVENTS_OUTBOX_SIZE)
+    try:
+        while True:
+            await _send(*await outbox.get())
+            if _overflowed and outbox.empty():
+                # The backlog is gone; have clients of tenants that lost events re-read the dashboard
+                for tenant_id in list(_overflowed):
+                    await _send(tenant_id, orjson.dumps({**RESYNC, "tenant_id": tenant_id}))
+                _overflowed.clear()
+    finally:
+        _outbox = None
+
+        async def flush():
+            while not outbox.empty():
+                await _send(*outbox.get_nowait())
+
+        try:
+            await asyncio.wait_for(flush(), EVENTS_FLUSH_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Dropped {outbox.qsize()} unpublished events on shutdown")
+        await _publisher.aclose()
+
+
+def notification_item(notification: Any) -> Dict[str, Any]:
+    """Event fields of a Notification or of a notification row dict"""
+    get = notification.get if isinstance(notification, dict) else lambda name: getattr(notification, name, None)
+    return {name: get(name) for name in NOTIFICATION_FIELDS if get(name) is not None}
+
+
+def stage_notifications(db: Session, tenant_id: str, name: str, notifications: Iterable[Any]) -> None:
+    """Publish notification.<name> for these notifications once the session commits"""
+    if not EVENTS_ENABLED:
+        return
+    staged = db.info.setdefault("staged_events", {}).setdefault(
+        (tenant_id, f"notification.{name}"), {"count": 0, "notifications": []}
+    )
+    for notification in notifications:
+        staged["count"] += 1
+        if len(staged["notifications"]) < EVENTS_MAX_ITEMS:
+            staged["notifications"].append(notification_item(notification))
+
+
+def stage_counters(db: Session, tenant_id: str, deltas: Dict[str, int]) -> None:
+    """Publish dashboard counter deltas once the session commits"""
+    if not EVENTS_ENABLED:
+        return
+    db.info.setdefault("staged_counters", {}).setdefault(tenant_id, Counter()).update(deltas)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_staged(session: Session) -> None:
+    staged = session.info.pop("staged_events", None) or {}
+    counters = session.info.pop("staged_counters", None) or {}
+    for (tenant_id, name), payload in staged.items():
+        publish({"event": name, "tenant_id": tenant_id, **payload})
+    for tenant_id, deltas in counters.items():
+        deltas = {key: value for key, value in deltas.items() if value}
+        if deltas:
+            publish({"event": "counters", "tenant_id": tenant_id, "deltas": deltas})
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_staged(session: Session, previous_transaction) -> None:
+    if previous_transaction.nested:
+        return
+    session.info.pop("staged_events", None)
+    session.info.pop("staged_counters", None)
+
+
+async def listen_for_events() -> None:
+    """
+    Feed events published by any worker to this worker's hub. Runs for the
+    app's life; local subscribers are sent a resync after a reconnect since
+    events may have been missed.
+    """
+    if _publisher is None:
+        return
+    client = aioredis.from_url(REDIS_URL)
+    try:
+        while True:
+            try:
+                pubsub = client.pubsub()
+                await pubsub.subscribe(EVENTS_CHANNEL)
+                event_hub.resync_all()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        event_hub.dispatch(orjson.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event listener error: {str(e)}")
+                await asyncio.sleep(1.0)
+    finally:
+        await client.aclose()
+
+
+def format_sse(message: Dict[str, Any]) -> bytes:
+    payload = {key: value for key, value in message.items() if key not in ("event", "tenant_id")}
+    return b"event: " + message["event"].encode() + b"\ndata: " + orjson.dumps(payload) + b"\n\n"
+
+
+async def stream_events(tenant_id: str, snapshot: Dict[str, Any]):
+    """
+    SSE body: current counters, then the tenant's events until the client
+    disconnects. Subscribes only once the response starts streaming, so a
+    client gone before then never holds a connection slot.
+    """
+    queue = event_hub.subscribe(tenant_id)
+    if queue is None:
+        # Lost a race for the last slot since the handler checked; the client reconnects
+        return
+    try:
+        yield format_sse({"event": "snapshot", "counters": snapshot})
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream
+                yield b": keepalive\n\n"
+                continue
+            yield format_sse(message)
+    finally:
+        event_hub.unsubscribe(tenant_id, queue)
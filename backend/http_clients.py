@@ -0,0 +1,174 @@
+"""
+Shared HTTP clients for 28Hub Connect backend.
+
+Keeps one pooled httpx.AsyncClient per upstream (Evolution API, n8n, EvoAI)
+for the whole application life, so keep-alive connections are reused instead
+of paying a TCP/TLS handshake on every call. Clients are opened in the FastAPI
+lifespan hook and closed on shutdown. Each client's transport counts the
+requests it has in flight (until the response body is closed), which the
+admin upstreams endpoint reports against the pool limits.
+"""
+import os
+import logging
+from typing import Dict, Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Default pool limits, overridable per upstream with <NAME>_MAX_CONNECTIONS etc.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+
+def _upstream_config(name: str, default_timeout: float) -> Dict[str, Any]:
+    """Build the client settings for an upstream from <NAME>_* environment variables"""
+    prefix = name.upper()
+    return {
+        "timeout": float(os.getenv(f"{prefix}_TIMEOUT", default_timeout)),
+        "max_connections": int(os.getenv(f"{prefix}_MAX_CONNECTIONS", HTTP_MAX_CONNECTIONS)),
+        "max_keepalive_connections": int(
+            os.getenv(f"{prefix}_MAX_KEEPALIVE_CONNECTIONS", HTTP_MAX_KEEPALIVE_CONNECTIONS)
+        ),
+        "http2": os.getenv(f"{prefix}_HTTP2", "false").lower() == "true",
+    }
+
+
+UPSTREAMS = {
+    "evolution": _upstream_config("evolution", 30.0),
+    "n8n": _upstream_config("n8n", 10.0),
+    "evoai": _upstream_config("evoai", 30.0),
+}
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body that reports when it is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+                self.on_close = None
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport and counts its in-flight and total requests"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.in_flight = 0
+        self.requests = 0
+
+    def _finished(self) -> None:
+        self.in_flight -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self._finished()
+            raise
+        response.stream = _TrackedStream(response.stream, self._finished)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HTTPClientRegistry:
+    """Registry of long-lived pooled clients, one per upstream"""
+
+    def __init__(self, upstreams: Dict[str, Dict[str, Any]] = None):
+        self.upstreams = upstreams or UPSTREAMS
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.transports: Dict[str, CountingTransport] = {}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        config = self.upstreams[name]
+        http2 = config["http2"]
+        if http2 and not _http2_available():
+            logger.warning(f"HTTP/2 requested for {name} but 'h2' is not installed; using HTTP/1.1")
+            http2 = False
+
+        transport = CountingTransport(httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            http2=http2
+        ))
+        self.transports[name] = transport
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(config["timeout"], connect=min(HTTP_CONNECT_TIMEOUT, config["timeout"])),
+            transport=transport
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        Return the shared client for an upstream.
+        Clients are created lazily so code running outside the app lifespan
+        (standalone workers, scripts) still gets a pooled client.
+        """
+        client = self.clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self.clients[name] = client
+        return client
+
+    async def start(self) -> None:
+        for name in self.upstreams:
+            self.get(name)
+        logger.info(f"HTTP clients ready for upstreams: {', '.join(self.upstreams)}")
+
+    async def close(self) -> None:
+        for name, client in self.clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Failed to close HTTP client for {name}: {str(e)}")
+        self.clients = {}
+        self.transports = {}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Requests in flight per upstream against its pool limits"""
+        result = {}
+        for name, config in self.upstreams.items():
+            client = self.clients.get(name)
+            transport = self.transports.get(name)
+            result[name] = {
+                "open": client is not None and not client.is_closed,
+                "max_connections": config["max_connections"],
+                "max_keepalive_connections": config["max_keepalive_connections"],
+                "timeout": config["timeout"],
+                "http2": config["http2"],
+                "in_flight": transport.in_flight if transport else 0,
+                "requests": transport.requests if transport else 0,
+            }
+        return result
+
+
+# Global instance for easy import
+http_clients = HTTPClientRegistry()
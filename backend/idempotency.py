@@ -0,0 +1,148 @@
+"""
+Idempotent ERP ingestion for 28Hub Connect backend.
+
+Each ERP event gets an idempotency key: the Idempotency-Key header (or the
+event's `idempotency_key` field in batches), otherwise one derived from
+(type, nf_number). The notification_idempotency_keys table, keyed by
+(tenant_id, idempotency_key), is the source of truth: it is written in the
+same transaction as the notification, since unique indexes on the partitioned
+notifications table cannot span partitions. A small in-process LRU backed by
+Redis answers retries of recent events without touching the database at all.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import redis.asyncio as redis
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import NotificationIdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "100000"))
+IDEMPOTENCY_DERIVE_KEYS = os.getenv("IDEMPOTENCY_DERIVE_KEYS", "true").lower() == "true"
+
+
+def idempotency_key_for(data: dict, header_key: Optional[str] = None) -> Optional[str]:
+    """Explicit key if given, otherwise type:nf_number when the event has an NF number"""
+    key = header_key or data.get("idempotency_key")
+    if key:
+        return str(key)[:255]
+    if IDEMPOTENCY_DERIVE_KEYS and data.get("nf_number"):
+        return f"{data.get('type', 'sale')}:{data['nf_number']}"
+    return None
+
+
+class IdempotencyCache:
+    """Recently seen (tenant_id, key) -> notification_id, local LRU in front of Redis"""
+
+    def __init__(self, maxsize: int = IDEMPOTENCY_CACHE_SIZE, ttl: int = IDEMPOTENCY_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local: "OrderedDict[tuple, str]" = OrderedDict()
+        self.redis = redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+        self._lock = threading.Lock()
+
+    def _redis_key(self, tenant_id: str, key: str) -> str:
+        return f"28hub:idem:{tenant_id}:{key}"
+
+    def _remember(self, tenant_id: str, key: str, notification_id: str) -> None:
+        with self._lock:
+            self.local[(tenant_id, key)] = notification_id
+            self.local.move_to_end((tenant_id, key))
+            while len(self.local) > self.maxsize:
+                self.local.popitem(last=False)
+
+    async def get(self, tenant_id: str, key: str) -> Optional[str]:
+        with self._lock:
+            notification_id = self.local.get((tenant_id, key))
+        if notification_id or self.redis is None:
+            return notification_id
+        try:
+            notification_id = await self.redis.get(self._redis_key(tenant_id, key))
+        except Exception as e:
+            logger.error(f"Idempotency lookup failed: {str(e)}")
+            return None
+        if notification_id:
+            self._remember(tenant_id, key, notification_id)
+        return notification_id
+
+    async def get_many(self, tenant_id: str, keys: Iterable[str]) -> Dict[str, str]:
+        """Known notification ids for many keys: local hits, then one MGET for the rest"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                notification_id = self.local.get((tenant_id, key))
+                if notification_id:
+                    found[key] = notification_id
+        missing = list({key for key in keys if key not in found})
+        if not missing or self.redis is None:
+            return found
+        try:
+            values = await self.redis.mget([self._redis_key(tenant_id, key) for key in missing])
+        except Exception as e:
+            logger.error(f"Idempotency lookup failed: {str(e)}")
+            return found
+        for key, notification_id in zip(missing, values):
+            if notification_id:
+                self._remember(tenant_id, key, notification_id)
+                found[key] = notification_id
+        return found
+
+    async def set(self, tenant_id: str, key: str, notification_id: str) -> None:
+        await self.set_many(tenant_id, {key: notification_id})
+
+    async def set_many(self, tenant_id: str, ids_by_key: Dict[str, str]) -> None:
+        for key, notification_id in ids_by_key.items():
+            self._remember(tenant_id, key, notification_id)
+        if self.redis is None or not ids_by_key:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, notification_id in ids_by_key.items():
+                    pipe.set(self._redis_key(tenant_id, key), notification_id, ex=self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Idempotency store failed: {str(e)}")
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            await self.redis.aclose()
+
+
+idempotency_cache = IdempotencyCache()
+
+
+def find_existing(db: Session, tenant_id: str, keys: Iterable[str]) -> Dict[str, str]:
+    """Map already-ingested idempotency keys of a tenant to their notification ids"""
+    keys = list(set(keys))
+    existing = {}
+    for start in range(0, len(keys), 1000):
+        rows = db.execute(
+            select(NotificationIdempotencyKey.idempotency_key, NotificationIdempotencyKey.notification_id).where(
+                NotificationIdempotencyKey.tenant_id == tenant_id,
+                NotificationIdempotencyKey.idempotency_key.in_(keys[start:start + 1000])
+            )
+        ).all()
+        existing.update({key: notification_id for key, notification_id in rows})
+    return existing
+
+
+def key_rows(tenant_id: str, notifications: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """notification_idempotency_keys rows for notification rows that carry a key"""
+    return [
+        {
+            "tenant_id": tenant_id,
+            "idempotency_key": row["idempotency_key"],
+            "notification_id": row["id"],
+            "created_at": row["created_at"],
+        }
+        for row in notifications
+        if row.get("idempotency_key")
+    ]
@@ -0,0 +1,175 @@
+"""
+ERP event ingestion for 28Hub Connect backend.
+
+Turns ERP webhook payloads into notification rows. Used by the single-event
+webhook and by the batch endpoint, which validates a whole JSON array or
+NDJSON stream in one pass and inserts it in a single transaction: a
+multi-row INSERT for small batches, Postgres COPY for large ones.
+"""
+import csv
+import io
+import json
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from events import stage_notifications
+from models import Notification, NotificationIdempotencyKey
+from idempotency import find_existing, key_rows
+from stats import record_created
+
+logger = logging.getLogger(__name__)
+
+ERP_BATCH_MAX_ITEMS = int(os.getenv("ERP_BATCH_MAX_ITEMS", "100000"))
+# Batches at least this large are loaded with COPY on PostgreSQL
+ERP_COPY_THRESHOLD = int(os.getenv("ERP_COPY_THRESHOLD", "1000"))
+
+NOTIFICATION_TYPES = ("sale", "quote", "payment")
+
+NOTIFICATION_COLUMNS = (
+    "id", "tenant_id", "type", "client_name", "client_phone", "value", "nf_number",
+    "products", "status", "retry_count", "created_at", "telefone", "valor", "event_type",
+    "idempotency_key",
+)
+
+
+def notification_values(tenant_id: str, data: dict) -> Dict[str, Any]:
+    """Map an ERP payload (current and legacy field names) to notification columns"""
+    return {
+        "tenant_id": tenant_id,
+        "type": data.get('type', 'sale'),
+        "client_name": data.get('client_name'),
+        "client_phone": data.get('client_phone') or data.get('telefone'),
+        "value": data.get('value') or data.get('valor'),
+        "nf_number": data.get('nf_number'),
+        "products": data.get('products'),
+        "status": 'pending',
+        # Legacy fields for backward compatibility
+        "telefone": data.get('telefone') or data.get('client_phone'),
+        "valor": data.get('valor') or data.get('value'),
+        "event_type": data.get('type', 'sale'),
+    }
+
+
+def validate_event(data: Any) -> Optional[str]:
+    """Return an error message for an invalid ERP event, or None"""
+    if not isinstance(data, dict):
+        return "Event must be a JSON object"
+    if data.get("type") not in NOTIFICATION_TYPES:
+        return f"Field 'type' must be one of: {', '.join(NOTIFICATION_TYPES)}"
+    for field in ("value", "valor"):
+        if data.get(field) is not None:
+            try:
+                float(data[field])
+            except (TypeError, ValueError):
+                return f"Field '{field}' must be numeric"
+    if data.get("products") is not None and not isinstance(data["products"], list):
+        return "Field 'products' must be a list"
+    return None
+
+
+def parse_events(body: bytes, content_type: str) -> List[Tuple[Any, Optional[str]]]:
+    """
+    Parse a batch body into (event, parse_error) pairs.
+    NDJSON lines that fail to parse become per-item errors; a malformed
+    JSON array raises ValueError.
+    """
+    if "ndjson" in (content_type or "") or "jsonlines" in (content_type or ""):
+        events = []
+        for line in body.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append((json.loads(line), None))
+            except json.JSONDecodeError as e:
+                events.append((None, f"Invalid JSON: {e.msg}"))
+        return events
+
+    payload = json.loads(body or b"null")
+    if not isinstance(payload, list):
+        raise ValueError("Body must be a JSON array of events")
+    return [(event, None) for event in payload]
+
+
+def _copy_rows(db, rows: List[Dict[str, Any]]) -> None:
+    """Bulk load rows with COPY on the session's own connection (same transaction)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            "\\N" if row.get(column) is None else
+            json.dumps(row[column]) if column == "products" else
+            row[column].isoformat() if isinstance(row[column], datetime) else
+            row[column]
+            for column in NOTIFICATION_COLUMNS
+        ])
+    buffer.seek(0)
+
+    statement = (
+        f"COPY notifications ({', '.join(NOTIFICATION_COLUMNS)}) "
+        f"FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    )
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    except Exception as e:
+        # Raw DBAPI errors bypass SQLAlchemy; surface unique violations the same way
+        if getattr(e, "pgcode", None) == "23505":
+            raise IntegrityError(statement, None, e)
+        raise
+    finally:
+        cursor.close()
+
+
+def insert_notifications(
+    tenant_id: str,
+    rows: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """
+    Insert notification rows and update the tenant counters in one transaction.
+    Rows whose idempotency key was already ingested are skipped. Returns the
+    inserted rows and a map of skipped keys to their original notification ids.
+    """
+    now = datetime.now()
+    for row in rows:
+        row.setdefault("id", str(uuid4()))
+        row.setdefault("retry_count", 0)
+        row.setdefault("created_at", now)
+        row.setdefault("idempotency_key", None)
+
+    db = SessionLocal()
+    try:
+        # A concurrent request may insert the same keys between our check and
+        # our insert; the key table's primary key rejects the batch and we retry once.
+        for attempt in range(2):
+            keys = [row["idempotency_key"] for row in rows if row["idempotency_key"]]
+            existing = find_existing(db, tenant_id, keys) if keys else {}
+            new_rows = [row for row in rows if row["idempotency_key"] not in existing]
+            try:
+                if new_rows:
+                    keys_to_claim = key_rows(tenant_id, new_rows)
+                    if keys_to_claim:
+                        db.execute(insert(NotificationIdempotencyKey), keys_to_claim)
+                    if db.get_bind().dialect.name == "postgresql" and len(new_rows) >= ERP_COPY_THRESHOLD:
+                        _copy_rows(db, new_rows)
+                    else:
+                        db.execute(insert(Notification), new_rows)
+                    record_created(db, tenant_id, len(new_rows))
+                    stage_notifications(db, tenant_id, "created", new_rows)
+                db.commit()
+                return new_rows, existing
+            except IntegrityError:
+                db.rollback()
+                if attempt:
+                    raise
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -5,5 +5,18 @@ This package contains integration modules for external services.
 """
 
 from integrations.evoai import EvoAIIntegration, evoai
+from integrations.evolution import (
+    send_whatsapp_message,
+    send_evolution_message,
+    create_whatsapp_instance,
+    connect_whatsapp_instance,
+)
 
-__all__ = ["EvoAIIntegration", "evoai"]
+__all__ = [
+    "EvoAIIntegration",
+    "evoai",
+    "send_whatsapp_message",
+    "send_evolution_message",
+    "create_whatsapp_instance",
+    "connect_whatsapp_instance",
+]
@@ -3,17 +3,111 @@ EvoAI Integration Module
 
 This module provides integration with EvoAI for conversational AI agents.
 EvoAI is available only for Pro and Enterprise plans.
+
+Agent, session list and session message reads go through a short-lived
+read-through cache; concurrent identical reads share one upstream call.
+All requests except the health check go through the EvoAI guard (circuit
+breaker, adaptive concurrency limit; hedging and retries for reads).
 """
 
 import httpx
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, Optional, Set
+import asyncio
+import json
 import os
 import logging
+import time
+
+from http_clients import http_clients
+from resilience import upstream_guards
 
 logger = logging.getLogger(__name__)
 
 EVOAI_URL = os.getenv("EVOAI_URL", "http://evoai-backend:8000")
 EVOAI_API_KEY = os.getenv("EVOAI_API_KEY", "28hub-evoai-integration-2025")
+# Max seconds to wait between two chunks of a streamed agent reply
+EVOAI_STREAM_READ_TIMEOUT = float(os.getenv("EVOAI_STREAM_READ_TIMEOUT", "60"))
+# Read cache TTLs (seconds) for agent metadata and session lists/messages
+EVOAI_AGENT_CACHE_TTL = float(os.getenv("EVOAI_AGENT_CACHE_TTL", "60"))
+EVOAI_SESSION_CACHE_TTL = float(os.getenv("EVOAI_SESSION_CACHE_TTL", "10"))
+EVOAI_CACHE_SIZE = int(os.getenv("EVOAI_CACHE_SIZE", "10000"))
+
+
+class ReadCache:
+    """
+    TTL cache for upstream reads with request collapsing: while a key is
+    being loaded, other callers await the same in-flight call. Keys are
+    indexed by their group, key[:2] (e.g. ("sessions", agent_id)), so
+    invalidation drops exactly the keys of the given groups.
+    """
+
+    def __init__(self, maxsize: int = EVOAI_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.groups: Dict[tuple, Set[tuple]] = {}
+        self.inflight: Dict[tuple, asyncio.Future] = {}
+        # Bumped on invalidation so loads started before it are not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    async def get_or_load(self, key: tuple, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self.collapsed += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        generation = self.generation
+        future = asyncio.ensure_future(loader())
+        self.inflight[key] = future
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+        if generation == self.generation:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            self.groups.setdefault(key[:2], set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+        return value
+
+    def _remove(self, key: tuple) -> None:
+        self.entries.pop(key, None)
+        keys = self.groups.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.groups[key[:2]]
+
+    def invalidate(self, *groups: tuple) -> None:
+        """Drop the cached entries of these key groups"""
+        self.generation += 1
+        for group in groups:
+            for key in list(self.groups.get(group, ())):
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.collapsed
+        return {
+            "size": len(self.entries),
+            "inflight": len(self.inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "hit_ratio": round((self.hits + self.collapsed) / lookups, 3) if lookups else None,
+        }
 
 
 class EvoAIIntegration:
@@ -29,6 +123,40 @@ class EvoAIIntegration:
         """
         self.base_url = base_url or EVOAI_URL
         self.api_key = api_key or EVOAI_API_KEY
+        self.cache = ReadCache()
+
+    def invalidate_agent(self, agent_id: str) -> None:
+        """Forget cached reads for an agent (metadata and session lists)"""
+        self.cache.invalidate(("agent", agent_id), ("sessions", agent_id))
+
+    def invalidate_conversation(self, agent_id: str, external_id: str) -> None:
+        """Forget cached session lists and history touched by a new chat message"""
+        # History is read by the external id, or by EvoAI's own "<external_id>_<agent_id>" session id
+        self.cache.invalidate(
+            ("sessions", agent_id),
+            ("messages", external_id),
+            ("messages", f"{external_id}_{agent_id}")
+        )
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        idempotent: bool = False,
+        adaptive: bool = True,
+        allow_404: bool = False,
+        **kwargs
+    ) -> httpx.Response:
+        """Guarded EvoAI request; raises httpx.HTTPError for error statuses"""
+        client = http_clients.get("evoai")
+
+        async def request():
+            response = await client.request(method, f"{self.base_url}{path}", **kwargs)
+            if not (allow_404 and response.status_code == 404):
+                response.raise_for_status()
+            return response
+
+        return await upstream_guards.get("evoai").call(request, idempotent=idempotent, adaptive=adaptive)
 
     def _get_headers(self) -> Dict[str, str]:
         """Get request headers with authentication"""
@@ -45,17 +173,17 @@ class EvoAIIntegration:
             True if service is healthy, False otherwise
         """
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/",
-                    timeout=5.0
-                )
-                is_healthy = response.status_code == 200
-                if is_healthy:
-                    logger.info("EvoAI health check passed")
-                else:
-                    logger.warning(f"EvoAI health check failed: status {response.status_code}")
-                return is_healthy
+            client = http_clients.get("evoai")
+            response = await client.get(
+                f"{self.base_url}/",
+                timeout=5.0
+            )
+            is_healthy = response.status_code == 200
+            if is_healthy:
+                logger.info("EvoAI health check passed")
+            else:
+                logger.warning(f"EvoAI health check failed: status {response.status_code}")
+            return is_healthy
         except Exception as e:
             logger.error(f"EvoAI health check error: {str(e)}")
             return False
@@ -107,16 +235,15 @@ class EvoAIIntegration:
                 }
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/v1/agents",
-                    headers=self._get_headers(),
-                    json=agent_payload
-                )
-                response.raise_for_status()
-                agent_data = response.json()
-                logger.info(f"Created EvoAI agent {agent_data.get('id')} for tenant {tenant_id}")
-                return agent_data
+            response = await self._request(
+                "POST",
+                "/api/v1/agents",
+                headers=self._get_headers(),
+                json=agent_payload
+            )
+            agent_data = response.json()
+            logger.info(f"Created EvoAI agent {agent_data.get('id')} for tenant {tenant_id}")
+            return agent_data
         except httpx.HTTPError as e:
             logger.error(f"Failed to create EvoAI agent: {str(e)}")
             raise
@@ -131,17 +258,23 @@ class EvoAIIntegration:
         Returns:
             Agent data or None if not found
         """
+        return await self.cache.get_or_load(
+            ("agent", agent_id), EVOAI_AGENT_CACHE_TTL, lambda: self._fetch_agent(agent_id)
+        )
+
+    async def _fetch_agent(self, agent_id: str) -> Optional[Dict[str, Any]]:
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/api/v1/agents/{agent_id}",
-                    headers=self._get_headers(),
-                    timeout=10.0
-                )
-                if response.status_code == 404:
-                    return None
-                response.raise_for_status()
-                return response.json()
+            response = await self._request(
+                "GET",
+                f"/api/v1/agents/{agent_id}",
+                idempotent=True,
+                allow_404=True,
+                headers=self._get_headers(),
+                timeout=10.0
+            )
+            if response.status_code == 404:
+                return None
+            return response.json()
         except httpx.HTTPError as e:
             logger.error(f"Failed to get EvoAI agent {agent_id}: {str(e)}")
             raise
@@ -162,15 +295,15 @@ class EvoAIIntegration:
             Updated agent data
         """
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.put(
-                    f"{self.base_url}/api/v1/agents/{agent_id}",
-                    headers=self._get_headers(),
-                    json=updates
-                )
-                response.raise_for_status()
-                logger.info(f"Updated EvoAI agent {agent_id}")
-                return response.json()
+            response = await self._request(
+                "PUT",
+                f"/api/v1/agents/{agent_id}",
+                headers=self._get_headers(),
+                json=updates
+            )
+            self.invalidate_agent(agent_id)
+            logger.info(f"Updated EvoAI agent {agent_id}")
+            return response.json()
         except httpx.HTTPError as e:
             logger.error(f"Failed to update EvoAI agent {agent_id}: {str(e)}")
             raise
@@ -186,14 +319,14 @@ class EvoAIIntegration:
             True if deleted successfully
         """
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.delete(
-                    f"{self.base_url}/api/v1/agents/{agent_id}",
-                    headers=self._get_headers()
-                )
-                response.raise_for_status()
-                logger.info(f"Deleted EvoAI agent {agent_id}")
-                return True
+            await self._request(
+                "DELETE",
+                f"/api/v1/agents/{agent_id}",
+                headers=self._get_headers()
+            )
+            self.invalidate_agent(agent_id)
+            logger.info(f"Deleted EvoAI agent {agent_id}")
+            return True
         except httpx.HTTPError as e:
             logger.error(f"Failed to delete EvoAI agent {agent_id}: {str(e)}")
             raise
@@ -226,21 +359,105 @@ class EvoAIIntegration:
                 "files": files or []
             }
 
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/v1/chat/{agent_id}/{external_id}",
-                    headers=self._get_headers(),
-                    json=payload,
-                    timeout=60.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                logger.debug(f"Sent message to EvoAI agent {agent_id}")
-                return result
+            # Completion time depends on the reply length, not on EvoAI health
+            response = await self._request(
+                "POST",
+                f"/api/v1/chat/{agent_id}/{external_id}",
+                adaptive=False,
+                headers=self._get_headers(),
+                json=payload,
+                timeout=60.0
+            )
+            result = response.json()
+            self.invalidate_conversation(agent_id, external_id)
+            logger.debug(f"Sent message to EvoAI agent {agent_id}")
+            return result
         except httpx.HTTPError as e:
             logger.error(f"Failed to send message to EvoAI agent {agent_id}: {str(e)}")
             raise
 
+    async def stream_message(
+        self,
+        agent_id: str,
+        external_id: str,
+        message: str,
+        files: Optional[list] = None
+    ) -> httpx.Response:
+        """
+        Open a streaming chat request to an AI agent
+
+        The response headers are read before returning so upstream errors
+        surface here; the body is left unread for iter_sse. The caller owns
+        the response and must consume it with iter_sse (which closes it).
+
+        Args:
+            agent_id: Agent identifier
+            external_id: External user/session identifier
+            message: User message
+            files: Optional list of files to send
+
+        Returns:
+            Open httpx response
+
+        Raises:
+            httpx.HTTPError: If the request fails
+        """
+        try:
+            payload = {
+                "message": message,
+                "files": files or [],
+                "stream": True
+            }
+
+            client = http_clients.get("evoai")
+            request = client.build_request(
+                "POST",
+                f"{self.base_url}/api/v1/chat/{agent_id}/{external_id}",
+                headers={**self._get_headers(), "Accept": "text/event-stream"},
+                json=payload,
+                timeout=httpx.Timeout(EVOAI_STREAM_READ_TIMEOUT, connect=5.0)
+            )
+
+            async def open_stream():
+                response = await client.send(request, stream=True)
+                if response.is_error:
+                    await response.aread()
+                    await response.aclose()
+                    response.raise_for_status()
+                return response
+
+            # Only opening the stream is guarded; the relay is not held to a slot
+            response = await upstream_guards.get("evoai").call(open_stream, adaptive=False)
+            self.invalidate_conversation(agent_id, external_id)
+            return response
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to stream message to EvoAI agent {agent_id}: {str(e)}")
+            raise
+
+    async def iter_sse(self, response: httpx.Response) -> AsyncIterator[bytes]:
+        """
+        Relay a response opened by stream_message as Server-Sent Events
+
+        Event streams are passed through chunk by chunk as they arrive,
+        decoded if EvoAI compressed them (gzip/deflate). A plain JSON reply
+        (agent without streaming) is sent as a single data event. Ends with
+        a `done` event, or an `error` event if the upstream stream breaks.
+        Always closes the response.
+        """
+        try:
+            if response.headers.get("content-type", "").startswith("text/event-stream"):
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+            else:
+                body = await response.aread()
+                yield b"data: " + body.replace(b"\n", b"") + b"\n\n"
+            yield b"event: done\ndata: {}\n\n"
+        except httpx.HTTPError as e:
+            logger.error(f"EvoAI stream interrupted: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n".encode()
+        finally:
+            await response.aclose()
+
     async def get_session_messages(
         self,
         session_id: str
@@ -254,15 +471,20 @@ class EvoAIIntegration:
         Returns:
             List of messages
         """
+        return await self.cache.get_or_load(
+            ("messages", session_id), EVOAI_SESSION_CACHE_TTL, lambda: self._fetch_session_messages(session_id)
+        )
+
+    async def _fetch_session_messages(self, session_id: str) -> list:
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/api/v1/sessions/{session_id}/messages",
-                    headers=self._get_headers(),
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
+            response = await self._request(
+                "GET",
+                f"/api/v1/sessions/{session_id}/messages",
+                idempotent=True,
+                headers=self._get_headers(),
+                timeout=10.0
+            )
+            return response.json()
         except httpx.HTTPError as e:
             logger.error(f"Failed to get session messages: {str(e)}")
             raise
@@ -284,16 +506,23 @@ class EvoAIIntegration:
         Returns:
             List of sessions
         """
+        return await self.cache.get_or_load(
+            ("sessions", agent_id, skip, limit),
+            EVOAI_SESSION_CACHE_TTL,
+            lambda: self._fetch_agent_sessions(agent_id, skip, limit)
+        )
+
+    async def _fetch_agent_sessions(self, agent_id: str, skip: int, limit: int) -> list:
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/api/v1/sessions/agent/{agent_id}",
-                    headers=self._get_headers(),
-                    params={"skip": skip, "limit": limit},
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json()
+            response = await self._request(
+                "GET",
+                f"/api/v1/sessions/agent/{agent_id}",
+                idempotent=True,
+                headers=self._get_headers(),
+                params={"skip": skip, "limit": limit},
+                timeout=10.0
+            )
+            return response.json()
         except httpx.HTTPError as e:
             logger.error(f"Failed to get agent sessions: {str(e)}")
             raise
@@ -341,14 +570,13 @@ class EvoAIIntegration:
             API key or None if not found
         """
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/v1/agents/{agent_id}/share",
-                    headers=self._get_headers(),
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return response.json().get("api_key")
+            response = await self._request(
+                "POST",
+                f"/api/v1/agents/{agent_id}/share",
+                headers=self._get_headers(),
+                timeout=10.0
+            )
+            return response.json().get("api_key")
         except httpx.HTTPError as e:
             logger.error(f"Failed to get agent API key: {str(e)}")
             return None
@@ -0,0 +1,144 @@
+"""
+Evolution API Integration Module
+
+This module provides the WhatsApp helpers used to talk to Evolution API.
+They are shared by the HTTP handlers and the background delivery workers.
+Calls go through the Evolution API guard (circuit breaker and adaptive
+concurrency limit); while it rejects calls, helpers raise HTTP 503.
+"""
+
+import httpx
+from fastapi import HTTPException, status
+import os
+import logging
+
+from http_clients import http_clients
+from resilience import UpstreamUnavailable, upstream_guards
+
+logger = logging.getLogger(__name__)
+
+# Evolution API configuration
+EVOLUTION_URL = os.getenv("EVOLUTION_URL", "http://28hub-evolution:8080")
+EVOLUTION_API_KEY = os.getenv("EVOLUTION_API_KEY", "28hub-secret-2025")
+
+
+def _unavailable(e: UpstreamUnavailable) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Evolution API unavailable: {str(e)}",
+        headers={"Retry-After": str(max(1, int(e.retry_after)))}
+    )
+
+
+async def _request(method: str, url: str, **kwargs) -> dict:
+    """Guarded Evolution API request; raises httpx.HTTPError on failure"""
+    client = http_clients.get("evolution")
+
+    async def request():
+        response = await client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    return await upstream_guards.get("evolution").call(request)
+
+
+def format_phone(phone: str) -> str:
+    """
+    Format phone number (remove special characters, add @s.whatsapp.net)
+    """
+    formatted_phone = phone.replace("+", "").replace("(", "").replace(")", "").replace(" ", "").replace("-", "")
+    if "@" not in formatted_phone:
+        formatted_phone = f"{formatted_phone}@s.whatsapp.net"
+    return formatted_phone
+
+
+async def send_whatsapp_message(phone: str, message: str, instance: str = "default") -> dict:
+    """
+    Send WhatsApp message using Evolution API
+    """
+    try:
+        url = f"{EVOLUTION_URL}/message/sendText/{instance}"
+        headers = {
+            "Content-Type": "application/json",
+            "apikey": EVOLUTION_API_KEY
+        }
+        payload = {
+            "number": format_phone(phone),
+            "text": message
+        }
+
+        return await _request("POST", url, headers=headers, json=payload)
+    except UpstreamUnavailable as e:
+        logger.warning(f"Skipping WhatsApp message: {e}")
+        raise _unavailable(e) from e
+    except httpx.HTTPError as e:
+        logger.error(f"Error sending WhatsApp message: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to send WhatsApp message: {str(e)}"
+        )
+
+
+async def send_evolution_message(endpoint: str, payload: dict, instance: str = "default") -> dict:
+    """
+    Send a prepared message payload to an Evolution API /message endpoint
+    (sendText, sendButtons, sendList, ...). Raises httpx.HTTPError on failure,
+    including UpstreamUnavailable while the guard rejects calls.
+    """
+    url = f"{EVOLUTION_URL}/message/{endpoint}/{instance}"
+    headers = {
+        "Content-Type": "application/json",
+        "apikey": EVOLUTION_API_KEY
+    }
+    payload = {**payload, "number": format_phone(payload["number"])}
+
+    return await _request("POST", url, headers=headers, json=payload)
+
+
+async def create_whatsapp_instance(instance_name: str) -> dict:
+    """
+    Create a new WhatsApp instance in Evolution API
+    """
+    try:
+        url = f"{EVOLUTION_URL}/instance/create"
+        headers = {
+            "Content-Type": "application/json",
+            "apikey": EVOLUTION_API_KEY
+        }
+        payload = {
+            "instanceName": instance_name,
+            "qrcode": True,
+            "integration": "WHATSAPP-BAILEYS"
+        }
+
+        return await _request("POST", url, headers=headers, json=payload)
+    except UpstreamUnavailable as e:
+        raise _unavailable(e) from e
+    except httpx.HTTPError as e:
+        logger.error(f"Error creating WhatsApp instance: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create WhatsApp instance: {str(e)}"
+        )
+
+
+async def connect_whatsapp_instance(instance_name: str) -> dict:
+    """
+    Connect an existing WhatsApp instance
+    """
+    try:
+        url = f"{EVOLUTION_URL}/instance/connect/{instance_name}"
+        headers = {
+            "Content-Type": "application/json",
+            "apikey": EVOLUTION_API_KEY
+        }
+
+        return await _request("GET", url, headers=headers)
+    except UpstreamUnavailable as e:
+        raise _unavailable(e) from e
+    except httpx.HTTPError as e:
+        logger.error(f"Error connecting WhatsApp instance: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to connect WhatsApp instance: {str(e)}"
+        )
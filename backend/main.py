@@ -1,26 +1,54 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Header
+from fastapi import FastAPI, HTTPException, Depends, status, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import select, func
+from fastapi.responses import Response, StreamingResponse
+from contextlib import asynccontextmanager
+from sqlalchemy import select, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime, timedelta
-import os
-import httpx
+import asyncio
 import secrets
 import logging
+from uuid import uuid4
 
 # Import models and database configuration
-from models import Tenant, Notification, Template, Base
-from database import engine, SessionLocal
+from models import Tenant, Notification, NotificationIdempotencyKey, Template, TenantNotificationStats, DailyStat, Base
+from database import engine, SessionLocal, AsyncSessionLocal, async_engine, get_async_db
 from integrations.evoai import evoai
-
-# Evolution API configuration
-EVOLUTION_URL = os.getenv("EVOLUTION_URL", "http://28hub-evolution:8080")
-EVOLUTION_API_KEY = os.getenv("EVOLUTION_API_KEY", "28hub-secret-2025")
-
-# N8N webhook configuration
-N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://n8n:5678/webhook/28hub")
+from http_clients import http_clients
+from rate_limit import instance_limiter
+from resilience import upstream_guards
+from idempotency import find_existing, idempotency_cache, idempotency_key_for
+from ingest import ERP_BATCH_MAX_ITEMS, insert_notifications, notification_values, parse_events, validate_event
+from pagination import apply_cursor, next_cursor
+from stats import get_tenant_stats, rebuild_tenant_stats, record_created, record_transition
+from tenant_cache import TenantSnapshot, tenant_cache, invalidate_tenant, listen_for_invalidations
+from integrations.evolution import send_whatsapp_message
+from rendering import TemplateError, compile_template, render_message, template_cache
+from dispatcher import DispatchQueueFull, message_dispatcher
+from partitions import PARTITION_MAINTENANCE_ENABLED, partition_maintenance
+from rollups import ROLLUP_ENABLED, rollup_compactor
+from admin_stats import PLAN_PRICES, plan_summary
+from responses import ORJSONResponse, row_dicts
+from metrics import MetricsMiddleware, count_notifications, instrument_engine, render_metrics
+from profiling import SQL_PROFILING_ENABLED, enable_profiling
+from events import event_hub, listen_for_events, publish_events, stage_notifications, stream_events
+from delivery import (
+    delivery_queue,
+    delivery_workers,
+    batch_sender,
+    enqueue_notification,
+    enqueue_notifications,
+    retry_scheduler,
+    send_claimed,
+    DELIVERY_WORKERS_ENABLED,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_SCHEDULER_ENABLED,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -86,10 +114,11 @@ def get_db():
 
 
 # Tenant validation middleware - validates api_key
-async def verify_tenant(tenant_id: str, x_api_key: str = Header(None), db: Session = Depends(get_db)) -> Tenant:
+async def verify_tenant(tenant_id: str, x_api_key: str = Header(None), db: AsyncSession = Depends(get_async_db)) -> TenantSnapshot:
     """
     Validates tenant_id and api_key for tenant-specific endpoints.
     Enforces multi-tenant isolation.
+    Successful lookups are served from the tenant auth cache.
     """
     if not x_api_key:
         raise HTTPException(
@@ -97,18 +126,23 @@ async def verify_tenant(tenant_id: str, x_api_key: str = Header(None), db: Sessi
             detail="API key header (X-API-Key) is required"
         )
     
-    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
-    if not tenant:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Tenant not found"
-        )
-    
-    if tenant.api_key != x_api_key:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Invalid API key"
-        )
+    tenant = tenant_cache.get(tenant_id, x_api_key)
+    if tenant is None:
+        db_tenant = (await db.execute(select(Tenant).where(Tenant.id == tenant_id))).scalar_one_or_none()
+        if not db_tenant:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Tenant not found"
+            )
+        
+        if db_tenant.api_key != x_api_key:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Invalid API key"
+            )
+        
+        tenant = TenantSnapshot.from_tenant(db_tenant)
+        tenant_cache.set(x_api_key, tenant)
     
     if tenant.status != "active":
         raise HTTPException(
@@ -119,95 +153,47 @@ async def verify_tenant(tenant_id: str, x_api_key: str = Header(None), db: Sessi
     return tenant
 
 
-# Evolution API helper functions
-async def send_whatsapp_message(phone: str, message: str, instance: str = "default") -> dict:
-    """
-    Send WhatsApp message using Evolution API
-    """
-    try:
-        # Format phone number (remove special characters, add @s.whatsapp.net)
-        formatted_phone = phone.replace("+", "").replace("(", "").replace(")", "").replace(" ", "").replace("-", "")
-        if "@" not in formatted_phone:
-            formatted_phone = f"{formatted_phone}@s.whatsapp.net"
-        
-        url = f"{EVOLUTION_URL}/message/sendText/{instance}"
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": EVOLUTION_API_KEY
-        }
-        payload = {
-            "number": formatted_phone,
-            "text": message
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPError as e:
-        print(f"Error sending WhatsApp message: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to send WhatsApp message: {str(e)}"
-        )
-
-
-async def create_whatsapp_instance(instance_name: str) -> dict:
-    """
-    Create a new WhatsApp instance in Evolution API
-    """
-    try:
-        url = f"{EVOLUTION_URL}/instance/create"
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": EVOLUTION_API_KEY
-        }
-        payload = {
-            "instanceName": instance_name,
-            "qrcode": True,
-            "integration": "WHATSAPP-BAILEYS"
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPError as e:
-        print(f"Error creating WhatsApp instance: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create WhatsApp instance: {str(e)}"
-        )
-
-
-async def connect_whatsapp_instance(instance_name: str) -> dict:
-    """
-    Connect an existing WhatsApp instance
-    """
-    try:
-        url = f"{EVOLUTION_URL}/instance/connect/{instance_name}"
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": EVOLUTION_API_KEY
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPError as e:
-        print(f"Error connecting WhatsApp instance: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to connect WhatsApp instance: {str(e)}"
-        )
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared upstream clients and delivery workers; release them on shutdown"""
+    await http_clients.start()
+    if DELIVERY_WORKERS_ENABLED:
+        await delivery_workers.start()
+    if RETRY_SCHEDULER_ENABLED:
+        await retry_scheduler.start()
+    if PARTITION_MAINTENANCE_ENABLED:
+        await partition_maintenance.start()
+    if ROLLUP_ENABLED:
+        await rollup_compactor.start()
+    cache_listener = asyncio.create_task(listen_for_invalidations())
+    event_hub.bind(asyncio.get_running_loop())
+    event_listener = asyncio.create_task(listen_for_events())
+    event_publisher = asyncio.create_task(publish_events())
+    yield
+    event_listener.cancel()
+    cache_listener.cancel()
+    await rollup_compactor.stop()
+    await partition_maintenance.stop()
+    await retry_scheduler.stop()
+    await batch_sender.stop()
+    await message_dispatcher.stop()
+    await delivery_workers.stop()
+    # After everything that stages events, so the outbox is flushed last
+    event_publisher.cancel()
+    await asyncio.gather(event_publisher, return_exceptions=True)
+    await delivery_queue.close()
+    await instance_limiter.close()
+    await idempotency_cache.close()
+    await http_clients.close()
+    await async_engine.dispose()
 
 
 # Initialize FastAPI app
 app = FastAPI(
     title="28hub-connect API",
     description="ERP Integration System with WhatsApp Notifications and AI Capabilities",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -217,7 +203,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # Pagination of list endpoints
 )
+app.add_middleware(MetricsMiddleware)
+
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+
+if SQL_PROFILING_ENABLED:
+    enable_profiling(app)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
 
 
 # Health check endpoint
@@ -251,7 +252,15 @@ def register_tenant(request: dict, db: Session = Depends(get_db)):
         status='active'
     )
     db.add(tenant)
-    db.commit()
+    try:
+        db.flush()
+        db.add(TenantNotificationStats(tenant_id=tenant.id))
+        db.commit()
+    except IntegrityError:
+        # A concurrent registration with the same email won the unique index
+        db.rollback()
+        raise HTTPException(400, "Email já cadastrado")
+    plan_summary.invalidate()
     db.refresh(tenant)
     
     return {
@@ -269,83 +278,51 @@ def register_tenant(request: dict, db: Session = Depends(get_db)):
 async def erp_webhook(
     tenant_id: str,
     data: dict,
-    x_api_key: str = Header(None),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None),
+    tenant: TenantSnapshot = Depends(verify_tenant),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Receives ERP webhook and creates notification.
-    Validates tenant via API key and sends to N8N for workflow processing.
+    Validates tenant via API key and enqueues the notification for delivery.
+    Retries with the same Idempotency-Key header (or the same type and
+    nf_number) return the original notification without writing.
     """
-    # Validate tenant and API key
-    if not x_api_key:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key header (X-API-Key) is required"
-        )
+    key = idempotency_key_for(data, idempotency_key)
+    if key:
+        existing_id = await idempotency_cache.get(tenant.id, key)
+        if existing_id:
+            return {"status": "duplicate", "notification_id": existing_id, "tenant_id": tenant_id}
     
-    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
-    if not tenant:
-        raise HTTPException(404, "Tenant não encontrado")
-    
-    if tenant.api_key != x_api_key:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Invalid API key"
-        )
-    
-    if tenant.status != "active":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Tenant account is suspended"
-        )
-    
-    # Create notification with all fields
+    # Create notification with all fields (legacy fields included)
     notification = Notification(
-        tenant_id=tenant.id,
-        type=data.get('type', 'sale'),
-        client_name=data.get('client_name'),
-        client_phone=data.get('client_phone') or data.get('telefone'),
-        value=data.get('value') or data.get('valor'),
-        nf_number=data.get('nf_number'),
-        products=data.get('products'),
-        status='pending'
+        id=str(uuid4()), **notification_values(tenant.id, data), idempotency_key=key, created_at=datetime.now()
     )
     
-    # Set legacy fields for backward compatibility
-    notification.telefone = data.get('telefone') or data.get('client_phone')
-    notification.valor = data.get('valor') or data.get('value')
-    notification.event_type = data.get('type', 'sale')
-    
     db.add(notification)
-    db.commit()
-    db.refresh(notification)
-    
-    # Send to N8N for workflow processing
+    if key:
+        db.add(NotificationIdempotencyKey(
+            tenant_id=tenant.id, idempotency_key=key,
+            notification_id=notification.id, created_at=notification.created_at
+        ))
+    await db.run_sync(record_created, tenant.id)
+    await db.run_sync(stage_notifications, tenant.id, "created", [notification])
     try:
-        n8n_payload = {
-            "tenant_id": tenant_id,
-            "notification_id": str(notification.id),
-            "type": notification.type,
-            "client_name": notification.client_name,
-            "client_phone": notification.client_phone,
-            "value": notification.value,
-            "nf_number": notification.nf_number,
-            "products": notification.products,
-            "api_key": x_api_key
-        }
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                f"{N8N_WEBHOOK_URL}/erp",
-                json=n8n_payload,
-                headers={"Content-Type": "application/json"}
-            )
-            # Log N8N response but don't fail webhook if N8N is down
-            logger.info(f"N8N webhook response: {response.status_code}")
-            
-    except Exception as e:
-        logger.error(f"Failed to send to N8N: {str(e)}")
-        # Don't fail the webhook if N8N is unavailable
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        existing_id = (await db.run_sync(find_existing, tenant.id, [key])).get(key) if key else None
+        if not existing_id:
+            raise
+        await idempotency_cache.set(tenant.id, key, existing_id)
+        return {"status": "duplicate", "notification_id": existing_id, "tenant_id": tenant_id}
+    
+    if key:
+        await idempotency_cache.set(tenant.id, key, notification.id)
+    count_notifications(tenant.plan, "pending")
+    
+    # Hand off to the delivery workers; the ERP caller does not wait on sends
+    await enqueue_notification(notification.id)
     
     logger.info(f"ERP webhook processed for tenant {tenant_id}: notification {notification.id}")
     
@@ -356,54 +333,101 @@ async def erp_webhook(
     }
 
 
+# 3b. Receive a batch of ERP events
+@app.post("/api/v1/28hub/{tenant_id}/webhook/erp/batch", tags=["Webhooks"])
+async def erp_webhook_batch(
+    tenant_id: str,
+    request: Request,
+    tenant: TenantSnapshot = Depends(verify_tenant)
+):
+    """
+    Receives many ERP events in one request and creates their notifications.
+    Accepts a JSON array or an NDJSON stream (Content-Type: application/x-ndjson).
+    Valid events are inserted in a single transaction; invalid ones (e.g. a
+    missing or unknown `type`) are reported per item and skipped. Events already ingested (same
+    `idempotency_key` field, or same type and nf_number) are reported with
+    their original notification id and `duplicate: true`.
+    """
+    try:
+        events = parse_events(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid batch body: {str(e)}")
+    
+    if len(events) > ERP_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {ERP_BATCH_MAX_ITEMS} events"
+        )
+    
+    events = [(event, error or validate_event(event)) for event, error in events]
+    keys = [idempotency_key_for(event) if not error else None for event, error in events]
+    # One round trip for the whole batch; insert_notifications still checks the database
+    known = await idempotency_cache.get_many(tenant.id, [key for key in keys if key])
+    
+    results = []
+    rows = []
+    ids_by_key = {}
+    for index, ((event, error), key) in enumerate(zip(events, keys)):
+        if error:
+            results.append({"index": index, "error": error})
+            continue
+        
+        existing_id = (ids_by_key.get(key) or known.get(key)) if key else None
+        if existing_id:
+            results.append({"index": index, "notification_id": existing_id, "duplicate": True})
+            continue
+        
+        row = notification_values(tenant.id, event)
+        row["id"] = str(uuid4())
+        row["idempotency_key"] = key
+        rows.append(row)
+        if key:
+            ids_by_key[key] = row["id"]
+        results.append({"index": index, "notification_id": row["id"]})
+    
+    inserted = []
+    if rows:
+        inserted, existing = await asyncio.to_thread(insert_notifications, tenant.id, rows)
+        # Rows already in the database resolve to the original notification
+        replaced = {ids_by_key[key]: original_id for key, original_id in existing.items()}
+        for result in results:
+            if result.get("notification_id") in replaced:
+                result["notification_id"] = replaced[result["notification_id"]]
+                result["duplicate"] = True
+        ids_by_key.update(existing)
+        await idempotency_cache.set_many(tenant.id, ids_by_key)
+        await enqueue_notifications([row["id"] for row in inserted])
+        count_notifications(tenant.plan, "pending", len(inserted))
+    
+    rejected = sum(1 for result in results if "error" in result)
+    
+    logger.info(f"ERP batch processed for tenant {tenant_id}: {len(inserted)} accepted, {rejected} rejected")
+    
+    return {
+        "tenant_id": tenant_id,
+        "accepted": len(inserted),
+        "duplicates": len(results) - len(inserted) - rejected,
+        "rejected": rejected,
+        "results": results
+    }
+
+
 # 4. Get tenant dashboard
 @app.get("/api/v1/28hub/{tenant_id}/dashboard", tags=["Dashboard"])
 def tenant_dashboard(
     tenant_id: str,
-    tenant: Tenant = Depends(verify_tenant),
+    tenant: TenantSnapshot = Depends(verify_tenant),
     db: Session = Depends(get_db)
 ):
     """
     Returns executive dashboard cards with tenant authentication.
     Enforces multi-tenant isolation.
     """
-    # Get notification stats
-    total_pending = db.execute(
-        select(func.count(Notification.id)).where(
-            Notification.tenant_id == tenant_id,
-            Notification.status == 'pending'
-        )
-    ).scalar() or 0
-    
-    total_failed = db.execute(
-        select(func.count(Notification.id)).where(
-            Notification.tenant_id == tenant_id,
-            Notification.status == 'failed'
-        )
-    ).scalar() or 0
-    
-    total_today = db.execute(
-        select(func.count(Notification.id)).where(
-            Notification.tenant_id == tenant_id,
-            Notification.created_at >= datetime.now().date()
-        )
-    ).scalar() or 0
-    
-    total_sent = db.execute(
-        select(func.count(Notification.id)).where(
-            Notification.tenant_id == tenant_id,
-            Notification.status == 'sent'
-        )
-    ).scalar() or 0
+    # Get notification stats from the tenant's counter row
+    stats = get_tenant_stats(db, tenant_id)
     
     # Calculate MRR contribution
-    mrr = 0
-    if tenant.plan == 'basic':
-        mrr = 47
-    elif tenant.plan == 'pro':
-        mrr = 97
-    elif tenant.plan == 'enterprise':
-        mrr = 497
+    mrr = PLAN_PRICES.get(tenant.plan, 0)
     
     # Check if trial is expiring soon
     trial_warning = False
@@ -416,10 +440,10 @@ def tenant_dashboard(
         "tenant_name": tenant.name,
         "plan": tenant.plan,
         "mrr": f"R$ {mrr}",
-        "pending_notifications": total_pending,
-        "failed_notifications": total_failed,
-        "today_notifications": total_today,
-        "total_sent": total_sent,
+        "pending_notifications": stats["pending"],
+        "failed_notifications": stats["failed"],
+        "today_notifications": stats["today"],
+        "total_sent": stats["sent"],
         "whatsapp_status": tenant.wa_status,
         "trial_ends": tenant.trial_ends.isoformat() if tenant.trial_ends else None,
         "trial_warning": trial_warning,
@@ -427,6 +451,34 @@ def tenant_dashboard(
     }
 
 
+# 1b. Live notification events
+@app.get("/api/v1/28hub/{tenant_id}/events", tags=["Dashboard"])
+async def tenant_events(
+    tenant_id: str,
+    x_api_key: Optional[str] = Header(None),
+    api_key: Optional[str] = None
+):
+    """
+    Streams the tenant's notification events as Server-Sent Events.
+    Starts with a `snapshot` event holding the dashboard counters, then sends
+    notification.created/sent/failed/retrying, `counters` deltas and `resync`
+    events. Browser EventSource clients, which cannot set headers, may pass
+    the API key as the `api_key` query parameter instead of X-API-Key.
+    """
+    async with AsyncSessionLocal() as db:
+        tenant = await verify_tenant(tenant_id, x_api_key or api_key, db)
+        snapshot = await db.run_sync(get_tenant_stats, tenant.id)
+
+    if event_hub.full(tenant.id):
+        raise HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, "Too many open event streams for this tenant")
+
+    return StreamingResponse(
+        stream_events(tenant.id, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # 2. Connect WhatsApp (QR Code)
 @app.post("/api/v1/28hub/{tenant_id}/whatsapp/connect", tags=["WhatsApp"])
 def connect_whatsapp(tenant_id: str, db: Session = Depends(get_db)):
@@ -454,14 +506,14 @@ def connect_whatsapp(tenant_id: str, db: Session = Depends(get_db)):
 
 
 @app.post("/api/v1/28hub/{tenant_id}/whatsapp/send", tags=["WhatsApp"])
-async def send_message(tenant_id: str, message_data: dict, db: Session = Depends(get_db)):
+async def send_message(tenant_id: str, message_data: dict, db: AsyncSession = Depends(get_async_db)):
     """
     Send a custom WhatsApp message for a tenant
     
     - **tenant_id**: ID of the tenant
     - **message**: Message content to send
     """
-    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
+    tenant = (await db.execute(select(Tenant).where(Tenant.id == tenant_id))).scalar_one_or_none()
     if not tenant:
         raise HTTPException(404, "Tenant não encontrado")
     
@@ -482,50 +534,66 @@ async def send_message(tenant_id: str, message_data: dict, db: Session = Depends
 
 # 5. Send batch of pending notifications
 @app.post("/api/v1/28hub/{tenant_id}/send-batch", tags=["Notifications"])
-def send_batch(tenant_id: str, db: Session = Depends(get_db)):
-    """Sends all pending notifications in batch"""
-    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
+async def send_batch(tenant_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Sends all pending notifications in batch.
+    Runs in the background in keyset-paginated chunks with per-instance rate
+    limiting; poll GET send-batch for progress.
+    """
+    tenant = (await db.execute(select(Tenant).where(Tenant.id == tenant_id))).scalar_one_or_none()
     if not tenant:
         raise HTTPException(404, "Tenant não encontrado")
     
-    # Get all pending notifications
-    notifications = db.execute(
-        select(Notification).where(
-            Notification.tenant_id == tenant_id,
-            Notification.status == 'pending'
-        )
-    ).scalars().all()
-    
-    sent_count = 0
-    for notif in notifications:
-        # TODO: Send via Evolution API
-        notif.status = 'sent'
-        sent_count += 1
-    
-    db.commit()
+    if not tenant.wa_instance_name:
+        raise HTTPException(400, "WhatsApp instance not configured for this tenant")
     
-    return {"sent": sent_count, "total": len(notifications)}
+    return await batch_sender.start(tenant_id, tenant.wa_instance_name)
+
+
+@app.get("/api/v1/28hub/{tenant_id}/send-batch", tags=["Notifications"])
+async def send_batch_status(tenant_id: str):
+    """Returns progress of the tenant's latest batch send, whichever worker runs it"""
+    progress = await batch_sender.get(tenant_id)
+    if not progress:
+        raise HTTPException(404, "No batch send found for this tenant")
+    return progress
 
 # 6. Get activities list
-@app.get("/api/v1/28hub/{tenant_id}/activities", tags=["Activities"])
-def get_activities(tenant_id: str, limit: int = 50, db: Session = Depends(get_db)):
-    """Returns list of recent activities/notifications"""
+@app.get("/api/v1/28hub/{tenant_id}/activities", tags=["Activities"], response_class=ORJSONResponse)
+def get_activities(
+    tenant_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Returns list of recent activities/notifications, optionally only those with `status`.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    """
+    # Only the listed columns, so the covering list index serves the page
+    query = select(
+        Notification.id,
+        Notification.type,
+        Notification.client_name,
+        Notification.telefone,
+        func.coalesce(Notification.valor, 0).label("valor"),
+        Notification.nf_number,
+        Notification.status,
+        Notification.retry_count,
+        Notification.next_attempt_at,
+        Notification.created_at
+    ).where(Notification.tenant_id == tenant_id)
+    if status:
+        query = query.where(Notification.status == status)
+    
     notifications = db.execute(
-        select(Notification).where(
-            Notification.tenant_id == tenant_id
-        ).order_by(Notification.created_at.desc()).limit(limit)
-    ).scalars().all()
-    
-    return [{
-        "id": str(n.id),
-        "type": n.type,
-        "client_name": n.client_name,
-        "telefone": n.telefone,
-        "valor": float(n.valor) if n.valor else 0,
-        "nf_number": n.nf_number,
-        "status": n.status,
-        "created_at": n.created_at.isoformat()
-    } for n in notifications]
+        apply_cursor(query, Notification, cursor).limit(limit)
+    ).all()
+    
+    cursor_after = next_cursor(notifications, limit)
+    headers = {"X-Next-Cursor": cursor_after} if cursor_after else None
+    return ORJSONResponse(row_dicts(notifications), headers=headers)
 
 # 7. Update tenant profile
 @app.put("/api/v1/28hub/{tenant_id}/profile", tags=["Tenants"])
@@ -541,6 +609,7 @@ def update_profile(tenant_id: str, data: dict, db: Session = Depends(get_db)):
         tenant.wa_number = data['wa_number']
     
     db.commit()
+    invalidate_tenant(tenant_id)
     
     return {"status": "updated", "name": tenant.name}
 
@@ -560,33 +629,86 @@ async def root():
 # SUPER ADMIN ENDPOINTS - ADICIONAR ANTES do if __name__ == "__main__":
 @app.get("/api/v1/admin/dashboard", tags=["Admin"])
 def admin_dashboard(db: Session = Depends(get_db)):
-    tenants = db.execute(select(Tenant)).scalars().all()
-    trial_clients = len([t for t in tenants if t.plan == "trial"])
-    pro_clients = len([t for t in tenants if t.plan == "pro"])
-    enterprise_clients = len([t for t in tenants if t.plan == "enterprise"])
-    mrr = pro_clients * 97 + enterprise_clients * 497 + trial_clients * 0  # Trial grátis
+    summary = plan_summary.get(db)
+    plans = summary["plans"]
+    trial_clients = plans.get("trial", 0)
+    paid_clients = sum(count for plan, count in plans.items() if PLAN_PRICES.get(plan))
     
     return {
-        "mrr": f"R$ {mrr:,}",
-        "total_clients": len(tenants),
+        "mrr": f"R$ {summary['mrr']:,}",
+        "total_clients": summary["total"],
         "trial_clients": trial_clients,
-        "pro_clients": pro_clients,
-        "enterprise_clients": enterprise_clients,
+        "basic_clients": plans.get("basic", 0),
+        "pro_clients": plans.get("pro", 0),
+        "enterprise_clients": plans.get("enterprise", 0),
         "churn_rate": "0%",
-        "conversion_rate": f"{((pro_clients + enterprise_clients)/(trial_clients+pro_clients+enterprise_clients)*100):.1f}%" if tenants else "0%"
+        "conversion_rate": f"{(paid_clients / (trial_clients + paid_clients) * 100):.1f}%" if trial_clients + paid_clients else "0%",
+        "computed_at": summary["computed_at"]
     }
 
-@app.get("/api/v1/admin/clients", tags=["Admin"])
-def admin_clients(db: Session = Depends(get_db)):
-    clients = db.execute(select(Tenant)).scalars().all()
-    return [{
-        "id": str(t.id),
-        "name": t.name,
-        "plan": t.plan,
-        "wa_number": t.wa_number,
-        "status": t.status,
-        "trial_ends": t.trial_ends.isoformat() if t.trial_ends else None
-    } for t in clients]
+
+# Columns returned by the admin tenant listings (admin_clients and list_tenants)
+TENANT_LIST_COLUMNS = (
+    Tenant.id, Tenant.name, Tenant.email, Tenant.plan, Tenant.wa_number,
+    Tenant.status, Tenant.trial_ends, Tenant.created_at, Tenant.wa_status
+)
+
+
+def _tenant_page(
+    db: Session,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+    plan: Optional[str],
+    status_filter: Optional[str],
+    search: Optional[str]
+):
+    """Filtered, newest-first page of tenant rows; returns (total, rows, next_cursor)"""
+    limit = max(1, min(limit, 500))
+    query = select(*TENANT_LIST_COLUMNS)
+    if plan:
+        query = query.where(Tenant.plan == plan)
+    if status_filter:
+        query = query.where(Tenant.status == status_filter)
+    if search:
+        query = query.where(
+            Tenant.name.icontains(search, autoescape=True)
+            | Tenant.email.icontains(search, autoescape=True)
+            | Tenant.wa_number.contains(search, autoescape=True)
+        )
+    
+    if not (plan or status_filter or search):
+        total = plan_summary.get(db)["total"]
+    else:
+        total = db.execute(select(func.count()).select_from(query.subquery())).scalar() or 0
+    
+    page = apply_cursor(query, Tenant, cursor).limit(limit)
+    if not cursor:
+        page = page.offset(offset)
+    rows = db.execute(page).all()
+    return total, rows, next_cursor(rows, limit)
+
+
+@app.get("/api/v1/admin/clients", tags=["Admin"], response_class=ORJSONResponse)
+def admin_clients(
+    limit: int = 50,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    List clients, newest first, as a bare list (same filters as /admin/tenants).
+    The match count is in the X-Total-Count response header; pass the
+    X-Next-Cursor header back as `cursor` to get the next page.
+    """
+    total, clients, cursor_after = _tenant_page(db, limit, offset, cursor, plan, status, search)
+    headers = {"X-Total-Count": str(total)}
+    if cursor_after:
+        headers["X-Next-Cursor"] = cursor_after
+    return ORJSONResponse(row_dicts(clients), headers=headers)
 
 @app.post("/api/v1/admin/client/{tenant_id}/upgrade")
 def upgrade_client(tenant_id: str, plan: str, db: Session = Depends(get_db)):
@@ -595,25 +717,36 @@ def upgrade_client(tenant_id: str, plan: str, db: Session = Depends(get_db)):
         raise HTTPException(404, "Cliente não encontrado")
     tenant.plan = plan
     db.commit()
+    invalidate_tenant(tenant_id)
+    plan_summary.invalidate()
     return {"message": f"Cliente {tenant.name} upgradado para {plan}"}
 
 
 # Required Admin Endpoints - Tenants Management
-@app.get("/api/v1/admin/tenants", tags=["Admin"])
-def list_tenants(db: Session = Depends(get_db)):
-    """List all tenants (Admin endpoint)"""
-    tenants = db.execute(select(Tenant)).scalars().all()
-    return [{
-        "id": str(t.id),
-        "name": t.name,
-        "email": t.email,
-        "plan": t.plan,
-        "wa_number": t.wa_number,
-        "status": t.status,
-        "trial_ends": t.trial_ends.isoformat() if t.trial_ends else None,
-        "created_at": t.created_at.isoformat(),
-        "wa_status": t.wa_status
-    } for t in tenants]
+@app.get("/api/v1/admin/tenants", tags=["Admin"], response_class=ORJSONResponse)
+def list_tenants(
+    limit: int = 50,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    plan: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    List tenants, newest first (Admin endpoint).
+    
+    - **plan** / **status**: exact filters; **search**: matches name, email or WhatsApp number
+    - **cursor**: opaque `next_cursor` from a previous page; when set, `offset` is ignored
+    """
+    total, tenants, cursor_after = _tenant_page(db, limit, offset, cursor, plan, status, search)
+    return ORJSONResponse({
+        "total": total,
+        "limit": limit,
+        "offset": None if cursor else offset,
+        "next_cursor": cursor_after,
+        "tenants": row_dicts(tenants)
+    })
 
 
 @app.get("/api/v1/admin/tenants/{tenant_id}", tags=["Admin"])
@@ -624,23 +757,7 @@ def get_tenant_details(tenant_id: str, db: Session = Depends(get_db)):
         raise HTTPException(404, "Tenant not found")
     
     # Get notification stats for this tenant
-    total_notifications = db.execute(
-        select(func.count(Notification.id)).where(Notification.tenant_id == tenant_id)
-    ).scalar() or 0
-    
-    pending_notifications = db.execute(
-        select(func.count(Notification.id)).where(
-            Notification.tenant_id == tenant_id,
-            Notification.status == 'pending'
-        )
-    ).scalar() or 0
-    
-    failed_notifications = db.execute(
-        select(func.count(Notification.id)).where(
-            Notification.tenant_id == tenant_id,
-            Notification.status == 'failed'
-        )
-    ).scalar() or 0
+    stats = get_tenant_stats(db, tenant_id)
     
     return {
         "id": str(tenant.id),
@@ -657,13 +774,24 @@ def get_tenant_details(tenant_id: str, db: Session = Depends(get_db)):
         "wa_status": tenant.wa_status,
         "stripe_customer_id": tenant.stripe_customer_id,
         "stats": {
-            "total_notifications": total_notifications,
-            "pending_notifications": pending_notifications,
-            "failed_notifications": failed_notifications
+            "total_notifications": stats["total"],
+            "pending_notifications": stats["pending"],
+            "failed_notifications": stats["failed"]
         }
     }
 
 
+@app.post("/api/v1/admin/tenants/{tenant_id}/stats/rebuild", tags=["Admin"])
+def rebuild_stats(tenant_id: str, db: Session = Depends(get_db)):
+    """Recompute a tenant's notification counters from the notifications table (Admin endpoint)"""
+    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
+    if not tenant:
+        raise HTTPException(404, "Tenant not found")
+    
+    rebuild_tenant_stats(db, tenant_id)
+    return {"tenant_id": tenant_id, "stats": get_tenant_stats(db, tenant_id)}
+
+
 @app.put("/api/v1/admin/tenants/{tenant_id}/plan", tags=["Admin"])
 def update_tenant_plan(tenant_id: str, plan_data: dict, db: Session = Depends(get_db)):
     """Update tenant plan (Admin endpoint)"""
@@ -686,6 +814,8 @@ def update_tenant_plan(tenant_id: str, plan_data: dict, db: Session = Depends(ge
         tenant.trial_ends = datetime.now() + timedelta(days=7)
     
     db.commit()
+    invalidate_tenant(tenant_id)
+    plan_summary.invalidate()
     
     logger.info(f"Tenant {tenant.name} plan updated from {old_plan} to {plan}")
     
@@ -699,69 +829,84 @@ def update_tenant_plan(tenant_id: str, plan_data: dict, db: Session = Depends(ge
 
 
 # Required Tenant Endpoints - Notifications with API Key Validation
-@app.get("/api/v1/28hub/{tenant_id}/notifications", tags=["Notifications"])
+@app.get("/api/v1/28hub/{tenant_id}/notifications", tags=["Notifications"], response_class=ORJSONResponse)
 def get_notifications(
     tenant_id: str,
     limit: int = 50,
     offset: int = 0,
+    cursor: Optional[str] = None,
     status_filter: Optional[str] = None,
-    tenant: Tenant = Depends(verify_tenant),
+    count: str = "exact",
+    tenant: TenantSnapshot = Depends(verify_tenant),
     db: Session = Depends(get_db)
 ):
     """
     Get notifications list for a tenant with API key validation.
     Supports pagination and status filtering.
+    
+    - **cursor**: opaque `next_cursor` from a previous page; when set, `offset` is ignored
+    - **count**: `exact` (COUNT query), `cached` (tenant counters) or `none`
     """
-    query = select(Notification).where(Notification.tenant_id == tenant_id)
+    if count not in ("exact", "cached", "none"):
+        raise HTTPException(400, "Invalid count. Must be one of: exact, cached, none")
+    
+    # Rows shaped like the response, legacy columns folded in by the database
+    query = select(
+        Notification.id,
+        Notification.type,
+        Notification.client_name,
+        func.coalesce(Notification.client_phone, Notification.telefone).label("client_phone"),
+        func.coalesce(Notification.value, Notification.valor, 0).label("value"),
+        Notification.nf_number,
+        Notification.status,
+        func.coalesce(Notification.whatsapp_id, Notification.whatsapp_message_id).label("whatsapp_id"),
+        Notification.products,
+        Notification.error_message,
+        Notification.retry_count,
+        Notification.created_at,
+        Notification.sent_at
+    ).where(Notification.tenant_id == tenant_id)
     
     if status_filter:
         query = query.where(Notification.status == status_filter)
     
-    total = db.execute(select(func.count()).select_from(query.subquery())).scalar() or 0
+    total = None
+    if count == "exact":
+        total = db.execute(select(func.count()).select_from(query.subquery())).scalar() or 0
+    elif count == "cached":
+        total = get_tenant_stats(db, tenant_id).get(status_filter or "total", 0)
     
-    notifications = db.execute(
-        query.order_by(Notification.created_at.desc()).limit(limit).offset(offset)
-    ).scalars().all()
+    page = apply_cursor(query, Notification, cursor).limit(limit)
+    if not cursor:
+        page = page.offset(offset)
+    notifications = db.execute(page).all()
     
-    return {
+    return ORJSONResponse({
         "total": total,
         "limit": limit,
-        "offset": offset,
-        "notifications": [{
-            "id": str(n.id),
-            "type": n.type,
-            "client_name": n.client_name,
-            "client_phone": n.client_phone or n.telefone,
-            "value": n.value or float(n.valor) if n.valor else 0,
-            "nf_number": n.nf_number,
-            "status": n.status,
-            "whatsapp_id": n.whatsapp_id or n.whatsapp_message_id,
-            "products": n.products,
-            "error_message": n.error_message,
-            "retry_count": n.retry_count,
-            "created_at": n.created_at.isoformat(),
-            "sent_at": n.sent_at.isoformat() if n.sent_at else None
-        } for n in notifications]
-    }
+        "offset": None if cursor else offset,
+        "next_cursor": next_cursor(notifications, limit),
+        "notifications": row_dicts(notifications)
+    })
 
 
 @app.post("/api/v1/28hub/{tenant_id}/notifications/{notification_id}/retry", tags=["Notifications"])
 async def retry_notification(
     tenant_id: str,
     notification_id: str,
-    tenant: Tenant = Depends(verify_tenant),
-    db: Session = Depends(get_db)
+    tenant: TenantSnapshot = Depends(verify_tenant),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Retry a failed notification with API key validation.
     Increments retry count and attempts to send via WhatsApp.
     """
-    notification = db.execute(
+    notification = (await db.execute(
         select(Notification).where(
             Notification.id == notification_id,
             Notification.tenant_id == tenant_id
         )
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
     
     if not notification:
         raise HTTPException(404, "Notification not found")
@@ -770,76 +915,90 @@ async def retry_notification(
         raise HTTPException(400, "Can only retry failed notifications")
     
     # Check retry limit (max 3 retries)
-    if notification.retry_count >= 3:
-        raise HTTPException(400, "Maximum retry limit (3) reached")
+    if notification.retry_count >= RETRY_MAX_ATTEMPTS:
+        raise HTTPException(400, f"Maximum retry limit ({RETRY_MAX_ATTEMPTS}) reached")
     
-    # Increment retry count
-    notification.retry_count += 1
-    notification.status = "pending"
-    notification.error_message = None
-    db.commit()
+    if not tenant.wa_instance_name:
+        raise HTTPException(400, "WhatsApp instance not configured for this tenant")
     
-    # Prepare message based on notification type
-    message = ""
-    if notification.type == "sale":
-        message = f"🎉 Nova Venda!\n\nCliente: {notification.client_name}\nValor: R$ {notification.value or notification.valor}\nNF: {notification.nf_number}"
-    elif notification.type == "quote":
-        message = f"📋 Nova Cotação!\n\nCliente: {notification.client_name}\nValor: R$ {notification.value or notification.valor}"
-    elif notification.type == "payment":
-        message = f"💰 Pagamento Recebido!\n\nCliente: {notification.client_name}\nValor: R$ {notification.value or notification.valor}"
+    # Prepare message from the tenant's template for this notification type
+    message = await db.run_sync(lambda session: render_message(notification, session))
     
-    # Send via Evolution API
-    try:
-        if tenant.wa_instance_name:
-            result = await send_whatsapp_message(
-                phone=notification.client_phone or notification.telefone,
-                message=message,
-                instance=tenant.wa_instance_name
-            )
-            
-            notification.status = "sent"
-            notification.whatsapp_id = result.get("key", {}).get("id")
-            notification.sent_at = datetime.now()
-            db.commit()
-            
-            logger.info(f"Notification {notification_id} retried successfully for tenant {tenant_id}")
-            
-            return {
-                "id": str(notification.id),
-                "status": "sent",
-                "whatsapp_id": notification.whatsapp_id,
-                "retry_count": notification.retry_count,
-                "sent_at": notification.sent_at.isoformat()
-            }
-        else:
-            notification.status = "failed"
-            notification.error_message = "WhatsApp instance not configured"
-            db.commit()
-            
-            raise HTTPException(400, "WhatsApp instance not configured for this tenant")
-            
-    except Exception as e:
-        notification.status = "failed"
-        notification.error_message = str(e)
-        db.commit()
-        
-        logger.error(f"Failed to retry notification {notification_id}: {str(e)}")
-        
+    # Claim it straight into 'sending' like the delivery workers, so the retry
+    # scheduler, the workers and send-batch cannot send it at the same time
+    claimed = (await db.execute(
+        update(Notification)
+        .where(
+            Notification.id == notification_id,
+            Notification.tenant_id == tenant_id,
+            Notification.status == "failed"
+        )
+        .values(
+            status="sending",
+            claimed_at=datetime.now(),
+            retry_count=Notification.retry_count + 1,
+            error_message=None,
+            next_attempt_at=None
+        )
+        .returning(Notification.retry_count, Notification.claimed_at)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if claimed is None:
+        raise HTTPException(409, "Notification is already being retried")
+    set_committed_value(notification, "status", "sending")
+    set_committed_value(notification, "retry_count", claimed.retry_count)
+    set_committed_value(notification, "claimed_at", claimed.claimed_at)
+    await db.run_sync(record_transition, tenant_id, "failed", "sending")
+    await db.run_sync(stage_notifications, tenant_id, "retrying", [notification])
+    await db.commit()
+    
+    # Send via Evolution API and record the outcome
+    result = await send_claimed(notification, tenant.wa_instance_name, message)
+    
+    if result["status"] == "pending":
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{result['error_message']}; retry scheduled for {result['next_attempt_at'].isoformat()}"
+        )
+    if result["status"] == "failed":
+        logger.error(f"Failed to retry notification {notification_id}: {result['error_message']}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to send WhatsApp message: {str(e)}"
+            detail=result["error_message"]
         )
+    
+    logger.info(f"Notification {notification_id} retried successfully for tenant {tenant_id}")
+    
+    return {
+        "id": str(notification.id),
+        "status": "sent",
+        "whatsapp_id": result["whatsapp_id"],
+        "retry_count": claimed.retry_count,
+        "sent_at": result["sent_at"].isoformat()
+    }
 
 
 # Template Management Endpoints
+def _validate_template_content(content: Optional[str]) -> None:
+    """Reject template content that cannot be compiled"""
+    if not content:
+        raise HTTPException(400, "Template content is required")
+    try:
+        compile_template(content)
+    except TemplateError as e:
+        raise HTTPException(400, f"Invalid template: {str(e)}")
+
+
 @app.post("/api/v1/28hub/{tenant_id}/templates", tags=["Templates"])
 def create_template(
     tenant_id: str,
     template_data: dict,
-    tenant: Tenant = Depends(verify_tenant),
+    tenant: TenantSnapshot = Depends(verify_tenant),
     db: Session = Depends(get_db)
 ):
     """Create a new message template for a tenant"""
+    _validate_template_content(template_data.get("content"))
+    
     template = Template(
         tenant_id=tenant_id,
         name=template_data.get("name"),
@@ -850,6 +1009,7 @@ def create_template(
     db.add(template)
     db.commit()
     db.refresh(template)
+    template_cache.invalidate(tenant_id)
     
     logger.info(f"Template created for tenant {tenant_id}: {template.name}")
     
@@ -863,39 +1023,36 @@ def create_template(
     }
 
 
-@app.get("/api/v1/28hub/{tenant_id}/templates", tags=["Templates"])
+@app.get("/api/v1/28hub/{tenant_id}/templates", tags=["Templates"], response_class=ORJSONResponse)
 def get_templates(
     tenant_id: str,
     template_type: Optional[str] = None,
-    tenant: Tenant = Depends(verify_tenant),
+    tenant: TenantSnapshot = Depends(verify_tenant),
     db: Session = Depends(get_db)
 ):
     """Get all templates for a tenant, optionally filtered by type"""
-    query = select(Template).where(Template.tenant_id == tenant_id)
+    query = select(
+        Template.id,
+        Template.name,
+        Template.type,
+        Template.content,
+        Template.is_active,
+        Template.created_at,
+        Template.updated_at
+    ).where(Template.tenant_id == tenant_id)
     
     if template_type:
         query = query.where(Template.type == template_type)
     
-    templates = db.execute(
-        query.order_by(Template.name)
-    ).scalars().all()
-    
-    return [{
-        "id": str(t.id),
-        "name": t.name,
-        "type": t.type,
-        "content": t.content,
-        "is_active": t.is_active,
-        "created_at": t.created_at.isoformat(),
-        "updated_at": t.updated_at.isoformat()
-    } for t in templates]
+    templates = db.execute(query.order_by(Template.name)).all()
+    return ORJSONResponse(row_dicts(templates))
 
 
 @app.get("/api/v1/28hub/{tenant_id}/templates/{template_id}", tags=["Templates"])
 def get_template(
     tenant_id: str,
     template_id: str,
-    tenant: Tenant = Depends(verify_tenant),
+    tenant: TenantSnapshot = Depends(verify_tenant),
     db: Session = Depends(get_db)
 ):
     """Get a specific template by ID"""
@@ -925,7 +1082,7 @@ def update_template(
     tenant_id: str,
     template_id: str,
     template_data: dict,
-    tenant: Tenant = Depends(verify_tenant),
+    tenant: TenantSnapshot = Depends(verify_tenant),
     db: Session = Depends(get_db)
 ):
     """Update an existing template"""
@@ -944,11 +1101,13 @@ def update_template(
     if 'type' in template_data:
         template.type = template_data['type']
     if 'content' in template_data:
+        _validate_template_content(template_data['content'])
         template.content = template_data['content']
     if 'is_active' in template_data:
         template.is_active = template_data['is_active']
     
     db.commit()
+    template_cache.invalidate(tenant_id)
     
     logger.info(f"Template updated for tenant {tenant_id}: {template.name}")
     
@@ -966,7 +1125,7 @@ def update_template(
 def delete_template(
     tenant_id: str,
     template_id: str,
-    tenant: Tenant = Depends(verify_tenant),
+    tenant: TenantSnapshot = Depends(verify_tenant),
     db: Session = Depends(get_db)
 ):
     """Delete a template"""
@@ -982,16 +1141,57 @@ def delete_template(
     
     db.delete(template)
     db.commit()
+    template_cache.invalidate(tenant_id)
     
     logger.info(f"Template deleted for tenant {tenant_id}: {template.name}")
     
     return {"message": "Template deleted successfully"}
 
 
+@app.get("/api/v1/admin/upstreams", tags=["Admin"])
+def upstream_pools():
+    """
+    Requests in flight against the pool limits of the Evolution API, n8n and EvoAI clients,
+    circuit breaker state and concurrency limits per upstream, proxy send
+    queue depth and EvoAI read cache counters
+    """
+    return {
+        "upstreams": http_clients.stats(),
+        "dispatch_queues": message_dispatcher.stats(),
+        "evoai_cache": evoai.cache.stats(),
+        "resilience": upstream_guards.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
 # 11. Analytics endpoint
+# Dimensions admin analytics can break notification counts down by
+ANALYTICS_GROUPS = {
+    "tenant": DailyStat.tenant_id,
+    "type": DailyStat.type,
+    "status": DailyStat.status,
+    "plan": Tenant.plan,
+}
+
+
 @app.get("/api/v1/admin/analytics", tags=["Admin"])
-def admin_analytics(days: int = 30, db: Session = Depends(get_db)):
-    """Returns analytics data for charts"""
+def admin_analytics(
+    days: int = 30,
+    group_by: Optional[str] = None,
+    tenant_id: Optional[str] = None,
+    type: Optional[str] = None,
+    plan: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Returns analytics data for charts.
+    Notification counts come from the daily_stats rollup; `group_by` (tenant,
+    type, status or plan) adds a per-day breakdown and totals, and
+    tenant_id / type / plan filter them. Plan is the tenant's current plan.
+    """
+    if group_by is not None and group_by not in ANALYTICS_GROUPS:
+        raise HTTPException(400, f"group_by must be one of: {', '.join(ANALYTICS_GROUPS)}")
+    
     cutoff = datetime.now() - timedelta(days=days)
     
     # New tenants per day
@@ -1001,18 +1201,39 @@ def admin_analytics(days: int = 30, db: Session = Depends(get_db)):
         .group_by(func.date(Tenant.created_at))
     ).all()
     
+    filters = [DailyStat.day >= cutoff.date()]
+    if tenant_id:
+        filters.append(DailyStat.tenant_id == tenant_id)
+    if type:
+        filters.append(DailyStat.type == type)
+    if plan:
+        filters.append(Tenant.plan == plan)
+    
+    def rollup(*columns):
+        query = select(*columns, func.sum(DailyStat.count)).where(*filters)
+        if plan or group_by == "plan":
+            query = query.join(Tenant, Tenant.id == DailyStat.tenant_id)
+        return db.execute(query.group_by(*columns).order_by(*columns)).all()
+    
     # Notifications per day
-    notifs_per_day = db.execute(
-        select(func.date(Notification.created_at), func.count(Notification.id))
-        .where(Notification.created_at >= cutoff)
-        .group_by(func.date(Notification.created_at))
-    ).all()
+    notifs_per_day = rollup(DailyStat.day)
     
-    return {
+    result = {
         "tenants_chart": [{"date": str(t[0]), "count": t[1]} for t in tenants_per_day],
-        "notifications_chart": [{"date": str(n[0]), "count": n[1]} for n in notifs_per_day],
+        "notifications_chart": [{"date": str(n[0]), "count": int(n[1])} for n in notifs_per_day],
         "period_days": days
     }
+    
+    if group_by:
+        column = ANALYTICS_GROUPS[group_by]
+        result["group_by"] = group_by
+        result["breakdown"] = [
+            {"date": str(day), group_by: key, "count": int(count)}
+            for day, key, count in rollup(DailyStat.day, column)
+        ]
+        result["totals"] = [{group_by: key, "count": int(count)} for key, count in rollup(column)]
+    
+    return result
 
 # 12. Stripe webhook
 @app.post("/api/v1/stripe/webhook", tags=["Billing"])
@@ -1031,6 +1252,8 @@ def stripe_webhook(data: dict, db: Session = Depends(get_db)):
         if tenant:
             tenant.plan = 'pro'
             db.commit()
+            invalidate_tenant(tenant.id)
+            plan_summary.invalidate()
             
     elif event_type == 'customer.subscription.deleted':
         # Downgrade to trial
@@ -1044,39 +1267,56 @@ def stripe_webhook(data: dict, db: Session = Depends(get_db)):
             tenant.plan = 'trial'
             tenant.trial_ends = datetime.now() + timedelta(days=7)
             db.commit()
+            invalidate_tenant(tenant.id)
+            plan_summary.invalidate()
     
     return {"status": "processed"}
 
 # EVOLUTION API PROXY ENDPOINTS
-@app.post("/api/v1/28hub/{tenant_id}/message/sendText", tags=["Evolution API"])
-def send_message_text(tenant_id: str, data: dict, db: Session = Depends(get_db)):
-    """Proxy to Evolution API - send text message"""
-    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
-    if not tenant:
-        raise HTTPException(404, "Tenant não encontrado")
+def _dispatch_message(tenant: TenantSnapshot, endpoint: str, data: dict, required: tuple) -> dict:
+    """Validate a proxied message payload and queue it on the tenant's instance"""
+    if not tenant.wa_instance_name:
+        raise HTTPException(400, "WhatsApp instance not configured for this tenant")
     
-    # TODO: Call Evolution API
-    return {"status": "queued"}
-
-@app.post("/api/v1/28hub/{tenant_id}/message/sendButtons", tags=["Evolution API"])
-def send_message_buttons(tenant_id: str, data: dict, db: Session = Depends(get_db)):
-    """Proxy to Evolution API - send button message"""
-    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
-    if not tenant:
-        raise HTTPException(404, "Tenant não encontrado")
+    missing = [field for field in ("number",) + required if not data.get(field)]
+    if missing:
+        raise HTTPException(400, f"Missing required fields: {', '.join(missing)}")
     
-    # TODO: Call Evolution API
-    return {"status": "queued"}
+    try:
+        return message_dispatcher.submit(tenant.id, tenant.wa_instance_name, endpoint, data)
+    except DispatchQueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
 
-@app.post("/api/v1/28hub/{tenant_id}/message/sendList", tags=["Evolution API"])
-def send_message_list(tenant_id: str, data: dict, db: Session = Depends(get_db)):
-    """Proxy to Evolution API - send list message"""
-    tenant = db.execute(select(Tenant).where(Tenant.id == tenant_id)).scalar_one_or_none()
-    if not tenant:
-        raise HTTPException(404, "Tenant não encontrado")
-    
-    # TODO: Call Evolution API
-    return {"status": "queued"}
+
+@app.post("/api/v1/28hub/{tenant_id}/message/sendText", tags=["Evolution API"], status_code=status.HTTP_202_ACCEPTED)
+async def send_message_text(tenant_id: str, data: dict, tenant: TenantSnapshot = Depends(verify_tenant)):
+    """Proxy to Evolution API - send text message (queued; poll the message id for its result)"""
+    return _dispatch_message(tenant, "sendText", data, ("text",))
+
+@app.post("/api/v1/28hub/{tenant_id}/message/sendButtons", tags=["Evolution API"], status_code=status.HTTP_202_ACCEPTED)
+async def send_message_buttons(tenant_id: str, data: dict, tenant: TenantSnapshot = Depends(verify_tenant)):
+    """Proxy to Evolution API - send button message (queued; poll the message id for its result)"""
+    return _dispatch_message(tenant, "sendButtons", data, ("buttons",))
+
+@app.post("/api/v1/28hub/{tenant_id}/message/sendList", tags=["Evolution API"], status_code=status.HTTP_202_ACCEPTED)
+async def send_message_list(tenant_id: str, data: dict, tenant: TenantSnapshot = Depends(verify_tenant)):
+    """Proxy to Evolution API - send list message (queued; poll the message id for its result)"""
+    return _dispatch_message(tenant, "sendList", data, ("sections",))
+
+@app.get("/api/v1/28hub/{tenant_id}/message/{message_id}", tags=["Evolution API"])
+async def get_message_status(tenant_id: str, message_id: str, tenant: TenantSnapshot = Depends(verify_tenant)):
+    """
+    Status of a proxied message: queued, sending, sent (with whatsapp_id) or failed.
+    Results are kept in memory for DISPATCH_RESULT_TTL seconds after sending.
+    """
+    result = message_dispatcher.get(tenant.id, message_id)
+    if not result:
+        raise HTTPException(404, "Message not found")
+    return result
 
 
 # EVOAI INTEGRATION ENDPOINTS - Pro/Enterprise Only
@@ -1100,8 +1340,8 @@ async def evoai_health():
 async def create_agent(
     tenant_id: str,
     config: dict,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(verify_tenant)
+    db: AsyncSession = Depends(get_async_db),
+    tenant: TenantSnapshot = Depends(verify_tenant)
 ):
     """
     Create a new AI agent for a tenant
@@ -1125,8 +1365,10 @@ async def create_agent(
 
         # Store agent reference in tenant (using wa_instance_name field)
         # This field is available in the Tenant model
-        tenant.wa_instance_name = agent.get("id")
-        db.commit()
+        db_tenant = await db.get(Tenant, tenant_id)
+        db_tenant.wa_instance_name = agent.get("id")
+        await db.commit()
+        invalidate_tenant(tenant_id)
 
         logger.info(f"Created EvoAI agent {agent.get('id')} for tenant {tenant_id}")
 
@@ -1147,8 +1389,8 @@ async def create_agent(
 @app.get("/api/v1/28hub/{tenant_id}/agents", tags=["EvoAI"])
 async def get_agent(
     tenant_id: str,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(verify_tenant)
+    db: AsyncSession = Depends(get_async_db),
+    tenant: TenantSnapshot = Depends(verify_tenant)
 ):
     """
     Get the AI agent for a tenant
@@ -1200,8 +1442,8 @@ async def get_agent(
 async def update_agent(
     tenant_id: str,
     updates: dict,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(verify_tenant)
+    db: AsyncSession = Depends(get_async_db),
+    tenant: TenantSnapshot = Depends(verify_tenant)
 ):
     """
     Update the AI agent for a tenant
@@ -1247,8 +1489,8 @@ async def update_agent(
 @app.delete("/api/v1/28hub/{tenant_id}/agents", tags=["EvoAI"])
 async def delete_agent(
     tenant_id: str,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(verify_tenant)
+    db: AsyncSession = Depends(get_async_db),
+    tenant: TenantSnapshot = Depends(verify_tenant)
 ):
     """
     Delete the AI agent for a tenant
@@ -1275,8 +1517,10 @@ async def delete_agent(
         await evoai.delete_agent(agent_id)
 
         # Clear agent reference from tenant
-        tenant.wa_instance_name = None
-        db.commit()
+        db_tenant = await db.get(Tenant, tenant_id)
+        db_tenant.wa_instance_name = None
+        await db.commit()
+        invalidate_tenant(tenant_id)
 
         logger.info(f"Deleted EvoAI agent {agent_id} for tenant {tenant_id}")
 
@@ -1293,8 +1537,8 @@ async def delete_agent(
 async def chat_message(
     tenant_id: str,
     message: dict,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(verify_tenant)
+    db: AsyncSession = Depends(get_async_db),
+    tenant: TenantSnapshot = Depends(verify_tenant)
 ):
     """
     Send a message to the AI agent
@@ -1348,13 +1592,67 @@ async def chat_message(
         )
 
 
+@app.post("/api/v1/28hub/{tenant_id}/chat/stream", tags=["EvoAI"])
+async def chat_message_stream(
+    tenant_id: str,
+    message: dict,
+    tenant: TenantSnapshot = Depends(verify_tenant)
+):
+    """
+    Send a message to the AI agent and stream the reply
+
+    Same input as POST /chat. The agent's reply is relayed as Server-Sent
+    Events as EvoAI produces it, followed by an `event: done` message.
+    Only available for Pro and Enterprise plans.
+    """
+    # Check if tenant has Pro or Enterprise plan
+    if tenant.plan not in ["pro", "enterprise"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="AI chat requires Pro or Enterprise plan"
+        )
+
+    # Get agent ID from tenant
+    agent_id = tenant.wa_instance_name
+    if not agent_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No AI agent found for this tenant. Please create an agent first."
+        )
+
+    # Use provided session_id or default to tenant_id
+    session_id = message.get("session_id", tenant_id)
+
+    try:
+        upstream = await evoai.stream_message(
+            agent_id=agent_id,
+            external_id=session_id,
+            message=message.get("text"),
+            files=message.get("files")
+        )
+    except Exception as e:
+        logger.error(f"Failed to stream chat message for tenant {tenant_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to send chat message: {str(e)}"
+        )
+
+    logger.info(f"Streaming chat reply from EvoAI agent {agent_id} for tenant {tenant_id}")
+
+    return StreamingResponse(
+        evoai.iter_sse(upstream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/v1/28hub/{tenant_id}/chat/sessions", tags=["EvoAI"])
 async def get_chat_sessions(
     tenant_id: str,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(verify_tenant)
+    db: AsyncSession = Depends(get_async_db),
+    tenant: TenantSnapshot = Depends(verify_tenant)
 ):
     """
     Get chat sessions for the tenant's AI agent
@@ -1402,8 +1700,8 @@ async def get_chat_sessions(
 async def get_session_messages(
     tenant_id: str,
     session_id: str,
-    db: Session = Depends(get_db),
-    tenant: Tenant = Depends(verify_tenant)
+    db: AsyncSession = Depends(get_async_db),
+    tenant: TenantSnapshot = Depends(verify_tenant)
 ):
     """
     Get message history for a chat session
@@ -0,0 +1,225 @@
+"""
+Prometheus metrics for 28Hub Connect backend.
+
+Exposed at GET /metrics:
+
+- http_request_duration_seconds{method, route, status}: latency per route
+  template (MetricsMiddleware), http_requests_in_progress{method}
+- db_pool_connections_in_use{pool} against db_pool_size{pool} for the sync
+  and async engine pools (in use above size means overflow connections, and
+  callers start waiting once max_overflow is reached),
+  db_pool_connections_opened_total{pool}
+- upstream_request_duration_seconds{upstream, outcome} and
+  upstream_errors_total{upstream, kind} for Evolution API, n8n and EvoAI,
+  upstream_circuit_state{upstream} (0 closed, 1 half open, 2 open)
+- notifications_total{plan, status}: notifications created (pending), sent,
+  failed and moved back to pending by the retry scheduler (retry)
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by them so /metrics aggregates all workers.
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+
+from models import Tenant
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Seconds a tenant's plan label is reused before it is read again
+METRICS_PLAN_TTL = float(os.getenv("METRICS_PLAN_TTL", "300"))
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Database connections checked out of the pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Connections the pool keeps open (pool_size, excluding overflow)",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+POOL_CONNECTS = Counter(
+    "db_pool_connections_opened_total",
+    "New database connections opened by the pool",
+    ["pool"],
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to upstream services",
+    ["upstream", "outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total",
+    "Failed calls to upstream services",
+    ["upstream", "kind"],
+)
+CIRCUIT_STATE = Gauge(
+    "upstream_circuit_state",
+    "Circuit breaker state (0 closed, 1 half open, 2 open)",
+    ["upstream"],
+    multiprocess_mode="max",
+)
+NOTIFICATIONS = Counter(
+    "notifications_total",
+    "Notifications entering each delivery status",
+    ["plan", "status"],
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by method, route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # Set by the router once a route matched; raw paths would explode cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_DURATION.labels(method, route, str(status_code)).observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Track connections in use, pool size and new connections through the pool's events"""
+    pool = engine.pool
+    in_use = POOL_IN_USE.labels(name)
+    opened = POOL_CONNECTS.labels(name)
+    # size() and checkedout() exist on QueuePool and its async variant, not on NullPool or SingletonThreadPool
+    size = getattr(pool, "size", None)
+    checkedout = getattr(pool, "checkedout", None)
+    if callable(size):
+        POOL_SIZE.labels(name).set(size())
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        opened.inc()
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        if checkedout is not None:
+            # Resynced from the pool's own count on every checkout so the gauge cannot drift
+            in_use.set(checkedout())
+        else:
+            in_use.inc()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        in_use.dec()
+
+
+def observe_upstream(upstream: str, seconds: float, outcome: str) -> None:
+    UPSTREAM_DURATION.labels(upstream, outcome).observe(seconds)
+
+
+def count_upstream_error(upstream: str, kind: str) -> None:
+    UPSTREAM_ERRORS.labels(upstream, kind).inc()
+
+
+def set_circuit_state(upstream: str, state: str) -> None:
+    CIRCUIT_STATE.labels(upstream).set(CIRCUIT_STATES.get(state, 0))
+
+
+class PlanLookup:
+    """tenant_id -> plan for metric labels, cached for METRICS_PLAN_TTL seconds"""
+
+    def __init__(self, ttl: float = METRICS_PLAN_TTL):
+        self.ttl = ttl
+        self.plans: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def remember(self, tenant_id: str, plan: str) -> None:
+        with self._lock:
+            self.plans[tenant_id] = (time.monotonic() + self.ttl, plan or "trial")
+
+    def resolve(self, db, tenant_ids: Iterable[str]) -> Dict[str, str]:
+        now = time.monotonic()
+        resolved, missing = {}, []
+        with self._lock:
+            for tenant_id in set(tenant_ids):
+                entry = self.plans.get(tenant_id)
+                if entry and entry[0] > now:
+                    resolved[tenant_id] = entry[1]
+                else:
+                    missing.append(tenant_id)
+        if missing:
+            for tenant_id, plan in db.execute(select(Tenant.id, Tenant.plan).where(Tenant.id.in_(missing))).all():
+                self.remember(tenant_id, plan)
+                resolved[tenant_id] = plan or "trial"
+        return resolved
+
+
+# Global instance for easy import
+tenant_plans = PlanLookup()
+
+
+def count_notifications(plan: str, status: str, count: int = 1) -> None:
+    if count:
+        NOTIFICATIONS.labels(plan or "trial", status).inc(count)
+
+
+def count_tenant_notifications(db, counts: Dict[Tuple[str, str], int]) -> None:
+    """Count notifications per (tenant_id, status), labelled with each tenant's plan"""
+    if not counts:
+        return
+    plans = tenant_plans.resolve(db, [tenant_id for tenant_id, _ in counts])
+    for (tenant_id, status), count in counts.items():
+        count_notifications(plans.get(tenant_id, "unknown"), status, count)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Exposition payload and content type for /metrics"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Boolean, DateTime, ForeignKey, Integer, Text, JSON
+from sqlalchemy import Column, String, Float, Boolean, Date, DateTime, ForeignKey, Index, Integer, Text, JSON, text
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
 from uuid import uuid4
@@ -22,7 +22,7 @@ class Tenant(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     # Additional fields for billing and integration
-    email = Column(String, nullable=True)
+    email = Column(String, nullable=True, unique=True)  # tenants_email_key, as in migration 001
     phone = Column(String, nullable=True)
     wa_status = Column(String, nullable=True)  # connected|disconnected|qr_pending
     wa_qr_code = Column(Text, nullable=True)
@@ -31,6 +31,15 @@ class Tenant(Base):
     notifications = relationship("Notification", back_populates="tenant", cascade="all, delete-orphan")
     templates = relationship("Template", back_populates="tenant", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index(
+            "uq_tenants_stripe_customer_id",
+            "stripe_customer_id",
+            unique=True,
+            postgresql_where=text("stripe_customer_id IS NOT NULL")
+        ),
+    )
+
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -42,13 +51,17 @@ class Notification(Base):
     client_phone = Column(String)
     value = Column(Float)
     nf_number = Column(String)  # Nota Fiscal
-    status = Column(String, default="pending")  # pending|sent|failed
+    status = Column(String, default="pending")  # pending|sending|sent|failed
     whatsapp_id = Column(String)  # ID da mensagem WhatsApp
     products = Column(JSON)  # Products list as JSON
     error_message = Column(Text)
     retry_count = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.now)
+    # Part of the primary key: notifications is partitioned by created_at (migration 012)
+    created_at = Column(DateTime, primary_key=True, default=datetime.now)
     sent_at = Column(DateTime)
+    next_attempt_at = Column(DateTime)  # When the retry scheduler resends a failed or deferred notification
+    claimed_at = Column(DateTime)  # When a delivery worker moved it to sending
+    idempotency_key = Column(String)  # Idempotency-Key header or type:nf_number
 
     # Additional fields for compatibility
     telefone = Column(String)  # Legacy field for backward compatibility
@@ -59,6 +72,31 @@ class Notification(Base):
 
     tenant = relationship("Tenant", back_populates="notifications")
 
+    __table_args__ = (
+        Index(
+            "idx_notifications_retry_due",
+            "next_attempt_at",
+            postgresql_where=text("status = 'failed' AND next_attempt_at IS NOT NULL")
+        ),
+        Index("idx_notifications_sending", "claimed_at", postgresql_where=text("status = 'sending'")),
+        Index(
+            "idx_notifications_deferred",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending' AND next_attempt_at IS NOT NULL")
+        ),
+    )
+
+
+class NotificationIdempotencyKey(Base):
+    __tablename__ = "notification_idempotency_keys"
+
+    # Unique per tenant. Kept outside notifications because unique indexes on the
+    # partitioned table would have to include created_at.
+    tenant_id = Column(String, ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    idempotency_key = Column(String(255), primary_key=True)
+    notification_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
 
 class Template(Base):
     __tablename__ = "templates"
@@ -73,3 +111,33 @@ class Template(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     tenant = relationship("Tenant", back_populates="templates")
+
+
+class TenantNotificationStats(Base):
+    __tablename__ = "tenant_notification_stats"
+
+    # One row per tenant, kept up to date by the ingest and delivery paths
+    tenant_id = Column(String, ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+    pending = Column(Integer, default=0, nullable=False)
+    sending = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    today_date = Column(Date)  # Day today_count refers to
+    today_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class DailyStat(Base):
+    __tablename__ = "daily_stats"
+
+    # Notifications created per day, tenant, type and current status; rebuilt by rollups.py
+    day = Column(Date, primary_key=True)
+    tenant_id = Column(String, ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    type = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("idx_daily_stats_tenant_day", "tenant_id", "day"),
+    )
@@ -0,0 +1,299 @@
+"""
+Monthly partitions and retention for the notifications table.
+
+On PostgreSQL, notifications is range-partitioned by created_at (migration
+012) into one partition per month, `notifications_pYYYYMM`, plus a default
+partition for rows outside them. Maintenance, run periodically by every API
+worker and delivery process (serialized with an advisory lock), does two things:
+
+- creates the partitions for the current month and PARTITION_MONTHS_AHEAD
+  months after it, so inserts never land in the default partition;
+- archives partitions older than NOTIFICATION_RETENTION_MONTHS: each one is
+  detached from notifications and either attached, without its indexes and
+  compacted, to the notifications_archive table (NOTIFICATION_ARCHIVE_MODE=table)
+  or written as a zstd-compressed Parquet file under NOTIFICATION_ARCHIVE_DIR
+  and dropped (NOTIFICATION_ARCHIVE_MODE=parquet, requires pyarrow).
+
+Idempotency keys of archived notifications are deleted with them.
+On other databases maintenance does nothing. On PostgreSQL before migration
+012 it only logs a warning when retention is configured, since nothing
+would ever be archived.
+
+Run once by hand with `python partitions.py`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import logging
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# 0 keeps every partition in the hot table
+NOTIFICATION_RETENTION_MONTHS = int(os.getenv("NOTIFICATION_RETENTION_MONTHS", "12"))
+NOTIFICATION_ARCHIVE_MODE = os.getenv("NOTIFICATION_ARCHIVE_MODE", "table")  # table|parquet
+NOTIFICATION_ARCHIVE_DIR = os.getenv("NOTIFICATION_ARCHIVE_DIR", "/var/lib/28hub/archive")
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+PARTITION_MAINTENANCE_ENABLED = os.getenv("PARTITION_MAINTENANCE_ENABLED", "true").lower() == "true"
+
+PARENT_TABLE = "notifications"
+ARCHIVE_TABLE = "notifications_archive"
+PARTITION_PREFIX = "notifications_p"
+# pg_try_advisory_lock key shared by all processes running maintenance
+MAINTENANCE_LOCK_ID = 2817001
+# DETACH needs an exclusive lock on notifications; give up rather than queue behind long queries
+DETACH_LOCK_TIMEOUT = "5s"
+PARQUET_BATCH_ROWS = 50000
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    years, index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Month covered by a notifications_pYYYYMM partition, None for other names"""
+    suffix = name[len(PARTITION_PREFIX):]
+    if not name.startswith(PARTITION_PREFIX) or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": PARENT_TABLE}
+    ).scalar() is not None
+
+
+def list_partitions(conn: Connection, parent: str = PARENT_TABLE) -> List[str]:
+    return list(conn.execute(
+        text("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:parent)
+            ORDER BY c.relname
+        """),
+        {"parent": parent}
+    ).scalars())
+
+
+def ensure_partitions(
+    conn: Connection, months_ahead: int = PARTITION_MONTHS_AHEAD, months_back: int = 0
+) -> List[str]:
+    """Create missing monthly partitions from months_back months ago to months_ahead months from now"""
+    existing = set(list_partitions(conn))
+    created = []
+    first = month_start(date.today())
+    for offset in range(-months_back, months_ahead + 1):
+        month = add_months(first, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        try:
+            # Savepoint: one failure (e.g. matching rows already in the default
+            # partition) must not roll back the other months
+            with conn.begin_nested():
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+                    f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+                ))
+            created.append(name)
+        except DBAPIError as e:
+            logger.error(f"Could not create partition {name}: {str(e)}")
+    return created
+
+
+def expired_partitions(conn: Connection, retention_months: int = NOTIFICATION_RETENTION_MONTHS) -> List[str]:
+    """Monthly partitions that end before the retention window"""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    return [
+        name for name in list_partitions(conn)
+        if partition_month(name) is not None and add_months(partition_month(name), 1) <= cutoff
+    ]
+
+
+def export_parquet(conn: Connection, name: str, archive_dir: str = NOTIFICATION_ARCHIVE_DIR) -> Path:
+    """Write a partition to <archive_dir>/<name>.parquet, streaming it with a server-side cursor"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("NOTIFICATION_ARCHIVE_MODE=parquet requires pyarrow (pip install pyarrow)")
+
+    directory = Path(archive_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.parquet"
+    partial = path.with_suffix(".parquet.tmp")
+
+    cursor = conn.connection.cursor(name=f"archive_{name}")
+    writer = None
+    try:
+        cursor.itersize = PARQUET_BATCH_ROWS
+        cursor.execute(f"SELECT * FROM {name} ORDER BY created_at, id")
+        while True:
+            rows = cursor.fetchmany(PARQUET_BATCH_ROWS)
+            if not rows:
+                break
+            columns = [column.name for column in cursor.description]
+            records = [
+                {
+                    column: json.dumps(value) if isinstance(value, (dict, list)) else
+                    str(value) if column in ("id", "tenant_id") and value is not None else
+                    value
+                    for column, value in zip(columns, row)
+                }
+                for row in rows
+            ]
+            batch = pa.Table.from_pylist(records)
+            if writer is None:
+                writer = pq.ParquetWriter(str(partial), batch.schema, compression="zstd")
+            writer.write_table(batch.cast(writer.schema))
+    finally:
+        cursor.close()
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # Empty partition: nothing worth keeping
+        return path
+    partial.replace(path)
+    return path
+
+
+def archive_partition(conn: Connection, name: str, mode: str = NOTIFICATION_ARCHIVE_MODE) -> Optional[Path]:
+    """Detach a monthly partition and move it to the archive (within the caller's transaction)"""
+    month = partition_month(name)
+    upper = add_months(month, 1)
+
+    conn.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+
+    path = None
+    if mode == "parquet":
+        path = export_parquet(conn, name)
+        conn.execute(text(f"DROP TABLE {name}"))
+    else:
+        # The archive is only read in bulk; the hot-path indexes are dead weight there
+        indexes = conn.execute(
+            text("""
+                SELECT c.relname FROM pg_index x
+                JOIN pg_class c ON c.oid = x.indexrelid
+                WHERE x.indrelid = to_regclass(:table) AND NOT x.indisprimary
+            """),
+            {"table": name}
+        ).scalars().all()
+        for index in indexes:
+            conn.execute(text(f"DROP INDEX {index}"))
+        conn.execute(text(
+            f"ALTER TABLE {ARCHIVE_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month}') TO ('{upper}')"
+        ))
+
+    conn.execute(
+        text("DELETE FROM notification_idempotency_keys WHERE created_at < :upper"),
+        {"upper": upper}
+    )
+    return path
+
+
+def run_maintenance(bind: Engine = engine, archive: bool = True) -> Dict[str, List[str]]:
+    """
+    Create upcoming partitions and archive expired ones; a no-op (with a
+    warning if retention is configured) where notifications is not partitioned
+    """
+    result = {"created": [], "archived": []}
+    if bind.dialect.name != "postgresql":
+        return result
+
+    with bind.connect() as lock_conn:
+        lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not is_partitioned(lock_conn):
+            if archive and NOTIFICATION_RETENTION_MONTHS > 0:
+                logger.warning(
+                    f"{PARENT_TABLE} is not partitioned (run alembic upgrade), so rows older than "
+                    f"NOTIFICATION_RETENTION_MONTHS={NOTIFICATION_RETENTION_MONTHS} are not archived"
+                )
+            return result
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}).scalar():
+            logger.info("Partition maintenance is running in another process, skipping")
+            return result
+        try:
+            with bind.begin() as conn:
+                result["created"] = ensure_partitions(conn)
+            if result["created"]:
+                logger.info(f"Created notification partitions: {', '.join(result['created'])}")
+
+            if archive:
+                for name in expired_partitions(lock_conn):
+                    with bind.begin() as conn:
+                        path = archive_partition(conn, name)
+                    if NOTIFICATION_ARCHIVE_MODE == "parquet":
+                        logger.info(f"Archived partition {name} to {path}")
+                    else:
+                        # Rewrite the detached heap without dead tuples (outside a transaction)
+                        lock_conn.execute(text(f"VACUUM (FULL, ANALYZE) {name}"))
+                        logger.info(f"Archived partition {name} to {ARCHIVE_TABLE}")
+                    result["archived"].append(name)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+    return result
+
+
+class PartitionMaintenance:
+    """Runs partition maintenance in the background every PARTITION_MAINTENANCE_INTERVAL seconds"""
+
+    def __init__(self, interval: float = PARTITION_MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+        logger.info("Partition maintenance started")
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(run_maintenance)
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+# Global instance for easy import
+partition_maintenance = PartitionMaintenance()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Create upcoming notification partitions and archive old ones")
+    parser.add_argument("--no-archive", action="store_true", help="only create partitions")
+    args = parser.parse_args()
+    print(json.dumps(run_maintenance(archive=not args.no_archive), indent=2))
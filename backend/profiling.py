@@ -0,0 +1,173 @@
+"""
+Opt-in per-request SQL profiling for 28Hub Connect backend.
+
+With SQL_PROFILING_ENABLED=true, SQLAlchemy cursor events on both engines
+record every statement a request runs: query count, total DB time and the
+SQL_PROFILING_TOP slowest statements. Each response gets a Server-Timing
+header (`db;dur=<ms>;desc="<n> queries", app;dur=<ms>`), visible in the
+browser devtools.
+
+Requests slower than SQL_PROFILING_SLOW_MS or running more than
+SQL_PROFILING_MAX_QUERIES statements are logged with their slowest
+statements and, for SELECTs, the plan from EXPLAIN (EXPLAIN ANALYZE with
+SQL_PROFILING_EXPLAIN_ANALYZE=true, which runs the query again). The plans
+are fetched after the response is sent.
+
+Meant for staging; it adds a little work to every query.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from database import async_engine, engine
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILING_ENABLED = os.getenv("SQL_PROFILING_ENABLED", "false").lower() == "true"
+SQL_PROFILING_SLOW_MS = float(os.getenv("SQL_PROFILING_SLOW_MS", "500"))
+SQL_PROFILING_MAX_QUERIES = int(os.getenv("SQL_PROFILING_MAX_QUERIES", "10"))
+SQL_PROFILING_TOP = int(os.getenv("SQL_PROFILING_TOP", "3"))
+SQL_PROFILING_EXPLAIN_ANALYZE = os.getenv("SQL_PROFILING_EXPLAIN_ANALYZE", "false").lower() == "true"
+
+
+@dataclass(order=True)
+class Statement:
+    duration: float
+    sql: str = field(compare=False)
+    parameters: Any = field(compare=False)
+    engine: Engine = field(compare=False)
+
+
+@dataclass
+class RequestProfile:
+    queries: int = 0
+    db_time: float = 0.0
+    # Min-heap of the slowest statements
+    slowest: List[Statement] = field(default_factory=list)
+
+    def record(self, statement: Statement) -> None:
+        self.queries += 1
+        self.db_time += statement.duration
+        if len(self.slowest) < SQL_PROFILING_TOP:
+            heapq.heappush(self.slowest, statement)
+        elif statement.duration > self.slowest[0].duration:
+            heapq.heapreplace(self.slowest, statement)
+
+
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _profile.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    if profile is None or not conn.info.get("profile_start"):
+        return
+    duration = time.perf_counter() - conn.info["profile_start"].pop()
+    profile.record(Statement(duration, statement, None if executemany else parameters, conn.engine))
+
+
+def instrument(target: Engine) -> None:
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def _explain_prefix(dialect: str) -> Optional[str]:
+    if dialect == "postgresql":
+        return "EXPLAIN ANALYZE " if SQL_PROFILING_EXPLAIN_ANALYZE else "EXPLAIN "
+    if dialect == "sqlite":
+        return "EXPLAIN QUERY PLAN "
+    return None
+
+
+async def explain(statement: Statement) -> Optional[str]:
+    """Plan of a profiled SELECT, run on the engine that executed it"""
+    prefix = _explain_prefix(statement.engine.dialect.name)
+    if prefix is None or not statement.sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    sql = prefix + statement.sql
+
+    if statement.engine is async_engine.sync_engine:
+        async with async_engine.connect() as conn:
+            rows = (await conn.exec_driver_sql(sql, statement.parameters)).all()
+    else:
+        def run():
+            with engine.connect() as conn:
+                return conn.exec_driver_sql(sql, statement.parameters).all()
+        rows = await asyncio.to_thread(run)
+    return "\n".join(" | ".join(str(value) for value in row) for row in rows)
+
+
+async def report_slow_request(method: str, path: str, elapsed: float, profile: RequestProfile) -> None:
+    """Log a slow or query-heavy request with its slowest statements and their plans"""
+    lines = [
+        f"Slow request {method} {path}: {elapsed * 1000:.1f} ms, "
+        f"{profile.queries} queries, {profile.db_time * 1000:.1f} ms in DB"
+    ]
+    for statement in sorted(profile.slowest, reverse=True):
+        lines.append(f"  {statement.duration * 1000:.1f} ms: {' '.join(statement.sql.split())}")
+        try:
+            plan = await explain(statement)
+        except Exception as e:
+            plan = f"EXPLAIN failed: {str(e)}"
+        if plan:
+            lines.extend(f"    {line}" for line in plan.splitlines())
+    logger.warning("\n".join(lines))
+
+
+class SQLProfilingMiddleware:
+    """ASGI middleware collecting a RequestProfile per HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+        self.reports: set = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timing = (
+                    f'db;dur={profile.db_time * 1000:.2f};desc="{profile.queries} queries", '
+                    f"app;dur={(time.perf_counter() - start) * 1000:.2f}"
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timing.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _profile.reset(token)
+            elapsed = time.perf_counter() - start
+            if elapsed * 1000 > SQL_PROFILING_SLOW_MS or profile.queries > SQL_PROFILING_MAX_QUERIES:
+                task = asyncio.create_task(
+                    report_slow_request(scope["method"], scope["path"], elapsed, profile)
+                )
+                self.reports.add(task)
+                task.add_done_callback(self.reports.discard)
+
+
+def enable_profiling(app) -> None:
+    """Install the engine listeners and the middleware on a FastAPI app"""
+    instrument(engine)
+    instrument(async_engine.sync_engine)
+    app.add_middleware(SQLProfilingMiddleware)
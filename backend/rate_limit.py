@@ -0,0 +1,123 @@
+"""
+Rate limiting for outbound WhatsApp sends.
+
+Each Evolution API instance (tenant.wa_instance_name) gets its own token
+bucket so a large batch cannot burst past what WhatsApp tolerates for a
+single number. With REDIS_URL set the bucket lives in Redis, so the limit
+holds across every API worker, delivery process and dispatcher sender;
+without it (or while Redis is unreachable) buckets are kept per process.
+"""
+import asyncio
+import os
+import logging
+import time
+from typing import Dict
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+WA_RATE_PER_SECOND = float(os.getenv("WA_RATE_PER_SECOND", "5"))
+WA_RATE_BURST = int(os.getenv("WA_RATE_BURST", "10"))
+WA_RATE_KEY_PREFIX = os.getenv("WA_RATE_KEY_PREFIX", "28hub:ratelimit:")
+
+# Reserves one token from the bucket at KEYS[1] (ARGV: rate per second, capacity)
+# and returns how many milliseconds the caller must wait before sending. Tokens
+# may go negative, so concurrent callers are spaced out in arrival order. Uses
+# the Redis clock so processes on different hosts agree.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) * 1000 / rate) + 1000)
+if tokens >= 0 then
+    return 0
+end
+return math.ceil(-tokens * 1000 / rate)
+"""
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` stored"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it (waiters are served in order)"""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class InstanceRateLimiter:
+    """One token bucket per WhatsApp instance, kept in this process"""
+
+    def __init__(self, rate: float = WA_RATE_PER_SECOND, burst: int = WA_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    async def acquire(self, instance: str) -> None:
+        bucket = self.buckets.get(instance)
+        if bucket is None:
+            bucket = self.buckets[instance] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisInstanceRateLimiter:
+    """One token bucket per WhatsApp instance, shared by every process through Redis"""
+
+    def __init__(
+        self,
+        url: str,
+        rate: float = WA_RATE_PER_SECOND,
+        burst: int = WA_RATE_BURST,
+        prefix: str = WA_RATE_KEY_PREFIX
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self.redis = redis.from_url(url)
+        self.script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+        # Used while Redis is unreachable, so sends are still limited per process
+        self.fallback = InstanceRateLimiter(rate, burst)
+
+    async def acquire(self, instance: str) -> None:
+        try:
+            wait_ms = await self.script(keys=[f"{self.prefix}{instance}"], args=[self.rate, self.burst])
+        except Exception as e:
+            logger.error(f"Redis rate limiter unavailable for {instance}, limiting per process: {str(e)}")
+            await self.fallback.acquire(instance)
+            return
+        if wait_ms > 0:
+            await asyncio.sleep(wait_ms / 1000)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+# Global instance for easy import
+instance_limiter = RedisInstanceRateLimiter(REDIS_URL) if REDIS_URL else InstanceRateLimiter()
@@ -0,0 +1,216 @@
+"""
+Message rendering for 28Hub Connect notifications.
+Builds the WhatsApp text sent for each notification type.
+
+A tenant's active Template.content is compiled once into a render function
+and cached by (tenant_id, type, updated_at). Supported syntax:
+
+    {client_name} {client_phone} {value} {nf_number} {type}
+    {#products}- {name} x{quantity}: R$ {price}\n{/products}
+    {{ and }} for literal braces
+
+Notifications without an active template fall back to the default text.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Notification, Template
+
+TEMPLATE_CACHE_TTL = float(os.getenv("TEMPLATE_CACHE_TTL", "60"))
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "5000"))
+
+_TOKEN = re.compile(r"\{\{|\}\}|\{#(\w+)\}|\{/(\w+)\}|\{(\w+)\}")
+
+# Placeholders available at the top level of a template
+TEMPLATE_FIELDS = ("client_name", "client_phone", "value", "nf_number", "type", "products")
+
+
+class TemplateError(ValueError):
+    """Raised when template content cannot be compiled"""
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def compile_template(content: str) -> Callable[[Dict[str, Any]], str]:
+    """Compile template content into a function of the render context"""
+    stack: List[Tuple[Optional[str], list]] = [(None, [])]
+    position = 0
+    for match in _TOKEN.finditer(content):
+        parts = stack[-1][1]
+        if match.start() > position:
+            parts.append(content[position:match.start()])
+        position = match.end()
+
+        token, loop_start, loop_end, field = match.group(0), match.group(1), match.group(2), match.group(3)
+        if token in ("{{", "}}"):
+            parts.append(token[0])
+        elif loop_start:
+            stack.append((loop_start, []))
+        elif loop_end:
+            if len(stack) == 1:
+                raise TemplateError(f"Unexpected {{/{loop_end}}}")
+            name, body = stack.pop()
+            if name != loop_end:
+                raise TemplateError(f"Unexpected {{/{loop_end}}}")
+            stack[-1][1].append(_compile_loop(name, _join(body)))
+        elif len(stack) > 1 or field in TEMPLATE_FIELDS:
+            stack[-1][1].append(_compile_field(field))
+        else:
+            # Unknown placeholders are kept verbatim so typos stay visible
+            parts.append(token)
+
+    if len(stack) > 1:
+        raise TemplateError(f"Missing {{/{stack[-1][0]}}}")
+    stack[0][1].append(content[position:])
+    return _join(stack[0][1])
+
+
+def _compile_field(name: str) -> Callable[[Dict[str, Any]], str]:
+    return lambda context: _text(context.get(name))
+
+
+def _compile_loop(name: str, body: Callable[[Dict[str, Any]], str]) -> Callable[[Dict[str, Any]], str]:
+    def render(context: Dict[str, Any]) -> str:
+        items = context.get(name) or []
+        return "".join(
+            body({**context, **item} if isinstance(item, dict) else {**context, "item": item})
+            for item in items
+        )
+    return render
+
+
+def _join(parts: list) -> Callable[[Dict[str, Any]], str]:
+    # Merge adjacent literals so rendering is a single pass over few parts
+    merged: list = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != "":
+            merged.append(part)
+    if all(isinstance(part, str) for part in merged):
+        text = "".join(merged)
+        return lambda context: text
+    return lambda context: "".join(part if isinstance(part, str) else part(context) for part in merged)
+
+
+def render_context(notification: Notification) -> Dict[str, Any]:
+    """Placeholder values for a notification"""
+    return {
+        "client_name": notification.client_name,
+        "client_phone": notification.client_phone or notification.telefone,
+        "value": notification.value or notification.valor,
+        "nf_number": notification.nf_number,
+        "type": notification.type,
+        "products": notification.products,
+    }
+
+
+def default_message(notification: Notification) -> str:
+    """
+    Build the default WhatsApp message for a notification based on its type.
+    """
+    value = notification.value or notification.valor
+    if notification.type == "sale":
+        return f"🎉 Nova Venda!\n\nCliente: {notification.client_name}\nValor: R$ {value}\nNF: {notification.nf_number}"
+    elif notification.type == "quote":
+        return f"📋 Nova Cotação!\n\nCliente: {notification.client_name}\nValor: R$ {value}"
+    elif notification.type == "payment":
+        return f"💰 Pagamento Recebido!\n\nCliente: {notification.client_name}\nValor: R$ {value}"
+    return ""
+
+
+class TemplateCache:
+    """
+    Per-tenant index of active templates (refreshed every TEMPLATE_CACHE_TTL
+    seconds or on invalidation) plus an LRU of compiled render functions keyed
+    by (tenant_id, type, updated_at).
+    """
+
+    def __init__(self, ttl: float = TEMPLATE_CACHE_TTL, maxsize: int = TEMPLATE_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.active: Dict[str, Tuple[float, Dict[str, Tuple[Any, str]]]] = {}
+        self.compiled: "OrderedDict[tuple, Callable]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _active_templates(self, db: Session, tenant_id: str) -> Dict[str, Tuple[Any, str]]:
+        with self._lock:
+            entry = self.active.get(tenant_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        rows = db.execute(
+            select(Template.type, Template.updated_at, Template.content)
+            .where(Template.tenant_id == tenant_id, Template.is_active.is_(True))
+            .order_by(Template.updated_at)
+        ).all()
+        # Most recently updated template wins when a type has several
+        templates = {row.type: (row.updated_at, row.content) for row in rows}
+        with self._lock:
+            self.active[tenant_id] = (time.monotonic() + self.ttl, templates)
+        return templates
+
+    def get(self, db: Session, tenant_id: str, notification_type: str) -> Optional[Callable]:
+        """Compiled render function for a tenant's active template of a type, if any"""
+        template = self._active_templates(db, tenant_id).get(notification_type)
+        if template is None:
+            return None
+
+        key = (tenant_id, notification_type, template[0])
+        with self._lock:
+            render = self.compiled.get(key)
+            if render is not None:
+                self.compiled.move_to_end(key)
+                return render
+        try:
+            render = compile_template(template[1])
+        except TemplateError:
+            return None
+        with self._lock:
+            self.compiled[key] = render
+            while len(self.compiled) > self.maxsize:
+                self.compiled.popitem(last=False)
+        return render
+
+    def invalidate(self, tenant_id: str) -> None:
+        with self._lock:
+            self.active.pop(tenant_id, None)
+            for key in [key for key in self.compiled if key[0] == tenant_id]:
+                del self.compiled[key]
+
+
+template_cache = TemplateCache()
+
+
+def render_message(notification: Notification, db: Optional[Session] = None) -> str:
+    """
+    Render a notification with its tenant's active template when a session is
+    given, otherwise (or without a template) with the default message.
+    """
+    if db is not None:
+        render = template_cache.get(db, notification.tenant_id, notification.type)
+        if render is not None:
+            return render(render_context(notification))
+    return default_message(notification)
+
+
+def render_many(db: Session, notifications: List[Notification]) -> List[str]:
+    """Render many notifications, resolving each (tenant, type) template once"""
+    renders: Dict[Tuple[str, str], Optional[Callable]] = {}
+    messages = []
+    for notification in notifications:
+        key = (notification.tenant_id, notification.type)
+        if key not in renders:
+            renders[key] = template_cache.get(db, *key)
+        render = renders[key]
+        messages.append(render(render_context(notification)) if render else default_message(notification))
+    return messages
@@ -0,0 +1,392 @@
+"""
+Upstream resilience for 28Hub Connect backend.
+
+Every call to Evolution API, n8n and EvoAI goes through the guard of its
+upstream, which combines:
+
+- a circuit breaker: after RESILIENCE_FAILURE_THRESHOLD consecutive failures
+  (transport errors, timeouts, 5xx/429) calls fail immediately with
+  CircuitOpenError for RESILIENCE_RECOVERY_TIMEOUT seconds, then a single
+  trial call decides whether to close it again;
+- an AIMD concurrency limit: each fast success raises the limit by about one
+  per window, failures and latency spikes cut it multiplicatively; callers
+  wait at most RESILIENCE_QUEUE_TIMEOUT seconds for a slot before failing
+  with UpstreamOverloaded;
+- for idempotent reads, hedged requests (a second attempt when the first is
+  slower than usual) and retries with jittered exponential backoff.
+
+Settings can be overridden per upstream with <NAME>_BREAKER_THRESHOLD etc.
+State is per worker process.
+"""
+import asyncio
+import os
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from http_clients import UPSTREAMS
+from metrics import count_upstream_error, observe_upstream, set_circuit_state
+
+logger = logging.getLogger(__name__)
+
+RESILIENCE_FAILURE_THRESHOLD = int(os.getenv("RESILIENCE_FAILURE_THRESHOLD", "5"))
+RESILIENCE_RECOVERY_TIMEOUT = float(os.getenv("RESILIENCE_RECOVERY_TIMEOUT", "30"))
+RESILIENCE_MIN_CONCURRENCY = int(os.getenv("RESILIENCE_MIN_CONCURRENCY", "2"))
+RESILIENCE_INITIAL_CONCURRENCY = int(os.getenv("RESILIENCE_INITIAL_CONCURRENCY", "20"))
+RESILIENCE_LATENCY_TOLERANCE = float(os.getenv("RESILIENCE_LATENCY_TOLERANCE", "2.0"))
+RESILIENCE_QUEUE_TIMEOUT = float(os.getenv("RESILIENCE_QUEUE_TIMEOUT", "2"))
+RESILIENCE_RETRIES = int(os.getenv("RESILIENCE_RETRIES", "2"))
+RESILIENCE_BACKOFF_BASE = float(os.getenv("RESILIENCE_BACKOFF_BASE", "0.2"))
+# Fixed hedge delay in seconds; by default it follows observed latency
+RESILIENCE_HEDGE_DELAY = os.getenv("RESILIENCE_HEDGE_DELAY")
+
+
+class UpstreamUnavailable(httpx.HTTPError):
+    """Raised without calling the upstream when it is known to be unhealthy or saturated"""
+
+    def __init__(self, message: str, upstream: str, retry_after: float):
+        super().__init__(message)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """The upstream's circuit breaker is open"""
+
+
+class UpstreamOverloaded(UpstreamUnavailable):
+    """No concurrency slot became free for the upstream in time"""
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Errors that say the upstream is unhealthy (as opposed to a bad request)"""
+    if isinstance(error, UpstreamUnavailable):
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, httpx.TransportError)
+
+
+def error_kind(error: BaseException) -> str:
+    """Short error class for the upstream_errors_total metric"""
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, UpstreamOverloaded):
+        return "overloaded"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "connection"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code // 100}xx"
+    return "other"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half_open -> closed"""
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_inflight = False
+        self.rejected = 0
+        self.opened_count = 0
+
+    def check(self) -> None:
+        """Admit a call or raise CircuitOpenError"""
+        if self.state == "open":
+            remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {self.name}", self.name, remaining)
+            self.state = "half_open"
+            self.trial_inflight = False
+            logger.info(f"Circuit half-open for {self.name}")
+        if self.state == "half_open":
+            if self.trial_inflight:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit half-open for {self.name}", self.name, 1.0)
+            self.trial_inflight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != "closed":
+            logger.info(f"Circuit closed for {self.name}")
+        self.state = "closed"
+        self.trial_inflight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opened_count += 1
+            self.trial_inflight = False
+            logger.warning(f"Circuit opened for {self.name} after {self.failures} failures")
+
+    def record_cancel(self) -> None:
+        if self.state == "half_open":
+            self.trial_inflight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened_count,
+            "rejected": self.rejected,
+            "retry_after": max(0.0, round(self.opened_at + self.recovery_timeout - time.monotonic(), 1))
+            if self.state == "open" else 0.0,
+        }
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit. Latency is compared with a slowly moving
+    baseline; calls slower than baseline * tolerance count as congestion.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        tolerance: float,
+        queue_timeout: float
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.baseline: Optional[float] = None
+        self.waiters: deque = deque()
+        self.rejected = 0
+
+    def saturated(self) -> bool:
+        return self.inflight >= int(self.limit)
+
+    async def acquire(self) -> None:
+        if not self.waiters and not self.saturated():
+            self.inflight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            # The releasing call hands its slot over by resolving the future
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return
+            waiter.cancel()
+            self.rejected += 1
+            raise UpstreamOverloaded(f"Concurrency limit reached for {self.name}", self.name, self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, latency: Optional[float] = None, failed: bool = False) -> None:
+        self.inflight -= 1
+        if failed:
+            self.limit = max(self.min_limit, self.limit * 0.7)
+        elif latency is not None:
+            if self.baseline is None:
+                self.baseline = latency
+            if latency > self.baseline * self.tolerance:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+                # Drift up slowly so a permanently slower upstream is re-learned
+                self.baseline = self.baseline * 0.99 + latency * 0.01
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.baseline = self.baseline * 0.9 + latency * 0.1
+
+        while self.waiters and not self.saturated():
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "queued": len(self.waiters),
+            "rejected": self.rejected,
+            "baseline_latency": round(self.baseline, 4) if self.baseline is not None else None,
+        }
+
+
+def _setting(name: str, key: str, default: Any) -> Any:
+    return type(default)(os.getenv(f"{name.upper()}_{key}", default))
+
+
+class UpstreamGuard:
+    """Circuit breaker, adaptive limit, hedging and retries for one upstream"""
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=_setting(name, "BREAKER_THRESHOLD", RESILIENCE_FAILURE_THRESHOLD),
+            recovery_timeout=_setting(name, "BREAKER_RECOVERY", RESILIENCE_RECOVERY_TIMEOUT),
+        )
+        self.limiter = AdaptiveLimiter(
+            name,
+            initial=min(max_concurrency, _setting(name, "INITIAL_CONCURRENCY", RESILIENCE_INITIAL_CONCURRENCY)),
+            min_limit=_setting(name, "MIN_CONCURRENCY", RESILIENCE_MIN_CONCURRENCY),
+            max_limit=max_concurrency,
+            tolerance=RESILIENCE_LATENCY_TOLERANCE,
+            queue_timeout=RESILIENCE_QUEUE_TIMEOUT,
+        )
+        self.retries = _setting(name, "RETRIES", RESILIENCE_RETRIES)
+        self.calls = 0
+        self.failures = 0
+        self.hedged = 0
+        self.retried = 0
+
+    def hedge_delay(self) -> float:
+        if RESILIENCE_HEDGE_DELAY:
+            return float(RESILIENCE_HEDGE_DELAY)
+        if self.limiter.baseline is None:
+            return 1.0
+        return min(2.0, max(0.05, self.limiter.baseline * 3))
+
+    async def _attempt(self, fn: Callable[[], Awaitable[Any]], adaptive: bool) -> Any:
+        try:
+            self.breaker.check()
+            try:
+                await self.limiter.acquire()
+            except BaseException:
+                self.breaker.record_cancel()
+                raise
+        except UpstreamUnavailable as e:
+            count_upstream_error(self.name, error_kind(e))
+            raise
+        finally:
+            set_circuit_state(self.name, self.breaker.state)
+
+        self.calls += 1
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.breaker.record_cancel()
+            self.limiter.release()
+            observe_upstream(self.name, time.monotonic() - start, "cancelled")
+            raise
+        except Exception as e:
+            if is_upstream_failure(e):
+                self.failures += 1
+                self.breaker.record_failure()
+                self.limiter.release(failed=True)
+                observe_upstream(self.name, time.monotonic() - start, "error")
+            else:
+                # The upstream answered; the request itself was rejected
+                self.breaker.record_success()
+                self.limiter.release()
+                observe_upstream(self.name, time.monotonic() - start, "rejected")
+            count_upstream_error(self.name, error_kind(e))
+            set_circuit_state(self.name, self.breaker.state)
+            raise
+        self.breaker.record_success()
+        self.limiter.release(time.monotonic() - start if adaptive else None)
+        observe_upstream(self.name, time.monotonic() - start, "success")
+        set_circuit_state(self.name, self.breaker.state)
+        return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[Any]], adaptive: bool) -> Any:
+        tasks = [asyncio.create_task(self._attempt(fn, adaptive))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if not done and self.breaker.state == "closed" and not self.limiter.saturated():
+                self.hedged += 1
+                tasks.append(asyncio.create_task(self._attempt(fn, adaptive)))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        idempotent: bool = False,
+        adaptive: bool = True
+    ) -> Any:
+        """
+        Run an upstream call. `fn` performs one request and raises on error
+        (httpx.HTTPStatusError for bad statuses). Idempotent calls are hedged
+        and retried. Pass adaptive=False for calls whose latency says nothing
+        about upstream health (e.g. long LLM completions).
+        """
+        if not idempotent:
+            return await self._attempt(fn, adaptive)
+
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._hedged(fn, adaptive)
+            except Exception as e:
+                if attempt == self.retries or not is_upstream_failure(e):
+                    raise
+                self.retried += 1
+                delay = RESILIENCE_BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Retrying {self.name} call in {delay:.2f}s after error: {str(e)}")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats(),
+            "concurrency": self.limiter.stats(),
+            "calls": self.calls,
+            "failures": self.failures,
+            "hedged": self.hedged,
+            "retried": self.retried,
+        }
+
+
+class ResilienceRegistry:
+    """One guard per upstream, sized from the upstream's connection pool"""
+
+    def __init__(self, upstreams: Dict[str, Dict[str, Any]] = None):
+        self.guards = {
+            name: UpstreamGuard(name, config["max_connections"])
+            for name, config in (upstreams or UPSTREAMS).items()
+        }
+
+    def get(self, name: str) -> UpstreamGuard:
+        return self.guards[name]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: guard.stats() for name, guard in self.guards.items()}
+
+
+# Global instance for easy import
+upstream_guards = ResilienceRegistry()
@@ -0,0 +1,32 @@
+"""
+orjson responses for 28Hub Connect list endpoints.
+
+List endpoints select only the columns they return, labelled with the output
+field names, and return the rows through ORJSONResponse. Returning a Response
+skips FastAPI's jsonable_encoder pass; orjson writes datetimes (ISO 8601, as
+isoformat() does), UUIDs and JSON columns natively in one pass.
+"""
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any) -> Any:
+    # NUMERIC columns (valor, value) come back as Decimal on PostgreSQL
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def row_dicts(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Result rows of a labelled select as plain dicts"""
+    return [row._asdict() for row in rows]
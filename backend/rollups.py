@@ -0,0 +1,120 @@
+"""
+Daily notification rollups for 28Hub Connect backend.
+
+daily_stats holds one row per (day, tenant_id, type, status) with the number
+of notifications created that day that currently have that status. Admin
+analytics read only from it, so any window is a scan of a few rows per day
+instead of an aggregate over notifications.
+
+A background compactor rebuilds the most recent ROLLUP_LOOKBACK_DAYS days
+from notifications every ROLLUP_INTERVAL seconds (delete and re-insert in one
+transaction, served by idx_notifications_created_covering). Older days are
+final: their notifications have stopped changing status and may already be
+archived. Status changes on notifications older than the lookback (manual
+retries) show up after `python rollups.py --since <day>`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import logging
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select, text
+
+from database import SessionLocal
+from models import DailyStat, Notification
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))
+ROLLUP_LOOKBACK_DAYS = int(os.getenv("ROLLUP_LOOKBACK_DAYS", "2"))
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "true").lower() == "true"
+
+# pg_try_advisory_xact_lock key: one compactor at a time across processes
+ROLLUP_LOCK_ID = 2817002
+
+
+def compact(since: Optional[date] = None) -> int:
+    """Rebuild daily_stats from `since` (default: the lookback window) to today. Returns rows written."""
+    since = since or date.today() - timedelta(days=ROLLUP_LOOKBACK_DAYS - 1)
+    start = datetime.combine(since, datetime.min.time())
+    day = func.date(Notification.created_at)
+
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            locked = db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ROLLUP_LOCK_ID}).scalar()
+            if not locked:
+                return 0
+
+        db.execute(delete(DailyStat).where(DailyStat.day >= since))
+        result = db.execute(
+            insert(DailyStat).from_select(
+                ["day", "tenant_id", "type", "status", "count"],
+                select(
+                    day,
+                    Notification.tenant_id,
+                    func.coalesce(Notification.type, "unknown"),
+                    func.coalesce(Notification.status, "pending"),
+                    func.count()
+                )
+                .where(Notification.created_at >= start, Notification.tenant_id.isnot(None))
+                .group_by(
+                    day,
+                    Notification.tenant_id,
+                    func.coalesce(Notification.type, "unknown"),
+                    func.coalesce(Notification.status, "pending")
+                )
+            )
+        )
+        db.commit()
+        return result.rowcount
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class RollupCompactor:
+    """Periodically rebuilds the recent days of daily_stats"""
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+        logger.info("Rollup compactor started")
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(compact)
+            except Exception as e:
+                logger.error(f"Rollup compaction failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+# Global instance for easy import
+rollup_compactor = RollupCompactor()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild daily_stats from notifications")
+    parser.add_argument(
+        "--since", type=date.fromisoformat,
+        help="first day to rebuild (YYYY-MM-DD), within the notification retention window"
+    )
+    args = parser.parse_args()
+    print(json.dumps({"rows": compact(args.since)}))
@@ -0,0 +1,237 @@
+"""
+EXPLAIN benchmark for the query-shape indexes of migration 011.
+
+Seeds a throwaway schema (default `bench_indexes`) in the PostgreSQL database
+at DATABASE_URL, runs each hot query with EXPLAIN (ANALYZE, BUFFERS) on the
+indexes that existed before migration 011 and again after creating its
+indexes, and checks that every query uses the index it was built for.
+The schema is dropped afterwards unless --keep is given.
+
+Usage:
+    DATABASE_URL=postgresql://... python scripts/benchmark_indexes.py
+    python scripts/benchmark_indexes.py --notifications 1000000 --json results.json
+
+Exits with status 1 if any query does not use its expected index.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from database import DATABASE_URL, Base  # noqa: E402
+import models  # noqa: E402,F401  (registers the tables on Base.metadata)
+
+MIGRATION = BACKEND_DIR / "alembic" / "versions" / "011_query_shape_indexes.py"
+
+# Indexes from migrations 004 and 008, i.e. the state migration 011 starts from
+BASELINE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_notifications_tenant_status ON notifications (tenant_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_tenants_plan_status ON tenants (plan, status)",
+]
+
+TENANT = "tenant-000001"
+
+# name -> (query, expected index, whether an index-only scan is expected)
+CASES = {
+    "notifications_page": (
+        "SELECT * FROM notifications WHERE tenant_id = :tenant "
+        "ORDER BY created_at DESC, id DESC LIMIT 50",
+        "idx_notifications_tenant_list", False,
+    ),
+    "activities_page": (
+        "SELECT id, type, client_name, telefone, valor, nf_number, status, retry_count, "
+        "next_attempt_at, created_at FROM notifications WHERE tenant_id = :tenant "
+        "ORDER BY created_at DESC, id DESC LIMIT 50",
+        "idx_notifications_tenant_list", True,
+    ),
+    "failed_page": (
+        "SELECT * FROM notifications WHERE tenant_id = :tenant AND status = 'failed' "
+        "ORDER BY created_at DESC, id DESC LIMIT 50",
+        "idx_notifications_failed", False,
+    ),
+    "pending_chunk": (
+        "SELECT id, created_at FROM notifications WHERE tenant_id = :tenant AND status = 'pending' "
+        "AND (created_at > :after OR (created_at = :after AND id > '')) "
+        "ORDER BY created_at, id LIMIT 500",
+        "idx_notifications_pending", True,
+    ),
+    "pending_count": (
+        "SELECT count(*) FROM notifications WHERE tenant_id = :tenant AND status = 'pending'",
+        "idx_notifications_pending", True,
+    ),
+    "analytics_per_day": (
+        "SELECT date(created_at), count(id) FROM notifications "
+        "WHERE created_at >= now() - interval '7 days' GROUP BY date(created_at)",
+        "idx_notifications_created_covering", True,
+    ),
+    "tenant_by_email": (
+        "SELECT * FROM tenants WHERE email = 'tenant42@example.com'",
+        "tenants_email_key", False,
+    ),
+    "tenant_by_stripe_customer": (
+        "SELECT * FROM tenants WHERE stripe_customer_id = 'cus_000042'",
+        "uq_tenants_stripe_customer_id", False,
+    ),
+}
+
+SEED_TENANTS = """
+INSERT INTO tenants (id, name, wa_number, plan, api_key, status, email, stripe_customer_id, created_at, updated_at)
+SELECT
+    'tenant-' || lpad(g::text, 6, '0'),
+    'Tenant ' || g,
+    '5511' || lpad(g::text, 9, '0'),
+    (ARRAY['trial', 'basic', 'pro', 'enterprise'])[1 + g % 4],
+    md5('key' || g),
+    'active',
+    'tenant' || g || '@example.com',
+    CASE WHEN g % 2 = 0 THEN 'cus_' || lpad(g::text, 6, '0') END,
+    now() - (g % 365) * interval '1 day',
+    now()
+FROM generate_series(1, :tenants) AS g
+"""
+
+SEED_NOTIFICATIONS = """
+INSERT INTO notifications (
+    id, tenant_id, type, client_name, client_phone, telefone, value, valor,
+    nf_number, status, retry_count, created_at, event_type
+)
+SELECT
+    'n-' || g,
+    'tenant-' || lpad((1 + g % :tenants)::text, 6, '0'),
+    (ARRAY['sale', 'quote', 'payment'])[1 + g % 3],
+    'Cliente ' || g,
+    '5511' || lpad((g % 1000000000)::text, 9, '0'),
+    '5511' || lpad((g % 1000000000)::text, 9, '0'),
+    round((r * 1000)::numeric, 2),
+    round((r * 1000)::numeric, 2),
+    'NF' || g,
+    CASE WHEN r < 0.02 THEN 'pending' WHEN r < 0.06 THEN 'failed' WHEN r < 0.065 THEN 'sending' ELSE 'sent' END,
+    CASE WHEN r >= 0.02 AND r < 0.06 THEN 1 + g % 3 ELSE 0 END,
+    now() - (random() * 90) * interval '1 day',
+    (ARRAY['sale', 'quote', 'payment'])[1 + g % 3]
+FROM (SELECT g, random() AS r FROM generate_series(1, :notifications) AS g) AS s
+"""
+
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location("migration_011", MIGRATION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def plan_nodes(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten an EXPLAIN JSON plan tree"""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def explain(conn, query: str) -> Dict[str, Any]:
+    params = {"tenant": TENANT, "after": "2000-01-01"}
+    # Warm the cache once so timings compare plans, not disk reads
+    conn.execute(text(query), params).all()
+    raw = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}"), params).scalar()
+    result = raw[0] if isinstance(raw, list) else json.loads(raw)[0]
+    nodes = plan_nodes(result["Plan"])
+    return {
+        "nodes": [node["Node Type"] for node in nodes],
+        "indexes": sorted({node["Index Name"] for node in nodes if "Index Name" in node}),
+        "shared_hit": result["Plan"].get("Shared Hit Blocks", 0),
+        "shared_read": result["Plan"].get("Shared Read Blocks", 0),
+        "execution_ms": round(result["Execution Time"], 3),
+    }
+
+
+def run_cases(conn) -> Dict[str, Dict[str, Any]]:
+    return {name: explain(conn, query) for name, (query, _, _) in CASES.items()}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--schema", default="bench_indexes")
+    parser.add_argument("--tenants", type=int, default=2000)
+    parser.add_argument("--notifications", type=int, default=500000)
+    parser.add_argument("--seed", type=float, default=0.42, help="setseed() value for reproducible data")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark schema")
+    args = parser.parse_args()
+
+    if not args.database_url.startswith(("postgresql", "postgres")):
+        print("This benchmark needs a PostgreSQL DATABASE_URL", file=sys.stderr)
+        return 2
+
+    migration = load_migration()
+    engine = create_engine(
+        args.database_url,
+        isolation_level="AUTOCOMMIT",
+        connect_args={"options": f"-csearch_path={args.schema}"}
+    )
+
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        Base.metadata.create_all(conn)
+
+        # Start from the pre-011 index set
+        for name, _ in migration.INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for statement in BASELINE_INDEXES:
+            conn.execute(text(statement))
+        for _, definition in migration.SUPERSEDED:
+            conn.execute(text(definition.replace(" CONCURRENTLY", "")))
+
+        print(f"Seeding {args.tenants} tenants and {args.notifications} notifications...")
+        conn.execute(text("SELECT setseed(:seed)"), {"seed": args.seed})
+        conn.execute(text(SEED_TENANTS), {"tenants": args.tenants})
+        conn.execute(text(SEED_NOTIFICATIONS), {"tenants": args.tenants, "notifications": args.notifications})
+        conn.execute(text("VACUUM ANALYZE tenants"))
+        conn.execute(text("VACUUM ANALYZE notifications"))
+        before = run_cases(conn)
+
+        for _, definition in migration.INDEXES:
+            conn.execute(text(definition))
+        for name, _ in migration.SUPERSEDED:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text("VACUUM ANALYZE tenants"))
+        conn.execute(text("VACUUM ANALYZE notifications"))
+        after = run_cases(conn)
+
+        if not args.keep:
+            conn.execute(text(f"DROP SCHEMA {args.schema} CASCADE"))
+
+    failures = 0
+    results = {}
+    print(f"\n{'query':<28} {'before ms':>10} {'after ms':>10}  after plan")
+    for name, (_, expected, index_only) in CASES.items():
+        ok = expected in after[name]["indexes"] and (not index_only or "Index Only Scan" in after[name]["nodes"])
+        failures += not ok
+        results[name] = {"expected_index": expected, "ok": ok, "before": before[name], "after": after[name]}
+        plan = " > ".join(after[name]["nodes"])
+        print(
+            f"{name:<28} {before[name]['execution_ms']:>10.3f} {after[name]['execution_ms']:>10.3f}  "
+            f"{'OK  ' if ok else 'FAIL'} {plan} [{', '.join(after[name]['indexes'])}]"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if failures:
+        print(f"\n{failures} queries did not use their expected index", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,465 @@
+"""
+Fixed-arrival-rate load test for the 28Hub Connect API.
+
+Seeds loadtest tenants (ids `loadtest-000001`, ...) and their notifications
+into the database at DATABASE_URL (PostgreSQL or SQLite), starts the mock
+upstreams (scripts/mock_upstreams.py) and the API under uvicorn with the
+upstream URLs pointed at the mock, then drives each scenario at a fixed
+arrival rate:
+
+- erp_webhook:       POST /api/v1/28hub/{tenant_id}/webhook/erp
+- send_batch:        POST /api/v1/28hub/{tenant_id}/send-batch
+- get_notifications: GET  /api/v1/28hub/{tenant_id}/notifications
+- tenant_dashboard:  GET  /api/v1/28hub/{tenant_id}/dashboard
+- chat_message:      POST /api/v1/28hub/{tenant_id}/chat
+
+Requests are sent on schedule whether or not earlier ones finished (open
+loop), and latency is measured from the scheduled send time, so a server
+that falls behind shows it in the percentiles instead of silently lowering
+the request rate. The first --warmup seconds of each scenario are not
+counted.
+
+Usage:
+    DATABASE_URL=postgresql://... python scripts/loadtest.py --json results.json
+    python scripts/loadtest.py --scenario get_notifications --rate 200 --duration 60
+    python scripts/loadtest.py --rate chat_message=5 --latency evoai=1500 --compare baseline.json
+    python scripts/loadtest.py --base-url http://staging:8000 --no-seed   # API already running
+
+The JSON output records throughput, error counts and latency percentiles per
+scenario together with the git commit, so runs can be compared across
+commits with --compare.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+from sqlalchemy import create_engine, delete, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from database import DATABASE_URL, Base  # noqa: E402
+from models import (  # noqa: E402
+    DailyStat,
+    Notification,
+    NotificationIdempotencyKey,
+    Template,
+    Tenant,
+    TenantNotificationStats,
+)
+from stats import rebuild_tenant_stats  # noqa: E402
+from mock_upstreams import add_behavior_arguments, behavior_argv  # noqa: E402
+
+TENANT_PREFIX = "loadtest-"
+STATUSES = ("sent",) * 14 + ("failed", "pending")
+PERCENTILES = (50, 90, 95, 99)
+
+Request = Tuple[str, str, Optional[dict]]
+
+
+# Scenarios: (tenant, request number, rng) -> (method, path, json body)
+
+def erp_webhook(tenant: Dict[str, str], n: int, rng: random.Random) -> Request:
+    return "POST", f"/api/v1/28hub/{tenant['id']}/webhook/erp", {
+        "type": rng.choice(("sale", "quote", "payment")),
+        "nf_number": f"LT{tenant['run']}-{n}",
+        "client_name": f"Cliente {n}",
+        "client_phone": f"5511{rng.randrange(10**9):09d}",
+        "value": round(rng.uniform(10, 5000), 2),
+        "products": [{"name": "Produto", "qty": rng.randint(1, 5)}],
+    }
+
+
+def send_batch(tenant: Dict[str, str], n: int, rng: random.Random) -> Request:
+    return "POST", f"/api/v1/28hub/{tenant['id']}/send-batch", None
+
+
+def get_notifications(tenant: Dict[str, str], n: int, rng: random.Random) -> Request:
+    return "GET", f"/api/v1/28hub/{tenant['id']}/notifications?limit=50", None
+
+
+def tenant_dashboard(tenant: Dict[str, str], n: int, rng: random.Random) -> Request:
+    return "GET", f"/api/v1/28hub/{tenant['id']}/dashboard", None
+
+
+def chat_message(tenant: Dict[str, str], n: int, rng: random.Random) -> Request:
+    return "POST", f"/api/v1/28hub/{tenant['id']}/chat", {
+        "text": f"Qual o status do pedido {n}?",
+        "session_id": f"loadtest-session-{n % 100}",
+    }
+
+
+SCENARIOS: Dict[str, Callable[[Dict[str, str], int, random.Random], Request]] = {
+    "erp_webhook": erp_webhook,
+    "send_batch": send_batch,
+    "get_notifications": get_notifications,
+    "tenant_dashboard": tenant_dashboard,
+    "chat_message": chat_message,
+}
+
+# Arrival rates (requests/second) used unless --rate overrides them
+DEFAULT_RATES = {
+    "erp_webhook": 100.0,
+    "send_batch": 10.0,
+    "get_notifications": 100.0,
+    "tenant_dashboard": 100.0,
+    "chat_message": 10.0,
+}
+
+
+def tenant_rows(count: int) -> List[Dict[str, Any]]:
+    now = datetime.now()
+    return [
+        {
+            "id": f"{TENANT_PREFIX}{i:06d}",
+            "name": f"Load Test {i}",
+            "wa_number": f"5511{i:09d}",
+            # chat_message needs pro or enterprise; wa_instance_name doubles as the agent id
+            "plan": "enterprise" if i % 4 == 0 else "pro",
+            "api_key": f"loadtest-key-{i:06d}",
+            "status": "active",
+            "wa_instance_name": f"{TENANT_PREFIX}{i:06d}",
+            "wa_status": "connected",
+            "email": f"loadtest{i}@example.com",
+            "trial_ends": now + timedelta(days=30),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def notification_rows(tenant_id: str, count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    now = datetime.now()
+    rows = []
+    for n in range(count):
+        status = rng.choice(STATUSES)
+        created_at = now - timedelta(seconds=rng.randrange(30 * 86400))
+        value = round(rng.uniform(10, 5000), 2)
+        phone = f"5511{rng.randrange(10**9):09d}"
+        kind = rng.choice(("sale", "quote", "payment"))
+        rows.append({
+            "id": f"{tenant_id}-n{n:07d}",
+            "tenant_id": tenant_id,
+            "type": kind,
+            "client_name": f"Cliente {n}",
+            "client_phone": phone,
+            "telefone": phone,
+            "value": value,
+            "valor": value,
+            "nf_number": f"NF{n}",
+            "status": status,
+            "retry_count": 1 if status == "failed" else 0,
+            "created_at": created_at,
+            "sent_at": created_at + timedelta(seconds=2) if status == "sent" else None,
+            "event_type": kind,
+        })
+    return rows
+
+
+def seed(database_url: str, tenants: int, notifications: int, seed_value: int) -> None:
+    """Replace the loadtest tenants and their notifications with a fresh deterministic set"""
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine, checkfirst=True)
+    rng = random.Random(seed_value)
+    tenant_filter = Tenant.id.like(f"{TENANT_PREFIX}%")
+
+    with Session(engine) as db:
+        for model in (NotificationIdempotencyKey, DailyStat, TenantNotificationStats, Template, Notification):
+            db.execute(delete(model).where(model.tenant_id.like(f"{TENANT_PREFIX}%")))
+        db.execute(delete(Tenant).where(tenant_filter))
+        db.execute(insert(Tenant), tenant_rows(tenants))
+        for tenant in tenant_rows(tenants):
+            rows = notification_rows(tenant["id"], notifications, rng)
+            for start in range(0, len(rows), 1000):
+                db.execute(insert(Notification), rows[start:start + 1000])
+            rebuild_tenant_stats(db, tenant["id"])
+        db.commit()
+    engine.dispose()
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values), max(1, math.ceil(pct / 100 * len(sorted_values)))) - 1
+    return sorted_values[rank]
+
+
+def summarize(name: str, rate: float, measured: float, latencies: List[float], statuses: Counter,
+              dropped: int) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "scenario": name,
+        "target_rate": rate,
+        "measured_seconds": round(measured, 3),
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "errors": {str(status): count for status, count in sorted(statuses.items(), key=str)
+                   if not (isinstance(status, int) and status < 400)},
+        "dropped": dropped,
+        "throughput_rps": round(ok / measured, 2) if measured else 0.0,
+        "latency_ms": {
+            **{f"p{pct}": round(percentile(latencies, pct) * 1000, 2) for pct in PERCENTILES},
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    name: str,
+    rate: float,
+    duration: float,
+    warmup: float,
+    tenants: List[Dict[str, str]],
+    max_in_flight: int,
+    seed_value: int,
+) -> Dict[str, Any]:
+    """Send `rate` requests per second for warmup + duration seconds and time them"""
+    build = SCENARIOS[name]
+    rng = random.Random(f"{seed_value}-{name}")
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    dropped = 0
+    in_flight: set = set()
+
+    async def fire(n: int, scheduled: float, counted: bool) -> None:
+        tenant = tenants[n % len(tenants)]
+        method, path, body = build(tenant, n, rng)
+        try:
+            response = await client.request(method, path, json=body, headers={"X-API-Key": tenant["api_key"]})
+            outcome = response.status_code
+        except httpx.TimeoutException:
+            outcome = "timeout"
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        if counted:
+            latencies.append(time.perf_counter() - scheduled)
+            statuses[outcome] += 1
+
+    start = time.perf_counter()
+    total = int((warmup + duration) * rate)
+    for n in range(total):
+        scheduled = start + n / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        counted = n >= warmup * rate
+        if len(in_flight) >= max_in_flight:
+            # The client cannot keep up; count the miss instead of queueing it
+            dropped += counted
+            continue
+        task = asyncio.create_task(fire(n, scheduled, counted))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    if in_flight:
+        await asyncio.wait(in_flight)
+    measured = time.perf_counter() - start - warmup
+    return summarize(name, rate, measured, latencies, statuses, dropped)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_servers(args) -> List[subprocess.Popen]:
+    """Start the mock upstreams and the API on local ports"""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = subprocess.Popen(
+        [sys.executable, str(BACKEND_DIR / "scripts" / "mock_upstreams.py"), "--port", str(args.mock_port)]
+        + behavior_argv(args)
+    )
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "EVOLUTION_URL": mock_url,
+        "N8N_WEBHOOK_URL": f"{mock_url}/webhook/28hub",
+        "EVOAI_URL": mock_url,
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.api_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    servers = [mock, api]
+    try:
+        wait_ready(f"{mock_url}/_mock/stats")
+        wait_ready(f"http://127.0.0.1:{args.api_port}/health", timeout=60.0)
+    except RuntimeError:
+        stop_servers(servers)
+        raise
+    return servers
+
+
+def stop_servers(servers: List[subprocess.Popen]) -> None:
+    # API first, so its delivery workers do not fail against a stopped mock
+    for server in reversed(servers):
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def parse_rates(values: List[str]) -> Dict[str, float]:
+    """`scenario=rate` pairs, or a bare rate applying to every scenario"""
+    rates = dict(DEFAULT_RATES)
+    for item in values or []:
+        name, _, value = item.rpartition("=")
+        for target in ([name] if name else SCENARIOS):
+            if target not in SCENARIOS:
+                raise SystemExit(f"--rate: unknown scenario '{target}'")
+            rates[target] = float(value)
+    return rates
+
+
+def compare(results: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {s["scenario"]: s for s in json.load(f)["scenarios"]}
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'scenario':<20} {'rps':>16} {'p95 ms':>20} {'p99 ms':>20}")
+    for current in results["scenarios"]:
+        before = baseline.get(current["scenario"])
+        if not before:
+            continue
+        cells = []
+        for old, new in (
+            (before["throughput_rps"], current["throughput_rps"]),
+            (before["latency_ms"]["p95"], current["latency_ms"]["p95"]),
+            (before["latency_ms"]["p99"], current["latency_ms"]["p99"]),
+        ):
+            change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+            cells.append(f"{old:.1f}->{new:.1f} {change}")
+        print(f"{current['scenario']:<20} {cells[0]:>16} {cells[1]:>20} {cells[2]:>20}")
+
+
+async def run(args, rates: Dict[str, float], tenants: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        jobs = [
+            run_scenario(client, name, rates[name], args.duration, args.warmup, tenants, args.max_in_flight, args.seed)
+            for name in args.scenario
+        ]
+        if args.concurrent:
+            return list(await asyncio.gather(*jobs))
+        return [await job for job in jobs]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--base-url", help="target an API that is already running instead of starting one")
+    parser.add_argument("--api-port", type=int, default=8900)
+    parser.add_argument("--mock-port", type=int, default=9900)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started API")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--rate", action="append", metavar="[SCENARIO=]RPS",
+                        help="arrival rate for one scenario, or for all of them")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before each scenario")
+    parser.add_argument("--concurrent", action="store_true", help="run the scenarios at the same time")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout per request (seconds)")
+    parser.add_argument("--max-in-flight", type=int, default=1000,
+                        help="outstanding requests before new ones are dropped")
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--notifications", type=int, default=2000, help="seeded notifications per tenant")
+    parser.add_argument("--seed", type=int, default=42, help="seed for generated data and request payloads")
+    parser.add_argument("--no-seed", action="store_true", help="reuse the loadtest tenants already in the database")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON of an earlier run to compare with")
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    args.scenario = args.scenario or list(SCENARIOS)
+    rates = parse_rates(args.rate)
+    tenants = [
+        {"id": row["id"], "api_key": row["api_key"], "run": f"{args.seed}-{int(time.time())}"}
+        for row in tenant_rows(args.tenants)
+    ]
+
+    if not args.no_seed:
+        print(f"Seeding {args.tenants} tenants with {args.notifications} notifications each...")
+        seed(args.database_url, args.tenants, args.notifications, args.seed)
+
+    servers = []
+    if not args.base_url:
+        servers = start_servers(args)
+        args.base_url = f"http://127.0.0.1:{args.api_port}"
+
+    try:
+        started_at = datetime.now().isoformat()
+        scenarios = asyncio.run(run(args, rates, tenants))
+        upstream_calls = None
+        if servers:
+            upstream_calls = httpx.get(f"http://127.0.0.1:{args.mock_port}/_mock/stats").json()
+    finally:
+        stop_servers(servers)
+
+    results = {
+        "git_commit": git_commit(),
+        "started_at": started_at,
+        "base_url": args.base_url,
+        "database": args.database_url.split(":", 1)[0],
+        "config": {
+            "duration": args.duration, "warmup": args.warmup, "concurrent": args.concurrent,
+            "workers": args.workers, "tenants": args.tenants, "notifications": args.notifications,
+            "seed": args.seed, "mock": behavior_argv(args) if servers else None,
+        },
+        "scenarios": scenarios,
+        "upstream_calls": upstream_calls,
+    }
+
+    print(f"\n{'scenario':<20} {'rate':>7} {'rps':>8} {'ok':>7} {'errors':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for s in scenarios:
+        latency = s["latency_ms"]
+        print(
+            f"{s['scenario']:<20} {s['target_rate']:>7.1f} {s['throughput_rps']:>8.1f} {s['ok']:>7} "
+            f"{sum(s['errors'].values()) + s['dropped']:>7} {latency['p50']:>8.1f} {latency['p95']:>8.1f} "
+            f"{latency['p99']:>8.1f} {latency['max']:>8.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Local stand-in for Evolution API, the n8n webhook and EvoAI, for load tests.
+
+One server answers all three upstreams, so the backend only needs:
+
+    EVOLUTION_URL=http://127.0.0.1:9900
+    N8N_WEBHOOK_URL=http://127.0.0.1:9900/webhook/28hub
+    EVOAI_URL=http://127.0.0.1:9900
+
+Each upstream has its own latency (fixed part plus uniform jitter), error
+rate (answered with --error-status) and hang rate (no answer for --hang
+seconds, to exercise client timeouts and the circuit breakers). Outcomes are
+drawn from a seeded RNG, so a run with the same seed and request order
+injects the same faults.
+
+Usage:
+    python scripts/mock_upstreams.py --port 9900
+    python scripts/mock_upstreams.py --latency evolution=120 --latency evoai=900 --error-rate evolution=0.02
+
+GET /_mock/stats returns call counts per upstream and outcome;
+PUT /_mock/config {"evolution": {"error_rate": 0.5}} changes behaviour
+while a test is running.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, List
+from uuid import uuid4
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+UPSTREAMS = ("evolution", "n8n", "evoai")
+
+# Typical latencies of the real services, in milliseconds
+DEFAULT_LATENCY_MS = {"evolution": 80.0, "n8n": 30.0, "evoai": 800.0}
+
+
+@dataclass
+class Behavior:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    hang_rate: float = 0.0
+    hang_seconds: float = 30.0
+
+
+class MockUpstreams:
+    """Behaviour and call counters shared by the mock endpoints"""
+
+    def __init__(self, behaviors: Dict[str, Behavior], seed: int = 42):
+        self.behaviors = behaviors
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+
+    def configure(self, changes: Dict[str, Dict[str, float]]) -> None:
+        for upstream, values in changes.items():
+            behavior = self.behaviors[upstream]
+            for name, value in values.items():
+                setattr(behavior, name, type(getattr(behavior, name))(value))
+
+    async def outcome(self, upstream: str) -> str:
+        """Sleep for the upstream's latency and decide how the call ends: ok, error or hang"""
+        behavior = self.behaviors[upstream]
+        roll = self.rng.random()
+        delay = (behavior.latency_ms + self.rng.uniform(0, behavior.jitter_ms)) / 1000
+        if roll < behavior.hang_rate:
+            outcome, delay = "hang", behavior.hang_seconds
+        elif roll < behavior.hang_rate + behavior.error_rate:
+            outcome = "error"
+        else:
+            outcome = "ok"
+        self.calls[(upstream, outcome)] += 1
+        await asyncio.sleep(delay)
+        return outcome
+
+    def error(self, upstream: str) -> JSONResponse:
+        status = self.behaviors[upstream].error_status
+        return JSONResponse({"error": f"injected {upstream} failure"}, status_code=status)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        result: Dict[str, Dict[str, int]] = {upstream: {} for upstream in UPSTREAMS}
+        for (upstream, outcome), count in sorted(self.calls.items()):
+            result[upstream][outcome] = count
+        return result
+
+
+def create_app(mock: MockUpstreams) -> FastAPI:
+    app = FastAPI(title="28hub-connect mock upstreams")
+
+    # Evolution API
+    @app.post("/message/{endpoint}/{instance}")
+    async def send_message(endpoint: str, instance: str, payload: dict):
+        if await mock.outcome("evolution") != "ok":
+            return mock.error("evolution")
+        return {
+            "key": {"remoteJid": f"{payload.get('number')}@s.whatsapp.net", "fromMe": True, "id": uuid4().hex.upper()},
+            "status": "PENDING",
+            "messageTimestamp": int(time.time()),
+            "instance": instance,
+            "endpoint": endpoint,
+        }
+
+    @app.post("/instance/create")
+    async def create_instance(payload: dict):
+        if await mock.outcome("evolution") != "ok":
+            return mock.error("evolution")
+        return {"instance": {"instanceName": payload.get("instanceName"), "status": "created"}}
+
+    @app.get("/instance/connect/{instance}")
+    async def connect_instance(instance: str):
+        if await mock.outcome("evolution") != "ok":
+            return mock.error("evolution")
+        return {"instance": instance, "base64": "data:image/png;base64,", "code": "mock"}
+
+    # n8n
+    @app.post("/webhook/28hub/{path:path}")
+    async def n8n_webhook(path: str):
+        if await mock.outcome("n8n") != "ok":
+            return mock.error("n8n")
+        return {"message": "Workflow was started"}
+
+    # EvoAI
+    @app.get("/")
+    async def evoai_health():
+        return {"status": "ok"}
+
+    @app.post("/api/v1/chat/{agent_id}/{external_id}")
+    async def chat(agent_id: str, external_id: str, payload: dict, request: Request):
+        if await mock.outcome("evoai") != "ok":
+            return mock.error("evoai")
+        reply = f"Resposta simulada para: {payload.get('message')}"
+        if "text/event-stream" not in request.headers.get("accept", ""):
+            return {"response": reply, "status": "completed", "timestamp": time.time()}
+
+        async def events():
+            for word in reply.split():
+                yield f"data: {json.dumps({'content': word + ' '})}\n\n".encode()
+                await asyncio.sleep(0.01)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/api/v1/agents")
+    async def create_agent(payload: dict):
+        if await mock.outcome("evoai") != "ok":
+            return mock.error("evoai")
+        return {"id": str(uuid4()), **payload}
+
+    @app.api_route("/api/v1/agents/{agent_id}", methods=["GET", "PUT", "DELETE"])
+    async def agent(agent_id: str):
+        if await mock.outcome("evoai") != "ok":
+            return mock.error("evoai")
+        return {"id": agent_id, "name": "Mock agent", "model": "mock"}
+
+    @app.get("/api/v1/sessions/{session_id}/messages")
+    async def session_messages(session_id: str):
+        if await mock.outcome("evoai") != "ok":
+            return mock.error("evoai")
+        return []
+
+    # Control
+    @app.get("/_mock/stats")
+    async def stats():
+        return mock.stats()
+
+    @app.get("/_mock/config")
+    async def get_config():
+        return {upstream: asdict(behavior) for upstream, behavior in mock.behaviors.items()}
+
+    @app.put("/_mock/config")
+    async def put_config(changes: dict):
+        mock.configure(changes)
+        return {upstream: asdict(behavior) for upstream, behavior in mock.behaviors.items()}
+
+    return app
+
+
+def parse_overrides(values: List[str], option: str) -> Dict[str, float]:
+    """`name=value` pairs, or a bare value applying to every upstream"""
+    result = {}
+    for item in values or []:
+        name, _, value = item.rpartition("=")
+        targets = [name] if name else UPSTREAMS
+        for target in targets:
+            if target not in UPSTREAMS:
+                raise SystemExit(f"{option}: unknown upstream '{target}' (expected one of {', '.join(UPSTREAMS)})")
+            result[target] = float(value)
+    return result
+
+
+def build_behaviors(args) -> Dict[str, Behavior]:
+    behaviors = {upstream: Behavior(latency_ms=DEFAULT_LATENCY_MS[upstream]) for upstream in UPSTREAMS}
+    for field in fields(Behavior):
+        for upstream, value in parse_overrides(getattr(args, field.name), field.name).items():
+            setattr(behaviors[upstream], field.name, type(getattr(behaviors[upstream], field.name))(value))
+    return behaviors
+
+
+def add_behavior_arguments(parser: argparse.ArgumentParser) -> None:
+    """Per-upstream behaviour options, shared with scripts/loadtest.py"""
+    group = parser.add_argument_group("upstream behaviour (NAME=VALUE for one upstream, VALUE for all)")
+    group.add_argument("--latency", dest="latency_ms", action="append", metavar="[NAME=]MS")
+    group.add_argument("--jitter", dest="jitter_ms", action="append", metavar="[NAME=]MS")
+    group.add_argument("--error-rate", action="append", metavar="[NAME=]FRACTION")
+    group.add_argument("--error-status", action="append", metavar="[NAME=]STATUS")
+    group.add_argument("--hang-rate", action="append", metavar="[NAME=]FRACTION")
+    group.add_argument("--hang", dest="hang_seconds", action="append", metavar="[NAME=]SECONDS")
+    group.add_argument("--mock-seed", type=int, default=42, help="RNG seed for latency jitter and faults")
+
+
+def behavior_argv(args) -> List[str]:
+    """Command line reproducing the behaviour options parsed by add_behavior_arguments"""
+    argv = ["--mock-seed", str(args.mock_seed)]
+    for action, dest in (
+        ("--latency", "latency_ms"), ("--jitter", "jitter_ms"), ("--error-rate", "error_rate"),
+        ("--error-status", "error_status"), ("--hang-rate", "hang_rate"), ("--hang", "hang_seconds"),
+    ):
+        for value in getattr(args, dest) or []:
+            argv += [action, value]
+    return argv
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9900)
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    mock = MockUpstreams(build_behaviors(args), seed=args.mock_seed)
+    uvicorn.run(create_app(mock), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,433 @@
+"""
+Synthetic data generator for large-tenant benchmark datasets.
+
+Seeds `tenants`, `templates` and `notifications` (the tables of models.py)
+in the database at DATABASE_URL with:
+
+- notifications spread over tenants by a Zipf distribution (--skew), so a
+  few tenants hold a large share of the rows, as in production
+- created_at over the last --days days, weighted towards recent days
+  (--growth), business hours and weekdays
+- status mix by age: recent rows are still pending, sending or being
+  retried; older ones are sent, or failed after exhausting their retries
+  (--failure-rate)
+- `products` lists with a long-tailed item count (1 to 200 items)
+- plans by tenant size: the largest tenants are enterprise and pro
+
+Rows are bulk loaded with COPY on PostgreSQL (executemany elsewhere), in
+chunks of CHUNK_ROWS rows, spread over --jobs processes. Every chunk draws
+from its own RNG seeded by (--seed, tenant, chunk number), so the same
+arguments produce the same rows regardless of --jobs; timestamps are
+relative to --now, which defaults to the current time. On a partitioned
+notifications table the monthly partitions covering --days are created
+first. Afterwards tenant_notification_stats and daily_stats are rebuilt for
+the seeded data and the tables analyzed.
+
+Usage:
+    DATABASE_URL=postgresql://... python scripts/seed_data.py --tenants 10000 --notifications 10000000 --jobs 4
+    python scripts/seed_data.py --notifications 1000000 --skew 1.3 --days 180 --seed 7 --now 2026-01-01T12:00
+    python scripts/seed_data.py --replace    # delete rows from an earlier run with the same --prefix first
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy import case, delete, func, insert, literal, select, text  # noqa: E402
+
+from database import Base, engine  # noqa: E402
+from models import (  # noqa: E402
+    DailyStat,
+    Notification,
+    NotificationIdempotencyKey,
+    Template,
+    Tenant,
+    TenantNotificationStats,
+)
+from partitions import ensure_partitions, is_partitioned  # noqa: E402
+from rollups import compact  # noqa: E402
+
+CHUNK_ROWS = 100000
+
+TENANT_COLUMNS = (
+    "id", "name", "wa_number", "plan", "trial_ends", "api_key", "status", "wa_instance_name",
+    "created_at", "updated_at", "email", "phone", "wa_status", "stripe_customer_id",
+)
+TEMPLATE_COLUMNS = ("id", "tenant_id", "name", "type", "content", "is_active", "created_at", "updated_at")
+NOTIFICATION_COLUMNS = (
+    "id", "tenant_id", "type", "client_name", "client_phone", "telefone", "value", "valor", "nf_number",
+    "status", "whatsapp_id", "whatsapp_message_id", "products", "error_message", "retry_count",
+    "created_at", "sent_at", "next_attempt_at", "claimed_at", "event_type",
+)
+
+TYPES = ("sale", "quote", "payment")
+TYPE_WEIGHTS = (60, 25, 15)
+# Share of notifications per hour of day (business hours peak)
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 4, 8, 14, 18, 20, 19, 14, 16, 19, 19, 17, 14, 10, 7, 5, 4, 2, 1)
+# Chance that a weekend day drawn for a row is kept
+WEEKEND_ACCEPT = 0.35
+
+FIRST_NAMES = (
+    "Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+    "Karina", "Lucas", "Mariana", "Nicolas", "Olivia", "Pedro", "Rafaela", "Samuel", "Tatiana", "Vinícius",
+)
+LAST_NAMES = (
+    "Almeida", "Barbosa", "Cardoso", "Dias", "Ferreira", "Gomes", "Lima", "Martins", "Nunes", "Oliveira",
+    "Pereira", "Ribeiro", "Santos", "Souza", "Teixeira", "Vieira",
+)
+COMPANY_SUFFIXES = ("Distribuidora", "Comércio", "Atacado", "Indústria", "Materiais", "Alimentos", "Tech")
+PRODUCT_NAMES = (
+    "Cimento CP-II 50kg", "Parafuso 6mm (cx 100)", "Tinta Acrílica 18L", "Cabo Flexível 2,5mm", "Café 500g",
+    "Arroz 5kg", "Notebook 15\"", "Mouse sem fio", "Caixa de papelão", "Luva nitrílica (cx)",
+    "Óleo de soja 900ml", "Resma A4", "Lâmpada LED 9W", "Torneira cromada", "Detergente 5L",
+)
+ERROR_MESSAGES = (
+    "Failed to send WhatsApp message: 400 Bad Request (number not on WhatsApp)",
+    "Evolution API unavailable: Circuit open for evolution",
+    "Failed to send WhatsApp message: ReadTimeout",
+    "Failed to send WhatsApp message: 500 Internal Server Error",
+)
+TEMPLATE_BODIES = {
+    "sale": "Olá {client_name}! Sua compra (NF {nf_number}) de R$ {value} foi confirmada.\n"
+            "{#products}- {name} x{quantity}: R$ {price}\n{/products}",
+    "quote": "Olá {client_name}, segue sua cotação no valor de R$ {value}.\n"
+             "{#products}- {name} x{quantity}\n{/products}",
+    "payment": "Recebemos seu pagamento de R$ {value}, {client_name}. Obrigado!",
+}
+
+
+def zipf_counts(total: int, tenants: int, skew: float) -> List[int]:
+    """Split `total` rows over tenants with weight 1 / rank ** skew"""
+    weights = [1 / (rank ** skew) for rank in range(1, tenants + 1)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for i in range(total - sum(counts)):
+        counts[i % tenants] += 1
+    return counts
+
+
+def plan_for(rank: int, tenants: int) -> str:
+    share = rank / tenants
+    if share <= 0.01:
+        return "enterprise"
+    if share <= 0.10:
+        return "pro"
+    if share <= 0.60:
+        return "basic"
+    return "trial"
+
+
+def tenant_id(prefix: str, rank: int) -> str:
+    return f"{prefix}{rank:07d}"
+
+
+def tenant_rows(args, now: datetime) -> Iterator[Tuple]:
+    rng = random.Random(f"{args.seed}:tenants")
+    for rank in range(1, args.tenants + 1):
+        plan = plan_for(rank, args.tenants)
+        created_at = now - timedelta(days=args.days + rng.randrange(365), seconds=rng.randrange(86400))
+        name = f"{rng.choice(LAST_NAMES)} {rng.choice(COMPANY_SUFFIXES)} {rank}"
+        status = "suspended" if rng.random() < 0.03 else "active"
+        paying = plan != "trial"
+        yield (
+            tenant_id(args.prefix, rank), name, f"55{11 + rank % 80}9{rank:08d}", plan,
+            str(created_at + timedelta(days=7)), f"{args.prefix}key-{rank:07d}", status,
+            f"{args.prefix}{rank:07d}", str(created_at), str(now),
+            f"{args.prefix}{rank:07d}@example.com", None,
+            "connected" if rng.random() < 0.85 else "disconnected",
+            f"cus_{args.prefix}{rank:07d}" if paying else None,
+        )
+
+
+def template_rows(args, counts: Sequence[int], now: datetime) -> Iterator[Tuple]:
+    rng = random.Random(f"{args.seed}:templates")
+    for rank, count in enumerate(counts, start=1):
+        # Bigger tenants customise more of their messages
+        for n in range(min(8, int(math.log10(count + 1)) + rng.randrange(2))):
+            kind = TYPES[n % len(TYPES)]
+            created_at = now - timedelta(days=rng.randrange(args.days), seconds=rng.randrange(86400))
+            yield (
+                str(uuid.UUID(int=rng.getrandbits(128), version=4)), tenant_id(args.prefix, rank),
+                f"{kind.capitalize()} v{n // len(TYPES) + 1}", kind, TEMPLATE_BODIES[kind],
+                n < len(TYPES), str(created_at), str(created_at),
+            )
+
+
+def product_pool(seed: int, size: int = 4096) -> List[str]:
+    """Pre-rendered `products` JSON values with a long-tailed item count"""
+    rng = random.Random(f"{seed}:products")
+    pool = []
+    for _ in range(size):
+        items = min(200, int(rng.paretovariate(1.4)))
+        pool.append(json.dumps([
+            {
+                "name": rng.choice(PRODUCT_NAMES),
+                "quantity": rng.randint(1, 50),
+                "price": round(rng.lognormvariate(3.5, 1.0), 2),
+                "sku": f"SKU-{rng.randrange(10**6):06d}",
+            }
+            for _ in range(items)
+        ], ensure_ascii=False))
+    return pool
+
+
+def created_at_for(rng: random.Random, days: int, growth: float, today: date, now: datetime,
+                   hour_weights: List[float]) -> datetime:
+    while True:
+        day = today - timedelta(days=int(days * rng.random() ** growth))
+        if day.weekday() < 5 or rng.random() < WEEKEND_ACCEPT:
+            break
+    hour = rng.choices(range(24), cum_weights=hour_weights)[0]
+    created_at = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, seconds=rng.randrange(3600))
+    if created_at > now:
+        # Later today than now: move it into the part of today that already passed
+        elapsed = int((now - datetime.combine(today, datetime.min.time())).total_seconds())
+        created_at = now - timedelta(seconds=rng.randrange(elapsed + 1))
+    return created_at
+
+
+def notification_rows(unit: Dict[str, Any], products: List[str]) -> Iterator[Tuple]:
+    """Rows of one (tenant, chunk) work unit"""
+    rng = random.Random(f"{unit['seed']}:{unit['tenant_id']}:{unit['chunk']}")
+    now, today = unit["now"], unit["now"].date()
+    hour_weights = list(_cumulative(HOUR_WEIGHTS))
+    type_weights = list(_cumulative(TYPE_WEIGHTS))
+    clients = max(10, int(math.sqrt(unit["tenant_rows"]) * 5))
+    rank = unit["rank"]
+
+    for n in range(unit["first"], unit["first"] + unit["rows"]):
+        kind = rng.choices(TYPES, cum_weights=type_weights)[0]
+        created_at = created_at_for(rng, unit["days"], unit["growth"], today, now, hour_weights)
+        age = (now - created_at).total_seconds()
+        # Repeat customers: low client numbers are drawn far more often
+        client = int(clients * rng.random() ** 2)
+        client_name = f"{FIRST_NAMES[client % len(FIRST_NAMES)]} {LAST_NAMES[(client // 7) % len(LAST_NAMES)]}"
+        phone = f"55{11 + (client + rank) % 80}9{(client * 104729 + rank * 7919) % 10**8:08d}"
+        value = round(rng.lognormvariate(5.5, 1.1), 2)
+
+        roll = rng.random()
+        whatsapp_id = error_message = sent_at = next_attempt_at = claimed_at = None
+        retry_count = 0
+        if age < 3600 and roll < 0.5:
+            status = "pending" if roll < 0.4 else "sending"
+            if status == "sending":
+                # Claimed by a delivery worker moments after ingest, so the stale-claim sweep sees it
+                claimed_at = str(created_at + timedelta(seconds=min(age, rng.uniform(0.05, 2.0))))
+        elif roll < unit["failure_rate"]:
+            status = "failed"
+            error_message = rng.choice(ERROR_MESSAGES)
+            if age < 3600:
+                retry_count = 1
+                next_attempt_at = str(created_at + timedelta(seconds=20))
+            else:
+                retry_count = 3
+        elif roll < unit["failure_rate"] + 0.002:
+            # Stuck rows the retry scheduler and dashboards have to cope with
+            status = "pending"
+        else:
+            status = "sent"
+            whatsapp_id = f"{rng.getrandbits(80):020X}"
+            sent_at = str(created_at + timedelta(seconds=min(age, rng.lognormvariate(0.5, 1.0))))
+
+        yield (
+            str(uuid.UUID(int=rng.getrandbits(128), version=4)), unit["tenant_id"], kind, client_name,
+            phone, phone, value, value, f"{n + 1:09d}", status, whatsapp_id, whatsapp_id,
+            rng.choice(products) if kind != "payment" else None, error_message, retry_count,
+            str(created_at), sent_at, next_attempt_at, claimed_at, kind,
+        )
+
+
+def _cumulative(weights: Sequence[float]) -> Iterator[float]:
+    total = 0.0
+    for weight in weights:
+        total += weight
+        yield total
+
+
+class CSVStream:
+    """Read-only file object rendering rows as CSV for COPY ... FROM STDIN"""
+
+    def __init__(self, rows: Iterator[Tuple], batch: int = 5000):
+        self.rows = rows
+        self.batch = batch
+        self.buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            chunk = list(islice(self.rows, self.batch))
+            if not chunk:
+                break
+            out = io.StringIO()
+            csv.writer(out, lineterminator="\n").writerows(chunk)
+            self.buffer += out.getvalue()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def load(table: str, columns: Sequence[str], rows: Iterator[Tuple]) -> None:
+    """Bulk insert rows: COPY on PostgreSQL, executemany elsewhere"""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if engine.dialect.name == "postgresql":
+            # Losing the tail of a seeding run on a crash is fine; waiting on WAL flushes is not
+            cursor.execute("SET synchronous_commit = off")
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", CSVStream(rows), size=1 << 20
+            )
+        else:
+            statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            while True:
+                batch = list(islice(rows, 5000))
+                if not batch:
+                    break
+                cursor.executemany(statement, batch)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+_products: Optional[List[str]] = None
+
+
+def load_unit(unit: Dict[str, Any]) -> int:
+    """Worker entry point: generate and load one (tenant, chunk) unit"""
+    global _products
+    if _products is None:
+        # Fresh pool connections per process; never reuse the parent's sockets
+        engine.dispose(close=False)
+        _products = product_pool(unit["seed"])
+    load(Notification.__tablename__, NOTIFICATION_COLUMNS, notification_rows(unit, _products))
+    return unit["rows"]
+
+
+def work_units(args, counts: Sequence[int], now: datetime) -> List[Dict[str, Any]]:
+    units = []
+    for rank, count in enumerate(counts, start=1):
+        for chunk, first in enumerate(range(0, count, CHUNK_ROWS)):
+            units.append({
+                "seed": args.seed, "rank": rank, "tenant_id": tenant_id(args.prefix, rank), "chunk": chunk,
+                "first": first, "rows": min(CHUNK_ROWS, count - first), "tenant_rows": count,
+                "days": args.days, "growth": args.growth, "failure_rate": args.failure_rate, "now": now,
+            })
+    # Largest units first so the last ones to finish are small
+    units.sort(key=lambda unit: -unit["rows"])
+    return units
+
+
+def delete_previous(prefix: str) -> None:
+    with engine.begin() as conn:
+        for model in (NotificationIdempotencyKey, DailyStat, TenantNotificationStats, Template, Notification):
+            conn.execute(delete(model).where(model.tenant_id.like(f"{prefix}%")))
+        conn.execute(delete(Tenant).where(Tenant.id.like(f"{prefix}%")))
+
+
+def rebuild_tenant_stats(prefix: str, now: datetime) -> None:
+    """tenant_notification_stats for the seeded tenants as of `now`, from one grouped query"""
+    today_start = datetime.combine(now.date(), datetime.min.time())
+
+    def status_count(status: str):
+        return func.sum(case((Notification.status == status, 1), else_=0))
+
+    with engine.begin() as conn:
+        conn.execute(delete(TenantNotificationStats).where(TenantNotificationStats.tenant_id.like(f"{prefix}%")))
+        conn.execute(insert(TenantNotificationStats).from_select(
+            ["tenant_id", "total", "pending", "sending", "sent", "failed", "today_date", "today_count", "updated_at"],
+            select(
+                Notification.tenant_id,
+                func.count(),
+                status_count("pending"),
+                status_count("sending"),
+                status_count("sent"),
+                status_count("failed"),
+                literal(now.date()),
+                func.sum(case((Notification.created_at >= today_start, 1), else_=0)),
+                literal(now),
+            )
+            .where(Notification.tenant_id.like(f"{prefix}%"))
+            .group_by(Notification.tenant_id)
+        ))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=1000)
+    parser.add_argument("--notifications", type=int, default=1000000, help="total notifications over all tenants")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of notifications per tenant")
+    parser.add_argument("--days", type=int, default=365, help="spread created_at over this many days")
+    parser.add_argument("--growth", type=float, default=1.5,
+                        help="values above 1 put more rows on recent days (1 is uniform)")
+    parser.add_argument("--failure-rate", type=float, default=0.04, help="share of notifications that failed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--now", type=datetime.fromisoformat,
+                        help="reference time for created_at (default: current time); pin it for identical datasets")
+    parser.add_argument("--prefix", default="synthetic-", help="tenant id prefix identifying generated rows")
+    parser.add_argument("--jobs", type=int, default=4, help="parallel loader processes")
+    parser.add_argument("--replace", action="store_true", help="delete rows with the same --prefix first")
+    parser.add_argument("--skip-aggregates", action="store_true",
+                        help="do not rebuild tenant_notification_stats and daily_stats")
+    args = parser.parse_args()
+
+    now = (args.now or datetime.now()).replace(microsecond=0)
+    started = time.perf_counter()
+    counts = zipf_counts(args.notifications, args.tenants, args.skew)
+    print(
+        f"{args.tenants} tenants, {args.notifications} notifications; largest tenant {counts[0]} "
+        f"({counts[0] / max(1, args.notifications):.1%}), median {counts[len(counts) // 2]}"
+    )
+
+    Base.metadata.create_all(engine, checkfirst=True)
+    if args.replace:
+        print(f"Deleting earlier '{args.prefix}' rows...")
+        delete_previous(args.prefix)
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            if is_partitioned(conn):
+                created = ensure_partitions(conn, months_back=args.days // 28 + 1)
+                if created:
+                    print(f"Created partitions: {', '.join(created)}")
+
+    load(Tenant.__tablename__, TENANT_COLUMNS, tenant_rows(args, now))
+    load(Template.__tablename__, TEMPLATE_COLUMNS, template_rows(args, counts, now))
+
+    units = work_units(args, counts, now)
+    loaded = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for rows in pool.map(load_unit, units):
+            loaded += rows
+            elapsed = time.perf_counter() - started
+            print(f"\r{loaded}/{args.notifications} notifications ({loaded / elapsed:,.0f} rows/s)", end="", flush=True)
+    print()
+
+    if not args.skip_aggregates:
+        print("Rebuilding tenant_notification_stats and daily_stats...")
+        rebuild_tenant_stats(args.prefix, now)
+        compact(since=now.date() - timedelta(days=args.days))
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in (Tenant.__tablename__, Template.__tablename__, Notification.__tablename__):
+                conn.execute(text(f"ANALYZE {table}"))
+
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Per-tenant notification counters for 28Hub Connect backend.
+
+Dashboards read one tenant_notification_stats row instead of counting the
+notifications table. The ingest and delivery paths keep the row up to date
+with relative UPDATEs issued inside their own transaction, so counters commit
+atomically with the status change they describe. A missing row is rebuilt
+from a single grouped aggregate on first read.
+"""
+from datetime import date, datetime
+from typing import Dict, Optional
+
+from sqlalchemy import select, update, func, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from events import stage_counters
+from models import Notification, TenantNotificationStats
+
+# Notification statuses with a counter column
+COUNTED_STATUSES = ("pending", "sending", "sent", "failed")
+
+
+def record_created(db: Session, tenant_id: str, count: int = 1, status: str = "pending") -> None:
+    """Count newly inserted notifications (caller commits)"""
+    today = date.today()
+    values = {
+        "total": TenantNotificationStats.total + count,
+        "today_count": case(
+            (TenantNotificationStats.today_date == today, TenantNotificationStats.today_count + count),
+            else_=count
+        ),
+        "today_date": today,
+        "updated_at": datetime.now(),
+    }
+    if status in COUNTED_STATUSES:
+        values[status] = getattr(TenantNotificationStats, status) + count
+
+    db.execute(
+        update(TenantNotificationStats)
+        .where(TenantNotificationStats.tenant_id == tenant_id)
+        .values(**values)
+    )
+    stage_counters(db, tenant_id, {"total": count, "today": count, status: count})
+
+
+def record_transition(
+    db: Session,
+    tenant_id: str,
+    old_status: Optional[str],
+    new_status: str,
+    count: int = 1
+) -> None:
+    """Move `count` notifications between status counters (caller commits)"""
+    if old_status == new_status or count <= 0:
+        return
+
+    values = {"updated_at": datetime.now()}
+    deltas = {}
+    if old_status in COUNTED_STATUSES:
+        values[old_status] = getattr(TenantNotificationStats, old_status) - count
+        deltas[old_status] = -count
+    if new_status in COUNTED_STATUSES:
+        values[new_status] = getattr(TenantNotificationStats, new_status) + count
+        deltas[new_status] = count
+
+    db.execute(
+        update(TenantNotificationStats)
+        .where(TenantNotificationStats.tenant_id == tenant_id)
+        .values(**values)
+    )
+    stage_counters(db, tenant_id, deltas)
+
+
+def aggregate_tenant_stats(db: Session, tenant_id: str) -> Dict[str, int]:
+    """Compute all counters from notifications with one grouped query"""
+    today_start = datetime.combine(date.today(), datetime.min.time())
+    rows = db.execute(
+        select(
+            Notification.status,
+            func.count(Notification.id),
+            func.sum(case((Notification.created_at >= today_start, 1), else_=0))
+        )
+        .where(Notification.tenant_id == tenant_id)
+        .group_by(Notification.status)
+    ).all()
+
+    result = {status: 0 for status in COUNTED_STATUSES}
+    result["total"] = 0
+    result["today"] = 0
+    for status, count, today_count in rows:
+        if status in COUNTED_STATUSES:
+            result[status] = count
+        result["total"] += count
+        result["today"] += today_count or 0
+    return result
+
+
+def rebuild_tenant_stats(db: Session, tenant_id: str) -> TenantNotificationStats:
+    """Recompute a tenant's counter row from the notifications table and commit it"""
+    counts = aggregate_tenant_stats(db, tenant_id)
+    values = {status: counts[status] for status in COUNTED_STATUSES}
+    values.update(
+        total=counts["total"],
+        today_date=date.today(),
+        today_count=counts["today"],
+    )
+
+    stats = db.get(TenantNotificationStats, tenant_id)
+    if stats is None:
+        stats = TenantNotificationStats(tenant_id=tenant_id, **values)
+        db.add(stats)
+    else:
+        for key, value in values.items():
+            setattr(stats, key, value)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request created the row first; use theirs
+        db.rollback()
+        stats = db.get(TenantNotificationStats, tenant_id)
+    return stats
+
+
+def get_tenant_stats(db: Session, tenant_id: str) -> Dict[str, int]:
+    """Dashboard counters for a tenant from its counter row"""
+    stats = db.get(TenantNotificationStats, tenant_id)
+    if stats is None:
+        stats = rebuild_tenant_stats(db, tenant_id)
+
+    return {
+        "total": stats.total,
+        "pending": stats.pending,
+        "sending": stats.sending,
+        "sent": stats.sent,
+        "failed": stats.failed,
+        "today": stats.today_count if stats.today_date == date.today() else 0,
+    }
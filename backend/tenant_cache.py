@@ -0,0 +1,179 @@
+"""
+Tenant authentication cache for 28Hub Connect backend.
+
+verify_tenant runs on every authenticated request, so successful lookups are
+kept in a bounded LRU+TTL cache keyed by (tenant_id, api_key). Entries hold a
+small frozen snapshot of the tenant, never the ORM object.
+
+Handlers that change a tenant call invalidate_tenant(). With REDIS_URL set the
+invalidation is also published so every worker process drops its copy; the
+publish runs as a task on the app's event loop, so neither sync handlers in
+the threadpool nor async handlers wait on Redis.
+"""
+import asyncio
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+
+from models import Tenant
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "10000"))
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "60"))
+TENANT_CACHE_CHANNEL = os.getenv("TENANT_CACHE_CHANNEL", "28hub:tenant-cache:invalidate")
+
+
+@dataclass(frozen=True)
+class TenantSnapshot:
+    """Read-only view of the tenant fields request handlers need"""
+    id: str
+    name: str
+    plan: str
+    status: str
+    wa_instance_name: Optional[str]
+    wa_status: Optional[str]
+    trial_ends: Optional[datetime]
+
+    @classmethod
+    def from_tenant(cls, tenant: Tenant) -> "TenantSnapshot":
+        return cls(
+            id=tenant.id,
+            name=tenant.name,
+            plan=tenant.plan,
+            status=tenant.status,
+            wa_instance_name=tenant.wa_instance_name,
+            wa_status=tenant.wa_status,
+            trial_ends=tenant.trial_ends
+        )
+
+
+class TenantAuthCache:
+    """Bounded LRU cache with per-entry TTL, safe to use from the threadpool"""
+
+    def __init__(self, maxsize: int = TENANT_CACHE_SIZE, ttl: float = TENANT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, TenantSnapshot]]" = OrderedDict()
+        self.keys_by_tenant: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: str, api_key: str) -> Optional[TenantSnapshot]:
+        key = (tenant_id, api_key)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, api_key: str, snapshot: TenantSnapshot) -> None:
+        key = (snapshot.id, api_key)
+        with self._lock:
+            self.entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self.entries.move_to_end(key)
+            self.keys_by_tenant.setdefault(snapshot.id, set()).add(api_key)
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, tenant_id: str) -> None:
+        with self._lock:
+            for api_key in list(self.keys_by_tenant.get(tenant_id, ())):
+                self._remove((tenant_id, api_key))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.keys_by_tenant.clear()
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        self.entries.pop(key, None)
+        api_keys = self.keys_by_tenant.get(key[0])
+        if api_keys is not None:
+            api_keys.discard(key[1])
+            if not api_keys:
+                del self.keys_by_tenant[key[0]]
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+tenant_cache = TenantAuthCache()
+
+_publisher = aioredis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+# Event loop running listen_for_invalidations; publishes are scheduled on it
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_publishing: Set[asyncio.Task] = set()
+
+
+async def _publish(tenant_id: str) -> None:
+    try:
+        await _publisher.publish(TENANT_CACHE_CHANNEL, tenant_id)
+    except Exception as e:
+        logger.error(f"Failed to publish tenant cache invalidation for {tenant_id}: {str(e)}")
+
+
+def _start_publish(tenant_id: str) -> None:
+    task = asyncio.create_task(_publish(tenant_id))
+    _publishing.add(task)
+    task.add_done_callback(_publishing.discard)
+
+
+def invalidate_tenant(tenant_id: str) -> None:
+    """
+    Drop a tenant from this process's cache and tell the other workers.
+    Safe to call from the event loop or a threadpool handler; never waits on Redis.
+    """
+    tenant_cache.invalidate(tenant_id)
+    if _publisher is None or _loop is None:
+        return
+    try:
+        _loop.call_soon_threadsafe(_start_publish, tenant_id)
+    except RuntimeError:
+        # Loop closed during shutdown
+        pass
+
+
+async def listen_for_invalidations() -> None:
+    """
+    Apply invalidations published by other workers. Runs for the app's life;
+    the whole cache is cleared after a reconnect since messages may have been missed.
+    """
+    global _loop
+    if not REDIS_URL:
+        return
+    _loop = asyncio.get_running_loop()
+    client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    try:
+        while True:
+            try:
+                pubsub = client.pubsub()
+                await pubsub.subscribe(TENANT_CACHE_CHANNEL)
+                tenant_cache.clear()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        tenant_cache.invalidate(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Tenant cache invalidation listener error: {str(e)}")
+                await asyncio.sleep(1.0)
+    finally:
+        _loop = None
+        await asyncio.gather(*_publishing, return_exceptions=True)
+        await client.aclose()
+        await _publisher.aclose()